@@ -0,0 +1,83 @@
+import numpy as np
+
+
+def gains_and_losses(fluxes):
+    """
+    Splits the signed fluxes of a balance into the total gain and the total loss of each element.
+
+    :param fluxes: sequence of arrays of signed fluxes (positive when entering the element)
+    :return: the arrays of total gains and of total losses (both positive)
+    """
+    gains = sum(np.maximum(flux, 0.) for flux in fluxes)
+    losses = sum(np.maximum(-flux, 0.) for flux in fluxes)
+    return gains, losses
+
+
+def semi_implicit_balance(concentration, mass, time_step, fluxes, tolerance=0.05, return_relaxed=False):
+    """
+    Updates the concentrations of a set of elements over a time step, considering that the gains are constant and
+    that the losses are proportional to the concentration, as in first-order kinetics. The resulting linear
+    equation dC/dt = gains/mass - loss_rate * C is integrated exactly, so that concentrations remain positive whatever
+    the length of the time step.
+    The explicit update is kept for the elements where it is positive and departs from the semi-implicit one by less
+    than a relative tolerance. Where the semi-implicit update is used, the losses are lower than requested, and the
+    loss fluxes must be reduced accordingly with reduced_losses to conserve mass.
+
+    :param concentration: the array of concentrations at the beginning of the time step (mol g-1)
+    :param mass: the array of masses of the elements (g)
+    :param time_step: the time step (s)
+    :param fluxes: sequence of arrays of signed fluxes of the balance (mol s-1, positive when entering the element)
+    :param tolerance: the relative difference between the explicit and semi-implicit updates above which the
+    semi-implicit update is used
+    :param return_relaxed: if True, the boolean array of the elements where the semi-implicit update is used is also
+    returned
+    :return: the array of concentrations at the end of the time step (mol g-1)
+    """
+    gains, losses = gains_and_losses(fluxes)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        explicit = concentration + (time_step / mass) * sum(fluxes)
+        # The rate of loss (s-1) is defined from the current concentration:
+        loss_rate = losses / (mass * concentration)
+        x = loss_rate * time_step
+        # C(t) = C0 exp(-x) + gains / mass * time_step * (1 - exp(-x)) / x, with a series expansion for small x:
+        relaxation = np.where(x > 1e-8, -np.expm1(-x) / x, 1. - x / 2.)
+        semi_implicit = concentration * np.exp(-x) + (gains / mass) * time_step * relaxation
+        relative_difference = np.abs(semi_implicit - explicit) / np.maximum(np.abs(semi_implicit), 1e-30)
+    usable = (concentration > 0.) & (mass > 0.) & (losses > 0.) & np.isfinite(semi_implicit)
+    relaxed = usable & ((explicit < 0.) | (relative_difference > tolerance))
+    balance = np.where(relaxed, semi_implicit, explicit)
+    if return_relaxed:
+        return balance, relaxed
+    return balance
+
+
+def reduced_losses(concentration, balance, mass, time_step, fluxes, reducible, relaxed):
+    """
+    Makes the fluxes of a balance consistent with the concentrations obtained by the semi-implicit update, so that
+    the amounts that have not been lost by the elements are not counted as received by other compartments.
+    In the elements where the semi-implicit update is used, the losses that can be reduced (e.g. exudation) are
+    multiplied by the ratio between the realized loss and the requested one, while the other losses (e.g. consumption
+    by growth, which has already been used to build structural mass) are kept. If these other losses exceed the
+    realized loss, they are applied in full as in the explicit update, possibly leading to a negative concentration.
+    The concentrations are then computed again from the reduced fluxes, so that the balance is exactly conserved.
+
+    :param concentration: the array of concentrations at the beginning of the time step (mol g-1)
+    :param balance: the array of concentrations given by semi_implicit_balance (mol g-1)
+    :param mass: the array of masses of the elements (g)
+    :param time_step: the time step (s)
+    :param fluxes: sequence of arrays of signed fluxes of the balance (mol s-1, positive when entering the element)
+    :param reducible: sequence of booleans telling for each flux whether its losses can be reduced
+    :param relaxed: the boolean array of the elements where the semi-implicit update is used
+    :return: the array of concentrations at the end of the time step (mol g-1), and the array of the factors to be
+    applied to the losses that can be reduced (1 where the explicit update is used)
+    """
+    gains, _ = gains_and_losses(fluxes)
+    reducible_losses = sum(np.maximum(-flux, 0.) for flux, can_be_reduced in zip(fluxes, reducible) if can_be_reduced)
+    kept_losses = sum(np.maximum(-flux, 0.) for flux, can_be_reduced in zip(fluxes, reducible) if not can_be_reduced)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        realized_losses = gains - mass * (balance - concentration) / time_step
+        factor = np.clip((realized_losses - kept_losses) / reducible_losses, 0., 1.)
+    factor = np.where(relaxed & (reducible_losses > 0.) & np.isfinite(factor), factor, 1.)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        conserved_balance = concentration + (time_step / mass) * (gains - kept_losses - factor * reducible_losses)
+    return np.where(relaxed, conserved_balance, balance), factor
@@ -0,0 +1,169 @@
+from dataclasses import fields
+from itertools import repeat
+
+import numpy as np
+
+
+def gather(values: dict, vertices, default=0.):
+    """
+    Gathers the values of a MTG property dictionary for a sequence of vertices into a numpy array.
+
+    :param values: the property dictionary (vid -> value)
+    :param vertices: the sequence of vertices to consider
+    :param default: the value used for vertices that are absent from the dictionary
+    :return: a float array aligned on vertices
+    """
+    return np.fromiter(map(values.get, vertices, repeat(default)), dtype=float, count=len(vertices))
+
+
+def scatter(values: dict, vertices, array):
+    """
+    Writes back an array aligned on a sequence of vertices into a MTG property dictionary, in a single update.
+
+    :param values: the property dictionary (vid -> value) to update in place
+    :param vertices: the sequence of vertices to consider
+    :param array: the values to write, aligned on vertices
+    """
+    values.update(zip(vertices, np.asarray(array).tolist()))
+
+
+def clamp(values: dict, vertices, minimum=0., array=None):
+    """
+    Raises to a minimal value (e.g. 0 for concentrations) the values of a MTG property dictionary for a sequence of
+    vertices. When the array of these values is still at hand (e.g. the array just written by a balance), it is
+    clamped in place with np.maximum instead of reading the dictionary again. In both cases, only the vertices whose
+    value is below the minimum are written back to the dictionary.
+
+    :param values: the property dictionary (vid -> value) to update in place
+    :param vertices: the sequence of vertices to consider
+    :param minimum: the minimal value
+    :param array: the float array of the current values of the vertices, aligned on vertices and clamped in place
+    (None to gather them from the dictionary)
+    :return: the list of the vertices whose value has been clamped
+    """
+    if array is None:
+        array = gather(values, vertices)
+    below = np.flatnonzero(array < minimum)
+    np.maximum(array, minimum, out=array)
+    clamped = [vertices[position] for position in below.tolist()]
+    values.update(dict.fromkeys(clamped, minimum))
+    return clamped
+
+
+class ScatterAdd:
+    """
+    Buffers of (target, amount) increments of MTG properties, which are accumulated while covering the elements and
+    then added to the property dictionaries with a single bincount per property.
+    """
+
+    def __init__(self, names):
+        """
+        :param names: the names of the properties to be incremented
+        """
+        self.targets = {name: [] for name in names}
+        self.amounts = {name: [] for name in names}
+
+    def add(self, name: str, target: int, amount: float):
+        """
+        Records the increment of a property of one element.
+
+        :param name: the name of the property
+        :param target: the index of the element
+        :param amount: the increment
+        """
+        self.targets[name].append(target)
+        self.amounts[name].append(amount)
+
+    def extend(self, name: str, targets, amounts):
+        """
+        Records the increments of a property of several elements.
+
+        :param name: the name of the property
+        :param targets: the indices of the elements
+        :param amounts: the increments, aligned on targets
+        """
+        self.targets[name].extend(np.asarray(targets).tolist())
+        self.amounts[name].extend(np.asarray(amounts).tolist())
+
+    def merge(self, other):
+        """
+        Records after its own increments all the increments of another buffer.
+
+        :param other: the other ScatterAdd
+        """
+        for name in other.targets:
+            self.extend(name, other.targets[name], other.amounts[name])
+
+    def apply(self, properties: dict):
+        """
+        Adds all the increments recorded to the property dictionaries, the increments of the same element being
+        summed first.
+
+        :param properties: the MTG property dictionaries (name -> {vid: value}), updated in place
+        """
+        for name, targets in self.targets.items():
+            if not targets:
+                continue
+            targets = np.asarray(targets, dtype=int)
+            sums = np.bincount(targets, weights=np.asarray(self.amounts[name], dtype=float))
+            elements = np.unique(targets)
+            values = properties.setdefault(name, {})
+            scatter(values, elements.tolist(), gather(values, elements.tolist()) + sums[elements])
+
+
+def dilute_intensive_variables(model, vertices):
+    """
+    Updates the intensive state variables of a model (e.g. concentrations per unit of structural mass) of the elements
+    whose structural mass has changed during growth, the corresponding amounts being spread over the new structural
+    mass. Elements for which a variable is not defined yet (e.g. new elements to be extended) are left unchanged.
+
+    :param model: the model whose state variables, linked to the MTG property dictionaries, are updated
+    :param vertices: the sequence of vertices to consider
+    """
+    struct_mass = gather(model.g.property("struct_mass"), vertices)
+    initial_struct_mass = gather(model.g.property("initial_struct_mass"), vertices)
+    grown = np.flatnonzero((struct_mass != initial_struct_mass) & (struct_mass > 0.))
+    if len(grown) == 0:
+        return
+    dilution = dict(zip((vertices[position] for position in grown.tolist()),
+                        (initial_struct_mass[grown] / struct_mass[grown]).tolist()))
+    for variable in fields(model):
+        if variable.metadata.get("variable_type") != "state_variable":
+            continue
+        if not variable.metadata.get("state_variable_type", "").lower().endswith("intensive"):
+            continue
+        values = getattr(model, variable.name)
+        if not isinstance(values, dict):
+            continue
+        elements = [vid for vid in dilution if vid in values]
+        scatter(values, elements, gather(values, elements) * gather(dilution, elements))
+
+
+def extend_properties(model, new_elements: dict):
+    """
+    Extends the state variables of a model to the elements created during a time step. Intensive variables take
+    the value of the parent element, while extensive variables are partitioned between the parent and the new element
+    according to their structural mass. Values already defined for a new element are left unchanged.
+
+    :param model: the model whose state variables, linked to the MTG property dictionaries, are extended
+    :param new_elements: mapping of the elements created during the time step to their parent, in order of creation
+    """
+    struct_mass = model.g.property("struct_mass")
+    for variable in fields(model):
+        if variable.metadata.get("variable_type") != "state_variable":
+            continue
+        values = getattr(model, variable.name)
+        if not isinstance(values, dict):
+            continue
+        state_variable_type = variable.metadata.get("state_variable_type", "").lower()
+        for vid, parent in new_elements.items():
+            if vid in values or parent not in values:
+                continue
+            # All concentrations do not need to be partitioned:
+            if state_variable_type.endswith("intensive"):
+                values[vid] = values[parent]
+            # Extensive variables are partitioned accounting for mass fraction:
+            elif state_variable_type.endswith("extensive"):
+                mass_fraction = struct_mass[vid] / (struct_mass[vid] + struct_mass[parent])
+                values[vid] = values[parent] * mass_fraction
+                values[parent] = values[parent] * (1 - mass_fraction)
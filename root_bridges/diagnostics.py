@@ -0,0 +1,89 @@
+import logging
+
+
+# Default number of element indices kept in memory for each kind of anomaly:
+RECORDED_ELEMENTS_PER_KIND = 10
+
+# Logger used by default to write the summaries of the anomalies:
+logger = logging.getLogger(__name__)
+
+
+class Diagnostics:
+    """
+    Collector of the anomalies met while covering the elements of the MTG (e.g. negative growth demands).
+    Instead of printing a message for each element, the collector counts the anomalies of each kind and records the
+    first indices of the elements concerned, together with the details of the first occurrence.
+    A single summary is then written once per time step, and nothing is written when no anomaly has been met.
+    """
+
+    def __init__(self, write=logger.warning, recorded_elements_per_kind=RECORDED_ELEMENTS_PER_KIND):
+        """
+        :param write: the function used to write the summary of a time step (by default, the warning method of the
+        logger of this module, or that of the logger given by the simulation, see Model.set_diagnostics_logger), None
+        to only keep the anomalies in memory
+        :param recorded_elements_per_kind: maximal number of element indices recorded for each kind of anomaly
+        """
+        self.write = write
+        self.recorded_elements_per_kind = recorded_elements_per_kind
+        self.counts = {}
+        self.elements = {}
+        self.first_details = {}
+
+    def record(self, kind: str, vid=None, **details):
+        """
+        Records one occurrence of an anomaly.
+        :param kind: the message describing the kind of anomaly
+        :param vid: the index of the element concerned, if any
+        :param details: the values describing the anomaly, which are only kept for its first occurrence
+        """
+        if kind not in self.counts:
+            self.counts[kind] = 0
+            self.elements[kind] = []
+            self.first_details[kind] = details
+        self.counts[kind] += 1
+        if vid is not None and len(self.elements[kind]) < self.recorded_elements_per_kind:
+            self.elements[kind].append(vid)
+
+    def merge(self, other):
+        """
+        Adds the anomalies recorded by another collector (e.g. in a worker process) to the ones recorded so far.
+        :param other: the other Diagnostics
+        """
+        for kind, count in other.counts.items():
+            if kind not in self.counts:
+                self.counts[kind] = 0
+                self.elements[kind] = []
+                self.first_details[kind] = other.first_details[kind]
+            self.counts[kind] += count
+            free_places = self.recorded_elements_per_kind - len(self.elements[kind])
+            self.elements[kind].extend(other.elements[kind][:max(free_places, 0)])
+
+    def summary(self, header=""):
+        """
+        Composes the summary of the anomalies recorded so far.
+        :param header: the text written before the summary (e.g. the name of the model and the time step)
+        :return: the summary, or an empty string if no anomaly has been recorded
+        """
+        if not self.counts:
+            return ""
+        lines = [f"{header}{sum(self.counts.values())} anomalies of {len(self.counts)} kinds:"]
+        for kind, count in self.counts.items():
+            line = f"  - {kind}: {count} occurrence(s)"
+            if self.elements[kind]:
+                line += f", elements {self.elements[kind]}{' ...' if count > len(self.elements[kind]) else ''}"
+            if self.first_details[kind]:
+                line += ", first with " + ", ".join(f"{name}={value}" for name, value in self.first_details[kind].items())
+            lines.append(line)
+        return "\n".join(lines)
+
+    def flush(self, header=""):
+        """
+        Writes the summary of the anomalies recorded so far, if any, and starts a new collection.
+        :param header: the text written before the summary
+        """
+        if self.counts:
+            if self.write is not None:
+                self.write(self.summary(header=header))
+            self.counts = {}
+            self.elements = {}
+            self.first_details = {}
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+# Numba is an optional dependency: when it is not installed, the kernels are simply run by the Python interpreter.
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    njit = None
+    NUMBA_AVAILABLE = False
+
+
+# The numeric cores of the growth model are written with numpy operations only, so that they can be called on single
+# values as well as on flat arrays of properties exported from the MTG, and compiled as they are by Numba.
+
+def elongation_limitation(C_hexose_root, AA, Km_elongation, Km_elongation_amino_acids):
+    """
+    Computes the limitation of elongation by the local concentrations of hexose and amino acids, as the mean of two
+    Michaelis-Menten functions.
+    :param C_hexose_root: the concentration of hexose (mol of hexose per g of struct_mass)
+    :param AA: the concentration of amino acids (mol of amino acids per g of struct_mass)
+    :param Km_elongation: the affinity constant for elongation regarding hexose (mol of hexose per g of struct_mass)
+    :param Km_elongation_amino_acids: the affinity constant for elongation regarding amino acids (mol of amino acids per g)
+    :return: the limitation coefficient (adim)
+    """
+    return ((C_hexose_root / (C_hexose_root + Km_elongation)) + (AA / (AA + Km_elongation_amino_acids))) / 2
+
+
+def possible_increase_in_volume(hexose, amino_acids, root_tissue_density, struct_mass_C_content,
+                                struct_mass_N_content, yield_growth, yield_growth_N, r_C_AA, r_Nm_AA):
+    """
+    Computes the increase in volume that elements may achieve by elongation or by thickening, using the hexose and
+    amino acids available for this growth, according to the most limiting factor between C and N.
+    :param hexose: the array of amounts of hexose available for growth (mol of hexose)
+    :param amino_acids: the array of amounts of amino acids available for growth (mol of amino acids)
+    :param root_tissue_density: the array of dry structural masses per volume (g m-3)
+    :return: the array of possible increases in volume (m3)
+    """
+    increase_C = hexose * 6. * yield_growth / (root_tissue_density * struct_mass_C_content) \
+                 + amino_acids * r_C_AA * yield_growth / (root_tissue_density * struct_mass_C_content)
+    increase_N = amino_acids * r_Nm_AA * yield_growth_N / (root_tissue_density * struct_mass_N_content)
+    return np.minimum(increase_C, increase_N)
+
+
+def root_hairs_length(root_hair_length, root_hair_max_length, root_hairs_elongation_rate, root_hair_radius,
+                      fraction_with_hairs, cn_limitation, elapsed_thermal_time):
+    """
+    Computes the new average length of root hairs on a set of elements, bounded by their maximal length.
+    :param root_hair_length: the array of average root hair lengths before growth (m)
+    :param fraction_with_hairs: the array of the fractions of the elements length bearing root hairs (adim)
+    :param cn_limitation: the array of limitations of elongation by hexose and amino acids (adim)
+    :param elapsed_thermal_time: the array of thermal times elapsed during the time step (s)
+    :return: the array of new root hair lengths (m)
+    """
+    new_length = root_hair_length + root_hairs_elongation_rate * root_hair_radius * fraction_with_hairs \
+                 * cn_limitation * elapsed_thermal_time
+    return np.where(root_hair_length < root_hair_max_length, np.minimum(new_length, root_hair_max_length),
+                    root_hair_length)
+
+
+KERNELS = (elongation_limitation, possible_increase_in_volume, root_hairs_length)
+
+_compiled_kernels = None
+
+
+def growth_kernels(compiled=False):
+    """
+    Provides the numeric cores of the growth model, compiled by Numba if required and possible, or run by the Python
+    interpreter otherwise. Compiled kernels are created only once, and compiled for each type of argument on first call.
+    :param compiled: if True, the kernels are compiled when Numba is installed
+    :return: a namespace giving access to the kernels by their names
+    """
+    global _compiled_kernels
+    if compiled and NUMBA_AVAILABLE:
+        if _compiled_kernels is None:
+            _compiled_kernels = SimpleNamespace(**{kernel.__name__: njit(cache=True)(kernel) for kernel in KERNELS})
+        return _compiled_kernels
+    return SimpleNamespace(**{kernel.__name__: kernel for kernel in KERNELS})
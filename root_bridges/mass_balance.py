@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class MassBalanceAuditor:
+    """
+    Auditor of the conservation of C and N in the balances of the root elements.
+
+    When a time step is audited, the balances record for each element the amount present before the update and the
+    net amount brought by all the fluxes of the balance. Once the balances and their thresholds have been applied,
+    the amounts present after the update are compared with these expected amounts, element by element and with array
+    operations only. The conservation error then reveals the matter created or lost by the numerical treatments
+    (e.g. negative concentrations set to 0).
+
+    The audit can be performed every N time steps, on a random sample of time steps, or both.
+    """
+
+    def __init__(self, period=0, probability=0., seed=0, write=print):
+        """
+        :param period: the number of time steps between two audits (0 to never audit periodically, 1 for every step)
+        :param probability: the probability of auditing any time step (0 to never audit randomly)
+        :param seed: the seed of the generator used for sampling time steps
+        :param write: the function used to write the report of an audit (None to only keep the reports)
+        """
+        self.period = period
+        self.probability = probability
+        self.generator = np.random.default_rng(seed)
+        self.write = write
+        self.step = 0
+        self.active = False
+        self.records = {}
+        self.reports = []
+
+    def start_step(self):
+        """
+        Starts a new time step, and decides whether it is audited.
+        """
+        self.step += 1
+        self.records = {}
+        periodic = self.period > 0 and self.step % self.period == 0
+        sampled = self.probability > 0. and self.generator.random() < self.probability
+        self.active = periodic or sampled
+
+    def record(self, element: str, vids, amounts_before, net_fluxes):
+        """
+        Records, for an audited time step, the amounts of an element before the balance and the net amounts brought
+        by the fluxes of the balance.
+
+        :param element: the chemical element concerned (e.g. "C" or "N")
+        :param vids: the indices of the root elements, aligned with the arrays
+        :param amounts_before: the array of amounts before the balance (mol of C or N)
+        :param net_fluxes: the array of net amounts brought by the fluxes during the time step (mol of C or N)
+        """
+        if not self.active:
+            return
+        if element in self.records:
+            previous_vids, previous_before, previous_fluxes = self.records[element]
+            vids = list(previous_vids) + list(vids)
+            amounts_before = np.concatenate((previous_before, amounts_before))
+            net_fluxes = np.concatenate((previous_fluxes, net_fluxes))
+        self.records[element] = (list(vids), np.asarray(amounts_before, dtype=float), np.asarray(net_fluxes, dtype=float))
+
+    def check(self, element: str, amounts_after):
+        """
+        Compares the amounts of an element after the balance with the expected amounts, and reports the conservation
+        error.
+
+        :param element: the chemical element concerned
+        :param amounts_after: function giving the array of amounts after the balance for a list of root elements
+        :return: the report of the audit, or None if the time step is not audited
+        """
+        if not self.active or element not in self.records:
+            return None
+        vids, amounts_before, net_fluxes = self.records.pop(element)
+        errors = amounts_after(vids) - (amounts_before + net_fluxes)
+        total_amount = float(np.abs(amounts_before).sum())
+        report = dict(step=self.step, element=element,
+                      conservation_error=float(errors.sum()),
+                      absolute_error=float(np.abs(errors).sum()),
+                      relative_error=float(np.abs(errors).sum()) / total_amount if total_amount > 0. else 0.,
+                      worst_element=vids[int(np.argmax(np.abs(errors)))] if len(vids) > 0 else None)
+        self.reports.append(report)
+        if self.write is not None:
+            self.write(f"[mass balance, time step {report['step']}] {element}: conservation error of "
+                       f"{report['conservation_error']:.3e} mol (absolute {report['absolute_error']:.3e} mol, "
+                       f"relative {report['relative_error']:.3e}), worst element {report['worst_element']}")
+        return report
@@ -0,0 +1,60 @@
+import numpy as np
+
+
+# Constants of the Philox4x32-10 counter-based generator (Salmon et al. 2011):
+PHILOX_M0 = np.uint64(0xD2511F53)
+PHILOX_M1 = np.uint64(0xCD9E8D57)
+PHILOX_W0 = np.uint64(0x9E3779B9)
+PHILOX_W1 = np.uint64(0xBB67AE85)
+PHILOX_ROUNDS = 10
+MASK_32 = np.uint64(0xFFFFFFFF)
+
+
+def philox4x32(counters, key):
+    """
+    Computes the Philox4x32-10 blocks of a batch of counters with a single key. Each block only depends on its counter
+    and on the key, so that the random values attributed to an element do not depend on the other elements or on the
+    order in which they are considered.
+    :param counters: array of shape (n, 4) of 32-bit words
+    :param key: sequence of two 32-bit words
+    :return: array of shape (n, 4) of random 32-bit words (stored as uint64)
+    """
+    counters = np.asarray(counters, dtype=np.uint64) & MASK_32
+    x0, x1, x2, x3 = (counters[:, i].copy() for i in range(4))
+    k0, k1 = (np.uint64(int(word) & 0xFFFFFFFF) for word in key)
+    for round_number in range(PHILOX_ROUNDS):
+        # The products of two 32-bit words fit in 64 bits, and are split into their high and low halves:
+        product_0 = PHILOX_M0 * x0
+        product_1 = PHILOX_M1 * x2
+        x0, x1, x2, x3 = ((product_1 >> np.uint64(32)) ^ x1 ^ k0, product_1 & MASK_32,
+                          (product_0 >> np.uint64(32)) ^ x3 ^ k1, product_0 & MASK_32)
+        # The key is bumped between rounds:
+        if round_number < PHILOX_ROUNDS - 1:
+            k0 = (k0 + PHILOX_W0) & MASK_32
+            k1 = (k1 + PHILOX_W1) & MASK_32
+    return np.stack((x0, x1, x2, x3), axis=1)
+
+
+def standard_normal_draws(seed: int, identifiers, step: int):
+    """
+    Draws four independent values from a standard normal distribution for each identifier (e.g. the index of an apex),
+    using a Philox stream keyed by the seed and whose counter is made of the identifier and the time step.
+    The four 32-bit words of each block are turned into uniform values in ]0, 1[, and then into normal values with the
+    Box-Muller transform.
+    :param seed: the seed of the simulation (e.g. random_choice)
+    :param identifiers: the indices of the elements for which values are drawn
+    :param step: the number of the time step
+    :return: array of shape (n, 4) of normal values
+    """
+    identifiers = np.asarray(identifiers, dtype=np.uint64).reshape(-1)
+    counters = np.zeros((len(identifiers), 4), dtype=np.uint64)
+    counters[:, 0] = identifiers & MASK_32
+    counters[:, 1] = identifiers >> np.uint64(32)
+    counters[:, 2] = np.uint64(int(step) & 0xFFFFFFFF)
+    seed = int(seed) & 0xFFFFFFFFFFFFFFFF
+    blocks = philox4x32(counters, key=(seed & 0xFFFFFFFF, seed >> 32))
+    uniforms = (blocks.astype(float) + 0.5) / 2. ** 32
+    radii = np.sqrt(-2. * np.log(uniforms[:, [0, 2]]))
+    angles = 2. * np.pi * uniforms[:, [1, 3]]
+    return np.column_stack((radii[:, 0] * np.cos(angles[:, 0]), radii[:, 0] * np.sin(angles[:, 0]),
+                            radii[:, 1] * np.cos(angles[:, 1]), radii[:, 1] * np.sin(angles[:, 1])))
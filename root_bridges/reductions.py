@@ -0,0 +1,55 @@
+from inspect import signature
+
+import numpy as np
+
+
+def total(values: dict):
+    """
+    Sums the values of a MTG property dictionary in a single array reduction, without copying them into a list.
+
+    :param values: the property dictionary (vid -> value)
+    :return: the sum of the values
+    """
+    return float(np.fromiter(values.values(), dtype=float, count=len(values)).sum())
+
+
+class PlantScaleReductions:
+    """
+    Service computing plant-scale properties from the totals of element-scale properties over all root elements.
+    Models register the function computing each plant-scale property, whose arguments are named after the
+    element-scale properties whose totals it needs, and all registered properties are then computed at once, each
+    total being computed only once even if it is needed by several properties.
+    """
+
+    def __init__(self, props: dict):
+        """
+        :param props: the MTG property dictionaries (name -> {vid: value})
+        """
+        self.props = props
+        self.registered = {}
+
+    def register(self, name: str, function):
+        """
+        Registers a plant-scale property.
+
+        :param name: the name of the plant-scale property
+        :param function: the function computing the property, e.g. a method of the model, which receives the totals of
+        the element-scale properties named by its arguments
+        """
+        self.registered[name] = (function, tuple(signature(function).parameters))
+
+    def compute(self):
+        """
+        Computes all the registered plant-scale properties from the current values of the element-scale properties.
+        A KeyError is raised if one of these element-scale properties doesn't exist.
+
+        :return: a dictionary giving the value of each registered plant-scale property
+        """
+        totals = {}
+        values = {}
+        for name, (function, arguments) in self.registered.items():
+            for argument in arguments:
+                if argument not in totals:
+                    totals[argument] = total(self.props[argument])
+            values[name] = function(*(totals[argument] for argument in arguments))
+        return values
@@ -1,13 +1,27 @@
 from dataclasses import dataclass
+import numpy as np
 from metafspm.component_factory import *
 from metafspm.component import declare
 
 from rhizodep.root_carbon import RootCarbonModel
 from root_cynaps.root_nitrogen import RootNitrogenModel
 
+from root_bridges.columns import gather, scatter, clamp, dilute_intensive_variables, extend_properties
+from root_bridges.reductions import PlantScaleReductions
+from root_bridges.mass_balance import MassBalanceAuditor
+from root_bridges.balance_integration import semi_implicit_balance, reduced_losses
+
 
 family = "metabolic"
 
+# Properties of the fluxes of the hexose and amino acids balances whose losses can be reduced where the balance is
+# integrated with the semi-implicit method, aligned on the fluxes of each balance. These are the losses to the soil and
+# the respiration, while the other fluxes (None) are also used by other balances or have already been used to build
+# structural mass, and are thus kept:
+HEXOSE_REDUCIBLE_LOSSES = ("hexose_exudation", None, "mucilage_secretion", "cells_release", "maintenance_respiration",
+                           None, None, None, None, None, None, None, None, None, "N_metabolic_respiration")
+AA_REDUCIBLE_LOSSES = (None, None, "diffusion_AA_soil", None, None, None, None, None, None, None)
+
 
 @dataclass
 class RootCNUnified(RootCarbonModel, RootNitrogenModel):
@@ -42,6 +56,18 @@ class RootCNUnified(RootCarbonModel, RootNitrogenModel):
     respi_costs_mineralN_reduction: float = declare(default=1.98, unit="adim", unit_comment="mol of C per mol of N", description="Respiratory of active imports in root.", 
                                 min_value="", max_value="", value_comment="", references="Robinson 2001; Barillot et al., 2016", DOI="",
                                 variable_type="parameter", by="model_carbon", state_variable_type="", edit_by="user")
+    mass_balance_check_period: int = declare(default=0, unit="adim", unit_comment="time steps", description="Number of time steps between two audits of the conservation of C and N in the balances of root elements",
+                                min_value="0", max_value="", value_comment="0 never audits periodically, 1 audits every time step", references="", DOI="",
+                                variable_type="parameter", by="model_carbon", state_variable_type="", edit_by="user")
+    mass_balance_check_probability: float = declare(default=0., unit="adim", unit_comment="", description="Probability of auditing the conservation of C and N in the balances of root elements at any time step",
+                                min_value="0", max_value="1", value_comment="0 never audits randomly", references="", DOI="",
+                                variable_type="parameter", by="model_carbon", state_variable_type="", edit_by="user")
+    balance_integration: str = declare(default="explicit", unit="adim", unit_comment="", description="Method used to integrate the balances of hexose and amino acids in root elements over a time step, either 'explicit' or 'semi_implicit'",
+                                min_value="", max_value="", value_comment="'semi_implicit' considers losses proportional to the concentration, which keeps concentrations positive with long time steps", references="", DOI="",
+                                variable_type="parameter", by="model_carbon", state_variable_type="", edit_by="user")
+    balance_integration_tolerance: float = declare(default=0.05, unit="adim", unit_comment="", description="Relative difference between the explicit and semi-implicit updates of a concentration above which the semi-implicit update is used",
+                                min_value="0", max_value="", value_comment="", references="", DOI="",
+                                variable_type="parameter", by="model_carbon", state_variable_type="", edit_by="user")
 
     
     def __init__(self, g, time_step: int,  **scenario: dict):
@@ -67,6 +93,37 @@ class RootCNUnified(RootCarbonModel, RootNitrogenModel):
 
         self.previous_C_amount_in_the_root_system = self.compute_root_system_C_content()
 
+        # Auditor of the conservation of C and N in the balances, which only computes element-wise arrays on the time
+        # steps audited:
+        self.mass_balance = MassBalanceAuditor(period=self.mass_balance_check_period,
+                                               probability=self.mass_balance_check_probability)
+
+        # Array of the amino acids concentrations written by the last balance, with the elements it is aligned on, which
+        # is clamped after the deficit step:
+        self.AA_view = None
+
+        # Plant-scale properties computed from the totals of element-scale properties:
+        self.reductions = PlantScaleReductions(self.props)
+        self.reductions.register("total_hexose_diffusion_from_phloem", self._total_hexose_diffusion_from_phloem)
+
+    def post_growth_updating(self, new_elements=None):
+        """
+        Extends property dictionaries after growth and updates concentrations of the elements whose structural mass
+        has changed.
+        EDIT : When the growth model provides the elements created during the time step, the concentrations of grown
+        elements are updated on arrays, and only these new elements are partitioned with their parent instead of
+        checking all the vertices of the MTG.
+
+        :param new_elements: mapping of the elements created during the time step to their parent
+        """
+        if new_elements is None:
+            super().post_growth_updating()
+        else:
+            self.vertices = self.g.vertices(scale=self.g.max_scale())
+            # As parents are created before their children, they are diluted before passing their concentrations:
+            dilute_intensive_variables(self, self.vertices)
+            extend_properties(self, new_elements)
+
     # Note, here the decorator naming doesn't make much sense, but it was placed so that resolution of this flux is made after every other one.
     # Indeed, the expected behovior is to have rates computed from previous time step states. However, if we didn't waited for all import / export to compute,
     # This respiration would have reflected states of two time-steps ago.
@@ -83,79 +140,204 @@ class RootCNUnified(RootCarbonModel, RootNitrogenModel):
         return transport_respiration + anabolism_respiration
 
 
+    def focus_properties(self, *names):
+        """
+        Gathers the values of some properties for all the elements considered during this time step.
+
+        :param names: the names of the properties
+        :return: the list of the elements considered, and one array per property aligned on these elements
+        """
+        vids = list(self.props["focus_elements"])
+        return (vids, *(gather(self.props[name], vids) for name in names))
+
+    def reduce_losses(self, vids, names, fluxes, factor):
+        """
+        Reduces the losses of a balance integrated with the semi-implicit method, both in the flux arrays and in the
+        MTG properties read by the other models, so that the amounts received by the soil or respired match the amounts
+        lost by the root elements.
+
+        :param vids: the elements of the balance
+        :param names: the property of each flux whose losses can be reduced, None for the fluxes kept
+        :param fluxes: the signed flux arrays of the balance
+        :param factor: the array of factors to be applied to the losses that can be reduced
+        :return: the flux arrays with reduced losses
+        """
+        reduced = np.flatnonzero(factor < 1.)
+        if len(reduced) == 0:
+            return fluxes
+        elements = [vids[position] for position in reduced.tolist()]
+        reduced_fluxes = []
+        for name, flux in zip(names, fluxes):
+            if name is not None:
+                # Only the fluxes actually leaving the elements are reduced:
+                scaling = np.where(flux < 0., factor, 1.)
+                scatter(self.props[name], elements, gather(self.props[name], elements) * scaling[reduced])
+                flux = flux * scaling
+            reduced_fluxes.append(flux)
+        return tuple(reduced_fluxes)
+
     @potential
     @state
-    def _C_hexose_root(self, C_hexose_root, struct_mass, living_root_hairs_struct_mass, hexose_exudation, hexose_uptake_from_soil,
-                           mucilage_secretion, cells_release, maintenance_respiration,
-                           hexose_consumption_by_growth, hexose_diffusion_from_phloem,
-                           hexose_active_production_from_phloem, sucrose_loading_in_phloem,
-                           hexose_mobilization_from_reserve, hexose_immobilization_as_reserve, deficit_hexose_root, 
-                           AA_synthesis, AA_catabolism, N_metabolic_respiration):
+    def _C_hexose_root(self):
         """
         Added the following flows to the balance :
         - Amino acid synthesis hexose consumption
         - Amino acid catabolism releasing hexose
         - Nitrogen metabolism related respiration costs
+        EDIT : The balance is computed at once for all the elements considered, on arrays gathered from the MTG.
+        EDIT : The balance can be integrated with a semi-implicit method (see balance_integration), the losses to the
+        soil and the respiration being then reduced in the MTG to the amounts actually lost.
+        EDIT : As this balance is the first one computed at each time step, the mass balance auditor starts a new time
+        step here, and, if this time step is audited, records the amounts of C before the balance and brought by fluxes.
         """
-        return C_hexose_root + (self.time_step / (struct_mass + living_root_hairs_struct_mass)) * (
-                - hexose_exudation
-                + hexose_uptake_from_soil
-                - mucilage_secretion
-                - cells_release
-                - maintenance_respiration / 6.
-                - hexose_consumption_by_growth
-                + hexose_diffusion_from_phloem
-                + hexose_active_production_from_phloem
-                - 2. * sucrose_loading_in_phloem
-                + hexose_mobilization_from_reserve
-                - hexose_immobilization_as_reserve
-                - deficit_hexose_root
-                - AA_synthesis * self.r_hexose_AA
-                + AA_catabolism / self.r_hexose_AA
+        self.mass_balance.start_step()
+
+        (vids, C_hexose_root, struct_mass, living_root_hairs_struct_mass, hexose_exudation, hexose_uptake_from_soil,
+         mucilage_secretion, cells_release, maintenance_respiration,
+         hexose_consumption_by_growth, hexose_diffusion_from_phloem,
+         hexose_active_production_from_phloem, sucrose_loading_in_phloem,
+         hexose_mobilization_from_reserve, hexose_immobilization_as_reserve, deficit_hexose_root,
+         AA_synthesis, AA_catabolism, N_metabolic_respiration) = self.focus_properties(
+            "C_hexose_root", "struct_mass", "living_root_hairs_struct_mass", "hexose_exudation", "hexose_uptake_from_soil",
+            "mucilage_secretion", "cells_release", "maintenance_respiration",
+            "hexose_consumption_by_growth", "hexose_diffusion_from_phloem",
+            "hexose_active_production_from_phloem", "sucrose_loading_in_phloem",
+            "hexose_mobilization_from_reserve", "hexose_immobilization_as_reserve", "deficit_hexose_root",
+            "AA_synthesis", "AA_catabolism", "N_metabolic_respiration")
+
+        hexose_fluxes = (
+                - hexose_exudation,
+                + hexose_uptake_from_soil,
+                - mucilage_secretion,
+                - cells_release,
+                - maintenance_respiration / 6.,
+                - hexose_consumption_by_growth,
+                + hexose_diffusion_from_phloem,
+                + hexose_active_production_from_phloem,
+                - 2. * sucrose_loading_in_phloem,
+                + hexose_mobilization_from_reserve,
+                - hexose_immobilization_as_reserve,
+                - deficit_hexose_root,
+                - AA_synthesis * self.r_hexose_AA,
+                + AA_catabolism / self.r_hexose_AA,
                 - N_metabolic_respiration / 6.)
+        mass = struct_mass + living_root_hairs_struct_mass
+        if self.balance_integration == "semi_implicit":
+            balance, relaxed = semi_implicit_balance(C_hexose_root, mass, self.time_step, hexose_fluxes,
+                                                     tolerance=self.balance_integration_tolerance, return_relaxed=True)
+            balance, factor = reduced_losses(C_hexose_root, balance, mass, self.time_step, hexose_fluxes,
+                                             [name is not None for name in HEXOSE_REDUCIBLE_LOSSES], relaxed)
+            hexose_fluxes = self.reduce_losses(vids, HEXOSE_REDUCIBLE_LOSSES, hexose_fluxes, factor)
+            net_hexose_flux = sum(hexose_fluxes)
+        else:
+            net_hexose_flux = sum(hexose_fluxes)
+            balance = C_hexose_root + (self.time_step / mass) * net_hexose_flux
+        scatter(self.C_hexose_root, vids, balance)
+
+        if self.mass_balance.active:
+            self.mass_balance.record("C", vids, 6. * C_hexose_root * mass, 6. * self.time_step * net_hexose_flux)
 
     @potential
     @state
-    def _AA(self, AA, struct_mass, diffusion_AA_phloem, import_AA, diffusion_AA_soil, export_AA, AA_synthesis, 
-            storage_synthesis, storage_catabolism, AA_catabolism, struct_mass_produced, amino_acids_consumption_by_growth, deficit_AA_root):
+    def _AA(self):
         """
         EDIT : replaced structural nitrogen synthesis by rhizodep input in balance
+        EDIT : The balance is computed at once for all the elements considered, on arrays gathered from the MTG, the
+        concentration being set to 0 in elements without structural mass.
+        EDIT : The balance can be integrated with a semi-implicit method (see balance_integration), the diffusion of
+        amino acids to the soil being then reduced in the MTG to the amount actually lost.
         """
+        (vids, AA, struct_mass, diffusion_AA_phloem, import_AA, diffusion_AA_soil, export_AA, AA_synthesis,
+         storage_synthesis, storage_catabolism, AA_catabolism, amino_acids_consumption_by_growth,
+         deficit_AA_root) = self.focus_properties(
+            "AA", "struct_mass", "diffusion_AA_phloem", "import_AA", "diffusion_AA_soil", "export_AA", "AA_synthesis",
+            "storage_synthesis", "storage_catabolism", "AA_catabolism", "amino_acids_consumption_by_growth",
+            "deficit_AA_root")
 
-        if struct_mass > 0:
-            return AA + (self.time_step / struct_mass) * (
-                    diffusion_AA_phloem
-                    + import_AA
-                    - diffusion_AA_soil
-                    - export_AA
-                    + AA_synthesis
-                    - storage_synthesis * self.r_AA_stor
-                    + storage_catabolism / self.r_AA_stor
-                    - AA_catabolism
-                    - amino_acids_consumption_by_growth
-                    - deficit_AA_root
-            ) 
-        else:
-            return 0
+        AA_fluxes = (
+                    + diffusion_AA_phloem,
+                    + import_AA,
+                    - diffusion_AA_soil,
+                    - export_AA,
+                    + AA_synthesis,
+                    - storage_synthesis * self.r_AA_stor,
+                    + storage_catabolism / self.r_AA_stor,
+                    - AA_catabolism,
+                    - amino_acids_consumption_by_growth,
+                    - deficit_AA_root)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self.balance_integration == "semi_implicit":
+                balance, relaxed = semi_implicit_balance(AA, struct_mass, self.time_step, AA_fluxes,
+                                                         tolerance=self.balance_integration_tolerance, return_relaxed=True)
+                balance, factor = reduced_losses(AA, balance, struct_mass, self.time_step, AA_fluxes,
+                                                 [name is not None for name in AA_REDUCIBLE_LOSSES], relaxed)
+                AA_fluxes = self.reduce_losses(vids, AA_REDUCIBLE_LOSSES, AA_fluxes, factor)
+                net_AA_flux = sum(AA_fluxes)
+            else:
+                net_AA_flux = sum(AA_fluxes)
+                balance = AA + (self.time_step / struct_mass) * net_AA_flux
+            balance = np.where(struct_mass > 0, balance, 0.)
+        scatter(self.AA, vids, balance)
+        self.AA_view = (vids, balance)
+
+        if self.mass_balance.active:
+            self.mass_balance.record("N", vids, self.r_Nm_AA * AA * struct_mass,
+                                     np.where(struct_mass > 0, self.r_Nm_AA * self.time_step * net_AA_flux, 0.))
 
     @deficit
     @state
-    def _deficit_AA_root(self, AA, struct_mass, living_root_hairs_struct_mass):
-        if AA < 0:
-            return - AA * (struct_mass + living_root_hairs_struct_mass) / self.time_step
-        else:
-            return 0.
+    def _deficit_AA_root(self):
+        """
+        EDIT : The deficit is computed at once for all the elements considered, on arrays gathered from the MTG.
+        """
+        vids, AA, struct_mass, living_root_hairs_struct_mass = self.focus_properties("AA", "struct_mass",
+                                                                                     "living_root_hairs_struct_mass")
+        deficit = np.where(AA < 0, - AA * (struct_mass + living_root_hairs_struct_mass) / self.time_step, 0.)
+        scatter(self.deficit_AA_root, vids, deficit)
         
     @actual
     @state
     def _threshold_C_sucrose_root(self):
-        for vid in self.props["focus_elements"]:
-            if self.AA[vid] < 0.:
-                self.AA[vid] = 0.
+        """
+        EDIT : Negative concentrations of amino acids are found in a single array comparison over the elements
+        considered, and only these are set to 0. The array written by the balance is kept until this step, the deficit
+        step in between only reading the negative values, and is clamped in place instead of reading the MTG again.
+        """
+        if self.AA_view is None:
+            clamp(self.AA, list(self.props["focus_elements"]), minimum=0.)
+        else:
+            vids, AA = self.AA_view
+            clamp(self.AA, vids, minimum=0., array=AA)
+            self.AA_view = None
+
+        # If this time step is audited, the balances of C and N have now been fully applied and can be checked:
+        if self.mass_balance.active:
+            self.mass_balance.check("C", lambda vids: 6. * gather(self.C_hexose_root, vids) * (
+                gather(self.props["struct_mass"], vids) + gather(self.props["living_root_hairs_struct_mass"], vids)))
+            self.mass_balance.check("N", lambda vids: self.r_Nm_AA * gather(self.AA, vids) * gather(self.props["struct_mass"], vids))
 
     #@totalrate
     def _total_hexose_diffusion_from_phloem(self, hexose_diffusion_from_phloem, struct_mass):
         """
         Property computed to compare with shoot model unloading (umol of C.g-1 mstruc.h-1)
+        EDIT : This property is registered in the plant-scale reductions of the model, and thus receives the totals of
+        hexose_diffusion_from_phloem and struct_mass over all elements, computed as array reductions.
+        """
+        return 6 * 3600 * 1e6 * (hexose_diffusion_from_phloem / struct_mass)
+
+    @actual
+    @state
+    def _plant_scale_properties(self):
+        """
+        Updates the plant-scale properties registered in the reductions of the model (e.g.
+        total_hexose_diffusion_from_phloem) once the balances have been applied, so that they are recorded with the
+        other plant-scale properties of the model. Each total of an element-scale property is computed only once.
+        The values are written in the property dictionaries of the MTG to which the plant-scale attributes are linked,
+        rather than rebinding these attributes.
         """
-        return 6 * 3600 * 1e6 * (sum(list(hexose_diffusion_from_phloem.values())) / sum(list(struct_mass.values())))
\ No newline at end of file
+        for name, value in self.reductions.compute().items():
+            values = getattr(self, name)
+            if isinstance(values, dict):
+                values.update({1: value})
+            else:
+                setattr(self, name, value)
\ No newline at end of file
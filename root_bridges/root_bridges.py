@@ -68,6 +68,15 @@ class Model(CompositeModel):
         self.root_water.post_coupling_init()
 
 
+    def set_diagnostics_logger(self, logger):
+        """
+        Makes the summaries of the anomalies met during growth be written by a given logger (e.g. the logging.Logger
+        configured for the simulation) instead of the logger of the diagnostics module.
+
+        :param logger: the logging.Logger to use
+        """
+        self.root_growth.diagnostics.write = logger.warning
+
     def run(self):
         self.apply_input_tables(tables=self.input_tables, to=self.models, when=self.time)
 
@@ -76,12 +85,15 @@ class Model(CompositeModel):
 
         # Compute root growth from resulting states
         self.root_growth()
+        # Write a single summary of the anomalies met during growth, if any
+        self.root_growth.flush_diagnostics()
 
-        # Extend property dictionaries after growth
+        # Extend property dictionaries after growth, the carbon and nitrogen and soil models only considering the
+        # elements created during this time step
         self.root_anatomy.post_growth_updating()
         self.root_water.post_growth_updating()
-        self.root_cn.post_growth_updating()
-        self.soil.post_growth_updating()
+        self.root_cn.post_growth_updating(new_elements=self.root_growth.new_elements)
+        self.soil.post_growth_updating(new_elements=self.root_growth.new_elements)
         
         # Update topological surfaces and volumes based on other evolved structural properties
         self.root_anatomy()
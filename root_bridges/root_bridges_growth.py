@@ -47,6 +47,15 @@ class Model(CompositeModel):
         self.data_structures = {"root": self.g}
 
 
+    def set_diagnostics_logger(self, logger):
+        """
+        Makes the summaries of the anomalies met during growth be written by a given logger (e.g. the logging.Logger
+        configured for the simulation) instead of the logger of the diagnostics module.
+
+        :param logger: the logging.Logger to use
+        """
+        self.root_growth.diagnostics.write = logger.warning
+
     def run(self):
         self.apply_input_tables(tables=self.input_tables, to=self.models, when=self.time)
 
@@ -5,15 +5,178 @@ from metafspm.component_factory import *
 from metafspm.component import declare
 
 from openalea.mtg import *
-from openalea.mtg.traversal import post_order
 from numpy import pi, sqrt
 import numpy as np
 import pandas as pd
 import os
+import multiprocessing
+
+from root_bridges.columns import gather, scatter, ScatterAdd
+from root_bridges.diagnostics import Diagnostics
+from root_bridges.growth_kernels import growth_kernels, elongation_limitation
+from root_bridges.random_streams import standard_normal_draws
+from root_bridges.root_topology import AxisIndex, SupplyZones
 
 
 family = "growth"
 
+# Prototype of the properties of a new element with nil properties (see ADDING_A_CHILD), to which the properties
+# depending on the new element and on the model parameters are added:
+NIL_CHILD_PROPERTIES = dict(
+    # Authorizations and C requirements:
+    # -----------------------------------
+    lateral_root_emergence_possibility='Impossible',
+    emergence_cost=0.,
+    # Geometry and topology:
+    # -----------------------
+    potential_length=0.,
+    initial_length=0.,
+    volume=0.,
+    dist_to_ramif=0.,
+    distance_from_tip=0.,
+    former_distance_from_tip=0.,
+    actual_elongation=0.,
+    actual_elongation_rate=0.,
+    # Quantities and concentrations:
+    # -------------------------------
+    struct_mass=0.,
+    initial_struct_mass=0.,
+    C_hexose_root=0.,
+    AA=0.,
+    # Root hairs:
+    # ------------
+    root_hair_length=0.,
+    actual_length_with_hairs=0.,
+    living_root_hairs_number=0.,
+    dead_root_hairs_number=0.,
+    total_root_hairs_number=0.,
+    actual_time_since_root_hairs_emergence_started=0.,
+    thermal_time_since_root_hairs_emergence_started=0.,
+    actual_time_since_root_hairs_emergence_stopped=0.,
+    thermal_time_since_root_hairs_emergence_stopped=0.,
+    all_root_hairs_formed=False,
+    root_hairs_struct_mass=0.,
+    root_hairs_struct_mass_produced=0.,
+    initial_living_root_hairs_struct_mass=0.,
+    living_root_hairs_struct_mass=0.,
+    # Fluxes:
+    # --------
+    resp_growth=0.,
+    struct_mass_produced=0.,
+    hexose_growth_demand=0.,
+    hexose_consumption_by_growth_amount=0.,
+    hexose_consumption_by_growth=0.,
+    hexose_possibly_required_for_elongation=0.,
+    amino_acids_consumption_by_growth_amount=0.,
+    amino_acids_consumption_by_growth=0.,
+    amino_acids_possibly_required_for_elongation=0.,
+    amino_acids_growth_demand=0.,
+    # Time indications:
+    # ------------------
+    soil_temperature=7.8,  # TODO change
+    actual_time_since_primordium_formation=0.,
+    actual_time_since_emergence=0.,
+    actual_time_since_cells_formation=0.,
+    actual_potential_time_since_emergence=0.,
+    actual_time_since_growth_stopped=0.,
+    actual_time_since_death=0.,
+    thermal_time_since_primordium_formation=0.,
+    thermal_time_since_emergence=0.,
+    thermal_time_since_cells_formation=0.,
+    thermal_potential_time_since_emergence=0.,
+    thermal_time_since_growth_stopped=0.,
+    thermal_time_since_death=0.)
+
+# Properties of a new element with identical properties (see ADDING_A_CHILD) that are copied from the mother element:
+IDENTICAL_CHILD_COPIED_PROPERTIES = (
+    # Geometry and topology:
+    "radius", "theoretical_radius", "potential_radius", "root_tissue_density", "dist_to_ramif", "distance_from_tip",
+    "former_distance_from_tip", "actual_elongation", "actual_elongation_rate",
+    # Quantities and concentrations:
+    "struct_mass", "initial_struct_mass", "C_hexose_root", "AA",
+    # Root hairs:
+    "root_hair_radius", "root_hair_length", "actual_length_with_hairs", "living_root_hairs_number",
+    "dead_root_hairs_number", "total_root_hairs_number", "actual_time_since_root_hairs_emergence_started",
+    "thermal_time_since_root_hairs_emergence_started", "actual_time_since_root_hairs_emergence_stopped",
+    "thermal_time_since_root_hairs_emergence_stopped", "all_root_hairs_formed", "root_hairs_lifespan",
+    "root_hairs_struct_mass", "root_hairs_struct_mass_produced", "living_root_hairs_struct_mass",
+    "initial_living_root_hairs_struct_mass",
+    # Fluxes:
+    "resp_growth", "struct_mass_produced", "hexose_growth_demand", "hexose_possibly_required_for_elongation",
+    "hexose_consumption_by_growth_amount", "hexose_consumption_by_growth",
+    # Time indications:
+    "soil_temperature", "growth_duration", "life_duration", "actual_time_since_primordium_formation",
+    "actual_time_since_emergence", "actual_time_since_cells_formation", "actual_time_since_growth_stopped",
+    "actual_time_since_death", "thermal_time_since_primordium_formation", "thermal_time_since_emergence",
+    "thermal_time_since_cells_formation", "thermal_potential_time_since_emergence", "thermal_time_since_growth_stopped",
+    "thermal_time_since_death")
+
+# Prototype of the properties of a new element with identical properties that do not depend on the mother element:
+IDENTICAL_CHILD_PROPERTIES = dict(
+    lateral_root_emergence_possibility='Impossible',
+    emergence_cost=0.,
+    volume=0.,
+    amino_acids_consumption_by_growth_amount=0.,
+    amino_acids_consumption_by_growth=0.,
+    amino_acids_possibly_required_for_elongation=0.,
+    amino_acids_growth_demand=0.)
+
+# Consumptions by growth of the elements, accumulated during actual growth and added at once to the properties:
+GROWTH_CONSUMPTION_PROPERTIES = ("hexose_consumption_by_growth_amount", "hexose_consumption_by_growth",
+                                 "amino_acids_consumption_by_growth_amount", "amino_acids_consumption_by_growth",
+                                 "resp_growth")
+
+# Maximal number of soil temperatures for which the temperature adjustment is kept in memory:
+TEMPERATURE_ADJUSTMENTS_MEMORY_SIZE = 10000
+
+# Growth-related variables set to 0 at the beginning of each time step:
+NIL_RESET_PROPERTIES = ("hexose_consumption_by_growth_amount", "hexose_consumption_by_growth",
+                        "hexose_possibly_required_for_elongation", "amino_acids_consumption_by_growth_amount",
+                        "amino_acids_consumption_by_growth", "amino_acids_possibly_required_for_elongation",
+                        "resp_growth", "struct_mass_produced", "root_hairs_struct_mass_produced",
+                        "hexose_growth_demand", "amino_acids_growth_demand",
+                        "actual_elongation", "actual_elongation_rate")
+
+# (target, source) pairs of properties copied at the beginning of each time step, so that the initial values of length,
+# radius and struct_mass are correctly initialized:
+COPIED_RESET_PROPERTIES = (("initial_length", "length"),
+                           ("initial_radius", "radius"),
+                           ("potential_radius", "radius"),
+                           ("theoretical_radius", "radius"),
+                           ("initial_struct_mass", "struct_mass"),
+                           ("initial_living_root_hairs_struct_mass", "living_root_hairs_struct_mass"))
+
+# Properties of the grown elements written during actual growth, which worker processes send back to the model:
+ACTUAL_GROWTH_PROPERTIES = ("length", "radius", "volume", "struct_mass", "struct_mass_produced", "initial_struct_mass",
+                            "hexose_growth_demand", "amino_acids_growth_demand", "type", "actual_elongation",
+                            "actual_elongation_rate", "thermal_time_since_emergence", "actual_time_since_emergence",
+                            "dist_to_ramif")
+
+# Types of the elements bearing the subtrees covered by different worker processes during actual growth:
+SUBTREE_BEARING_TYPES = ("Support_for_seminal_root", "Support_for_adventitious_root")
+
+# Growth model whose actual growth is shared among worker processes, which inherit it when they are forked:
+_forked_growth_model = None
+
+
+def _actual_growth_of_subtree(vids):
+    """
+    Performs the actual growth of a part of the root system in a forked worker process, on the copy of the model and
+    of its MTG inherited from the parent process.
+    :param vids: the indices of the elements of the part, in post-order
+    :return: the new values of the properties written during actual growth for these elements, the consumptions and
+    elongation shares returned by actual_growth_of_elements, and the anomalies met
+    """
+    model = _forked_growth_model
+    model.diagnostics = Diagnostics(write=None)
+    consumption, elongation_shares = model.actual_growth_of_elements(vids)
+    props = model.g.properties()
+    columns = {}
+    for name in ACTUAL_GROWTH_PROPERTIES:
+        values = props.get(name, {})
+        columns[name] = {vid: values[vid] for vid in vids if vid in values}
+    return columns, consumption, elongation_shares, model.diagnostics
+
 
 @dataclass
 class RootGrowthModelCoupled(RootGrowthModel):
@@ -52,24 +215,96 @@ class RootGrowthModelCoupled(RootGrowthModel):
     r_C_AA: float =     declare(default=5, unit="adim", unit_comment="mol of carbon per mol of amino acids", description="concentration stoechiometric ratio between carbon and amino acids in roots", 
                                 min_value="", max_value="", value_comment="Based on glutamic acid", references="", DOI="",
                                 variable_type="parameter", by="model_growth", state_variable_type="", edit_by="user")
+    counter_based_random: bool = declare(default=False, unit="adim", unit_comment="", description="If True, the random values used for primordium formation are drawn from a Philox stream keyed by random_choice, the index of the apex and the time step, instead of reseeding numpy's global generator for each apex",
+                                min_value="", max_value="", value_comment="Values are drawn for all apices at once and don't depend on the order in which apices are considered", references="Salmon et al. (2011)", DOI="10.1145/2063384.2063405",
+                                variable_type="parameter", by="model_growth", state_variable_type="", edit_by="user")
+    compiled_kernels: bool = declare(default=False, unit="adim", unit_comment="", description="If True, the numeric cores of growth (elongation limitation, maximal volumes for elongation and thickening, root hairs length) are compiled with Numba when it is installed",
+                                min_value="", max_value="", value_comment="Falls back to the Python interpreter when Numba is not installed", references="", DOI="",
+                                variable_type="parameter", by="model_growth", state_variable_type="", edit_by="user")
+    growth_workers: int = declare(default=1, unit="adim", unit_comment="", description="Number of worker processes covering in parallel the subtrees of seminal and adventitious roots during actual growth",
+                                min_value="1", max_value="", value_comment="1 covers all elements in a single pass; workers are forked at each time step, which only pays off for large root systems and requires the fork start method (e.g. Linux)", references="", DOI="",
+                                variable_type="parameter", by="model_growth", state_variable_type="", edit_by="user")
 
 
     def __init__(self, g=None ,time_step=3600, **scenario):
         """Pass to inherited init, necessary with data classes"""
+        # Elements possibly created while initializing the MTG are registered when the index is built:
+        self.axis_index = None
+        # Elements created during the current time step, with their parent:
+        self.new_elements = {}
+        # Temperature adjustments already computed, per soil temperature and set of temperature parameters:
+        self.temperature_adjustments_memory = {}
+        # Number of the current time step, and random values drawn for the apices during this time step:
+        self.step_number = 0
+        self.random_draws = {}
+        # Anomalies met while covering the elements, summarized once per time step:
+        self.diagnostics = Diagnostics()
         super().__init__(g, time_step, **scenario)
+        # Index of the root axes, maintained as new elements are added:
+        self.axis_index = AxisIndex(self.g)
+        # Supplying zones of the apices during the current time step:
+        self.supply_zones = SupplyZones()
+        # Numeric cores of growth, possibly compiled:
+        self.kernels = growth_kernels(compiled=self.compiled_kernels)
 
 
     def post_growth_updating(self):
+        """
+        Extends the property dictionaries to the elements created during this time step, which are published in
+        new_elements with their parent, so that the other elements don't need to be covered.
+        """
         self.vertices = self.g.vertices(scale=self.g.max_scale())
-        for vid in self.vertices:
+        for vid, parent in self.new_elements.items():
             if vid not in self.amino_acids_consumption_by_growth.keys():
-                parent = self.g.parent(vid)
                 # we partition the initial flow in the parent accounting for mass fraction
                 # We use struct_mass, the resulting structural mass after growth
                 mass_fraction = self.struct_mass[vid] / (self.struct_mass[vid] + self.struct_mass[parent])
                 self.amino_acids_consumption_by_growth.update({vid: self.amino_acids_consumption_by_growth[parent] * mass_fraction,
                                             parent: self.amino_acids_consumption_by_growth[parent] * (1 - mass_fraction)})
 
+    def register_new_element(self, new_element):
+        """
+        This function records a newly created element in the topological indices of the model, and in the elements
+        created during the current time step.
+        :param new_element: the node of the MTG that has just been created
+        :return:
+        """
+        self.new_elements[new_element.index()] = self.g.parent(new_element.index())
+        if self.axis_index is not None:
+            self.axis_index.add_element(new_element.index())
+
+    def temperature_time_adjustment(self, soil_temperature: float):
+        """
+        This function provides the coefficient that modifies the processes and the different "ages" experienced by
+        roots according to soil temperature, as computed by temperature_modification with the parameters shared by all
+        growth processes. The coefficient is only computed once for each soil temperature, and is kept in memory across
+        time steps.
+        :param soil_temperature: the soil temperature (degree Celsius)
+        :return: the temperature adjustment coefficient
+        """
+        key = (soil_temperature, self.process_at_T_ref, self.T_ref, self.A, self.B, self.C)
+        adjustment = self.temperature_adjustments_memory.get(key)
+        if adjustment is None:
+            adjustment = self.temperature_modification(process_at_T_ref=self.process_at_T_ref,
+                                                       soil_temperature=soil_temperature,
+                                                       T_ref=self.T_ref, A=self.A, B=self.B, C=self.C)
+            # We avoid keeping in memory an ever-growing number of temperatures over long simulations:
+            if len(self.temperature_adjustments_memory) >= TEMPERATURE_ADJUSTMENTS_MEMORY_SIZE:
+                self.temperature_adjustments_memory.clear()
+            self.temperature_adjustments_memory[key] = adjustment
+        return adjustment
+
+    def temperature_time_adjustments(self, soil_temperatures):
+        """
+        This function provides the temperature adjustment coefficients for an array of soil temperatures, e.g. the soil
+        temperatures of all the elements, by computing them only once for each distinct temperature.
+        :param soil_temperatures: array of soil temperatures (degree Celsius)
+        :return: the array of temperature adjustment coefficients
+        """
+        temperatures, inverse = np.unique(soil_temperatures, return_inverse=True)
+        adjustments = np.array([self.temperature_time_adjustment(temperature) for temperature in temperatures.tolist()], dtype=float)
+        return adjustments[inverse.reshape(-1)]
+
     # SUBDIVISIONS OF THE SCHEDULING LOOP
     # -----------------------------------
     @stepinit
@@ -77,37 +312,61 @@ class RootGrowthModelCoupled(RootGrowthModel):
         """
         This function re-initializes different growth-related variables (e.g. potential growth variables).
         EDIT : Added amino acids growth and elongation variables for reinitialization TODO : Really usefull for all? in Some funcs, it seems repeated.
+        EDIT : The reset is performed column by column on the MTG property dictionaries rather than vertex by vertex,
+        so that each property is filled in a single bulk operation.
         :return:
         """
-        # We cover all the vertices in the MTG:
-        for vid in self.g.vertices_iter(scale=1):
-            # n represents the vertex:
-            n = self.g.node(vid)
+        # The anomalies met during the previous time step are summarized:
+        self.flush_diagnostics()
+        # The elements created during the previous time step have been handled by all models:
+        self.new_elements = {}
 
-            # We set to 0 the growth-related variables:
-            n.hexose_consumption_by_growth_amount = 0.
-            n.hexose_consumption_by_growth = 0.
-            n.hexose_possibly_required_for_elongation = 0.
-            n.amino_acids_consumption_by_growth_amount = 0.
-            n.amino_acids_consumption_by_growth = 0.
-            n.amino_acids_possibly_required_for_elongation = 0.
-            n.resp_growth = 0.
-            n.struct_mass_produced = 0.
-            n.root_hairs_struct_mass_produced = 0.
-            n.hexose_growth_demand = 0.
-            n.amino_acids_growth_demand = 0.
-            n.actual_elongation = 0.
-            n.actual_elongation_rate = 0.
-
-            # We make sure that the initial values of length, radius and struct_mass are correctly initialized:
-            n.initial_length = n.length
-            n.initial_radius = n.radius
-            n.potential_radius = n.radius
-            n.theoretical_radius = n.radius
-            n.initial_struct_mass = n.struct_mass
-            n.initial_living_root_hairs_struct_mass = n.living_root_hairs_struct_mass
+        # We cover all the vertices in the MTG:
+        vertices = self.g.vertices(scale=1)
+        props = self.g.properties()
+
+        # We set to 0 the growth-related variables:
+        for name in NIL_RESET_PROPERTIES:
+            props.setdefault(name, {}).update(dict.fromkeys(vertices, 0.))
+
+        # We make sure that the initial values of length, radius and struct_mass are correctly initialized:
+        for target, source in COPIED_RESET_PROPERTIES:
+            source_values = props.setdefault(source, {})
+            props.setdefault(target, {}).update(zip(vertices, map(source_values.get, vertices)))
+
+        # The amounts cumulated along the root axes must be computed again for this time step:
+        self.axis_index.invalidate()
+        # The supplying zones of the previous time step are forgotten:
+        self.supply_zones.reset()
+
+        # We draw at once the random values of all current apices for this time step:
+        self.step_number += 1
+        self.random_draws = {}
+        if self.random and self.counter_based_random:
+            labels = props["label"]
+            apices = [vid for vid in vertices if labels.get(vid) == "Apex"]
+            self.random_draws = dict(zip(apices, standard_normal_draws(self.random_choice, apices, self.step_number)))
         return
 
+    def flush_diagnostics(self):
+        """
+        This function writes the summary of the anomalies met since the last summary, if any.
+        :return:
+        """
+        self.diagnostics.flush(header=f"[growth, time step {self.step_number}] ")
+
+    def apex_random_draws(self, vid):
+        """
+        This function provides the four normal values drawn for an apex during the current time step, which only
+        depend on random_choice, the index of the apex and the number of the time step. Apices created during the time
+        step get their values when they are first considered, which gives the same values as a batched draw.
+        :param vid: the index of the apex
+        :return: array of four values drawn from a standard normal distribution
+        """
+        if vid not in self.random_draws:
+            self.random_draws[vid] = standard_normal_draws(self.random_choice, [vid], self.step_number)[0]
+        return self.random_draws[vid]
+
     # Function for calculating root elongation:
     def elongated_length(self, element, initial_length: float, radius: float, C_hexose_root: float, elongation_time_in_seconds: float):
         """
@@ -130,19 +389,22 @@ class RootGrowthModelCoupled(RootGrowthModel):
             # based on a Michaelis-Menten formalism:
             if C_hexose_root > 0. and element.AA > 0:
                 # michaelis_menten_limitation = ((1 + self.Km_elongation) / C_hexose_root) * ((1 + self.Km_elongation_amino_acids) / element.AA)
-                michaelis_menten_limitation = ((C_hexose_root / (C_hexose_root + self.Km_elongation)) + (element.AA / (element.AA + self.Km_elongation_amino_acids))) / 2
+                # This kernel is called for a single element, so that it is not worth calling its compiled version:
+                michaelis_menten_limitation = elongation_limitation(C_hexose_root, element.AA, self.Km_elongation,
+                                                                    self.Km_elongation_amino_acids)
                 #print("MM", michaelis_menten_limitation)
                 potential_elongation = self.EL * 2. * radius * elongation_time_in_seconds
                 elongation = potential_elongation * michaelis_menten_limitation
             else:
-                print("No elongation, negative concentrations!! ", C_hexose_root, element.AA)
+                self.diagnostics.record("No elongation, negative concentrations", element.index(),
+                                        C_hexose_root=C_hexose_root, AA=element.AA)
                 elongation = 0.
         
         # We calculate the new potential length corresponding to this elongation:
         new_length = initial_length + elongation
         if new_length < initial_length:
-            print("!!! ERROR: There is a problem of elongation, with the initial length", initial_length,
-                  " and the radius", radius, "and the elongation time", elongation_time_in_seconds)
+            self.diagnostics.record("ERROR: problem of elongation", element.index(), initial_length=initial_length,
+                                    radius=radius, elongation_time_in_seconds=elongation_time_in_seconds)
         return new_length
 
     # Function for calculating the amount of C to be used in neighbouring elements for sustaining root elongation:
@@ -151,115 +413,50 @@ class RootGrowthModelCoupled(RootGrowthModel):
         This function computes the list of root elements that can supply C as hexose for sustaining the elongation
         of a given element, as well as their structural mass and their amount of available hexose.
         EDIT : Sustaining the need for N when a root apex should elongate has been added.
+        EDIT : The supplying elements and their contributions are no longer stored as lists in the MTG, but recorded in
+        the supplying zones of the time step (see SupplyZones).
         :param element: the element for which we calculate the possible supply of C for its elongation
-        :return: three lists containing the indices of elements, their hexose amount (mol of hexose) and their structural mass (g).
+        :return:
         """
 
         n = element
 
-        # We initialize each amount of hexose available for growth:
-        n.hexose_possibly_required_for_elongation = 0.
-        n.amino_acids_possibly_required_for_elongation = 0.
-        n.struct_mass_contributing_to_elongation = 0.
-
-        # We initialize empty lists:
-        list_of_elongation_supporting_elements = []
-        list_of_elongation_supporting_elements_hexose = []
-        list_of_elongation_supporting_elements_amino_acids = []
-        list_of_elongation_supporting_elements_mass = []
-
         # We then calculate the length of an apical zone of a fixed length which can provide the amount of hexose required for growth:
         growing_zone_length = self.growing_zone_factor * n.radius
         # We calculate the corresponding volume to which this length should correspond based on the diameter of this apex:
         supplying_volume = growing_zone_length * n.radius ** 2 * pi
 
-        # We start counting the hexose at the apex:
-        index = n.index()
-        current_element = n
-
-        # We initialize a temporary variable that will be used as a counter:
-        remaining_volume = supplying_volume
-
-        # As long the remaining volume is not zero:
-        while remaining_volume > 0:
-
-            # If the volume of the current element is lower than the remaining volume:
-            if remaining_volume > current_element.volume:
-                # We make sure to include in the list of supplying elements only elements with a positive length
-                # (e.g. NOT the elements of length 0 that support seminal or adventitious roots):
-                if current_element.length > 0.:
-                    # We add to the amount of hexose available all the hexose in the current element
-                    # (EXCLUDING sugars in the living root hairs):
-                    # TODO: Should the C from root hairs be used for helping roots to grow?
-                    hexose_contribution = current_element.C_hexose_root * current_element.struct_mass
-                    amino_acids_contribution = current_element.AA * current_element.struct_mass
-                    n.hexose_possibly_required_for_elongation += hexose_contribution
-                    n.amino_acids_possibly_required_for_elongation += amino_acids_contribution
-                    n.struct_mass_contributing_to_elongation += current_element.struct_mass
-                    # We record the index of the contributing element:
-                    list_of_elongation_supporting_elements.append(index)
-                    # We record the amount of hexose that the current element can provide:
-                    list_of_elongation_supporting_elements_hexose.append(hexose_contribution)
-                    # We record the amount of amino acids that the current element can provide:
-                    list_of_elongation_supporting_elements_amino_acids.append(amino_acids_contribution)
-                    # We record the structural mass from which the current element contributes:
-                    list_of_elongation_supporting_elements_mass.append(current_element.struct_mass)
-                    # We subtract the volume of the current element to the remaining volume:
-                    remaining_volume = remaining_volume - current_element.volume
-
-                # And we try to move the index to the segment preceding the current element:
-                index_attempt = self.g.Father(index, EdgeType='<')
-                # If there is no father element on this axis:
-                if index_attempt is None:
-                    # Then we try to move to the mother root, if any:
-                    index_attempt = self.g.Father(index, EdgeType='+')
-                    # If there is no such root:
-                    if index_attempt is None:
-                        # Then we exit the loop here:
-                        break
-                # We set the new index:
-                index = index_attempt
-                # We define the new element to consider according to the new index:
-                current_element = self.g.node(index)
-                
-            # Otherwise, this is the last preceding element to consider:
-            else:
-                # We finally add to the amount of hexose available for elongation a part of the hexose of the current element:
-                hexose_contribution = current_element.C_hexose_root * current_element.struct_mass \
-                                      * remaining_volume / current_element.volume
-                amino_acids_contribution = current_element.AA * current_element.struct_mass \
-                                      * remaining_volume / current_element.volume
-                n.hexose_possibly_required_for_elongation += hexose_contribution
-                n.amino_acids_possibly_required_for_elongation += amino_acids_contribution
-                n.struct_mass_contributing_to_elongation += current_element.struct_mass \
-                                                            * remaining_volume / current_element.volume
-                # We record the index of the contributing element:
-                list_of_elongation_supporting_elements.append(index)
-                # We record the amount of hexose that the current element can provide:
-                list_of_elongation_supporting_elements_hexose.append(hexose_contribution)
-                # We record the amount of amino acids that the current element can provide:
-                list_of_elongation_supporting_elements_amino_acids.append(amino_acids_contribution)
-                # We record the structural mass from which the current element contributes:
-                list_of_elongation_supporting_elements_mass.append(
-                    current_element.struct_mass * remaining_volume / current_element.volume)
-                # And the remaining volume to consider is set to 0:
-                remaining_volume = 0.
-                # And we exit the loop here:
-                break
+        # We look for the elements covering this volume from the apex towards the base, using the cumulated volumes
+        # along the axes rather than moving from father to father. All elements are fully included, except possibly
+        # the last one, of which only a fraction of the volume is needed:
+        positions, fractions = self.axis_index.supplying_zone(n.index(), supplying_volume)
+
+        # We record the amount of hexose that each element can provide
+        # (EXCLUDING sugars in the living root hairs):
+        # TODO: Should the C from root hairs be used for helping roots to grow?
+        hexose_contributions = self.axis_index.hexose[positions] * fractions
+        # We record the amount of amino acids that each element can provide:
+        amino_acids_contributions = self.axis_index.amino_acids[positions] * fractions
+        # We record the structural mass from which each element contributes:
+        mass_contributions = self.axis_index.struct_mass[positions] * fractions
+
+        # We sum the amounts of hexose and amino acids available for growth:
+        n.hexose_possibly_required_for_elongation = float(hexose_contributions.sum())
+        n.amino_acids_possibly_required_for_elongation = float(amino_acids_contributions.sum())
+        n.struct_mass_contributing_to_elongation = float(mass_contributions.sum())
 
         # We record the average concentration in hexose of the whole zone of hexose supply contributing to elongation:
         if n.struct_mass_contributing_to_elongation > 0.:
             n.growing_zone_C_hexose_root = n.hexose_possibly_required_for_elongation / n.struct_mass_contributing_to_elongation
         else:
-            print("!!! ERROR: the mass contributing to elongation in element", n.index(), "of type", n.type, "is",
-                  n.struct_mass_contributing_to_elongation,
-                  "g, and its structural mass is", n.struct_mass, "g!")
+            self.diagnostics.record("ERROR: no mass contributing to elongation", n.index(), type=n.type,
+                                    struct_mass_contributing_to_elongation=n.struct_mass_contributing_to_elongation,
+                                    struct_mass=n.struct_mass)
             n.growing_zone_C_hexose_root = 0.
 
-        n.list_of_elongation_supporting_elements = list_of_elongation_supporting_elements
-        n.list_of_elongation_supporting_elements_hexose = list_of_elongation_supporting_elements_hexose
-        n.list_of_elongation_supporting_elements_amino_acids = list_of_elongation_supporting_elements_amino_acids
-        n.list_of_elongation_supporting_elements_mass = list_of_elongation_supporting_elements_mass
+        # We record the indices of the contributing elements and their contributions:
+        self.supply_zones.add(n.index(), self.axis_index.order[positions], hexose_contributions,
+                              amino_acids_contributions, mass_contributions)
 
 
     def primordium_formation(self, apex, elongation_rate=0.):
@@ -279,9 +476,7 @@ class RootGrowthModelCoupled(RootGrowthModel):
 
         # We calculate a coefficient that will modify the different "ages" experienced by roots according to soil
         # temperature assuming a linear relationship (this is equivalent as the calculation of "growth degree-days):
-        temperature_time_adjustment = self.temperature_modification(process_at_T_ref=self.process_at_T_ref,
-                                                                    soil_temperature=apex.soil_temperature,
-                                                                    T_ref=self.T_ref, A=self.A, B=self.B, C=self.C)
+        temperature_time_adjustment = self.temperature_time_adjustment(apex.soil_temperature)
 
         # OPERATING PRIMORDIUM FORMATION:
         # --------------------------------
@@ -307,7 +502,18 @@ class RootGrowthModelCoupled(RootGrowthModel):
         # whose mean is the value of the mother root diameter multiplied by RMD, and whose standard deviation is
         # the product of this mean and the coefficient of variation CVDD (Pages et al. 2014).
         # We also set the root angles depending on random:
-        if self.random:
+        if self.random and self.counter_based_random:
+            # The values drawn for this apex during the time step are scaled to the corresponding normal distributions:
+            draws = self.apex_random_draws(apex.index())
+            mean_radius = (apex.radius - self.Dmin / 2.) * self.RMD + self.Dmin / 2.
+            potential_radius = mean_radius + mean_radius * self.CVDD * draws[0]
+            apex_angle_roll = abs(120 + 10 * draws[1])
+            if apex.root_order == 1:
+                primordium_angle_down = abs(45 + 10 * draws[2])
+            else:
+                primordium_angle_down = abs(70 + 10 * draws[2])
+            primordium_angle_roll = abs(5 + 5 * draws[3])
+        elif self.random:
             # The seed used to generate random values is defined according to a parameter random_choice and the index of the apex:
             np.random.seed(self.random_choice * apex.index())
             potential_radius = np.random.normal((apex.radius - self.Dmin / 2.) * self.RMD + self.Dmin / 2.,
@@ -433,9 +639,7 @@ class RootGrowthModelCoupled(RootGrowthModel):
             
             # We calculate a coefficient that will modify the rate of thickening according to soil temperature
             # assuming a linear relationship (this is equivalent as the calculation of "growth degree-days):
-            thickening_rate = thickening_rate * self.temperature_modification(process_at_T_ref=self.process_at_T_ref,
-                                                                    soil_temperature=segment.soil_temperature,
-                                                                    T_ref=self.T_ref, A=self.A, B=self.B, C=self.C)
+            thickening_rate = thickening_rate * self.temperature_time_adjustment(segment.soil_temperature)
             segment.theoretical_radius = segment.radius * (1 + thickening_rate * self.time_step_in_seconds)
             if segment.theoretical_radius > self.nodule_max_radius:
                 segment.potential_radius = self.nodule_max_radius
@@ -466,54 +670,67 @@ class RootGrowthModelCoupled(RootGrowthModel):
 
         # We calculate a coefficient that will modify the different "ages" experienced by roots according to soil
         # temperature assuming a linear relationship (this is equivalent as the calculation of "growth degree-days):
-        temperature_time_adjustment = self.temperature_modification(process_at_T_ref=self.process_at_T_ref,
-                                                                    soil_temperature=segment.soil_temperature,
-                                                                    T_ref=self.T_ref, A=self.A, B=self.B, C=self.C)
+        temperature_time_adjustment = self.temperature_time_adjustment(segment.soil_temperature)
 
         # CHECKING WHETHER THE APEX OF THE ROOT AXIS HAS STOPPED GROWING:
         # ---------------------------------------------------------------
 
-        # We look at the apex of the axis to which the segment belongs (i.e. we get the last element of all the Descendants):
-        index_apex = self.g.Descendants(segment.index())[-1]
-        apex = self.g.node(index_apex)
-        # print("For segment", segment.index(), "the terminal index is", index_apex, "and has the type", apex.label)
+        # We look at the type of the apex of the axis to which the segment belongs (i.e. the last element of all the
+        # Descendants), which is directly provided by the axis index from the property column:
+        apex_type = self.axis_index.apex_type(segment.index())
         # Depending on the type of the apex, we adjust the type of the segment on the same axis:
-        if apex.type == "Just_stopped":
+        if apex_type == "Just_stopped":
             segment.type = "Just_stopped"
-        elif apex.type == "Stopped":
+        elif apex_type == "Stopped":
             segment.type = "Stopped"
 
         # CHECKING POSSIBLE ROOT SEGMENT DEATH:
         # -------------------------------------
 
+        # The children of the segment are directly provided by the axis index, i.e. the next element on the same axis
+        # and the first elements of the lateral roots borne by the segment. As children are covered before their
+        # parent, their properties already correspond to this time step and are read in the property dictionaries:
+        props = self.g.properties()
+        children_type = props["type"]
+        children_length = props["length"]
+        children_radius = props["radius"]
+        children_potential_radius = props["potential_radius"]
+        children_theoretical_radius = props["theoretical_radius"]
+        children_time_since_death = props["actual_time_since_death"]
+        successor = self.axis_index.successor_of(segment.index())
+        lateral_children = self.axis_index.laterals_of(segment.index())
+
+        # If there is a child belonging to the same axis:
+        if successor is not None:
+            # Then we record the THEORETICAL section of this child:
+            son_section = children_theoretical_radius[successor] ** 2 * pi
+            # # Then we record the section of this child:
+            # son_section = child.radius * child.radius * pi
+
         # For each child of the segment:
-        for child in segment.children():
+        for child in lateral_children + ([successor] if successor is not None else []):
 
             # Then we add one child to the actual number of children:
             number_of_actual_children += 1
 
-            if child.radius < 0. or child.potential_radius < 0.:
-                print("!!! ERROR: the radius of the element", child.index(), "is negative!")
-            # If the child belongs to the same axis:
-            if child.edge_type == '<':
-                # Then we record the THEORETICAL section of this child:
-                son_section = child.theoretical_radius ** 2 * pi
-                # # Then we record the section of this child:
-                # son_section = child.radius * child.radius * pi
-            # Otherwise if the child is the element of a lateral root AND if this lateral root has already emerged
-            # AND the lateral element is not a nodule:
-            elif child.edge_type == '+' and child.length > 0. and child.type != "Root_nodule":
-                # We add the POTENTIAL section of this child to a sum of lateral sections:
-                sum_of_lateral_sections += child.theoretical_radius ** 2 * pi
-                # # We add the section of this child to a sum of lateral sections:
-                # sum_of_lateral_sections += child.radius ** 2 * pi
+            if children_radius[child] < 0. or children_potential_radius[child] < 0.:
+                self.diagnostics.record("ERROR: negative radius", child)
 
             # If this child has just died or was already dead:
-            if child.type == "Just_dead" or child.type == "Dead":
+            if children_type[child] == "Just_dead" or children_type[child] == "Dead":
                 # Then we add one dead child to the death count:
                 death_count += 1
                 # And we record the exact time since death:
-                list_of_times_since_death.append(child.actual_time_since_death)
+                list_of_times_since_death.append(children_time_since_death[child])
+
+        # For each child that is the element of a lateral root, if this lateral root has already emerged
+        # AND the lateral element is not a nodule:
+        for child in lateral_children:
+            if children_length[child] > 0. and children_type[child] != "Root_nodule":
+                # We add the POTENTIAL section of this child to a sum of lateral sections:
+                sum_of_lateral_sections += children_theoretical_radius[child] ** 2 * pi
+                # # We add the section of this child to a sum of lateral sections:
+                # sum_of_lateral_sections += child.radius ** 2 * pi
 
         # If each child in the list of children has been recognized as dead or just dead:
         if death_count == number_of_actual_children:
@@ -553,9 +770,7 @@ class RootGrowthModelCoupled(RootGrowthModel):
 
                 # We calculate a coefficient that will modify the rate of thickening according to soil temperature
                 # assuming a linear relationship (this is equivalent as the calculation of "growth degree-days):
-                thickening_rate = thickening_rate * self.temperature_modification(process_at_T_ref=self.process_at_T_ref,
-                                                                    soil_temperature=segment.soil_temperature,
-                                                                    T_ref=self.T_ref, A=self.A, B=self.B, C=self.C)
+                thickening_rate = thickening_rate * self.temperature_time_adjustment(segment.soil_temperature)
                 # The maximal possible new radius according to this regulation is therefore:
                 new_radius_max = (1 + thickening_rate * self.time_step_in_seconds) * segment.initial_radius
                 # If the potential new radius is higher than the maximal new radius:
@@ -626,23 +841,118 @@ class RootGrowthModelCoupled(RootGrowthModel):
 
         # TODO FOR TRISTAN: In a second step, you may consider how the emergence of primordia may depend on N availability in the root or in the soil.
 
+        # The structure of the elements is about to change, so that amounts cumulated along the axes become outdated:
+        self.axis_index.invalidate()
+
         # PROCEEDING TO ACTUAL GROWTH:
         # -----------------------------
+        if self.growth_workers > 1 and "fork" in multiprocessing.get_all_start_methods():
+            # The seminal and adventitious roots only interact with the rest of the root system through the consumptions
+            # they induce in supplying elements, so that each of their subtrees can be covered by a different process:
+            thickening_consumption, elongation_shares = self.actual_growth_in_workers(
+                self.axis_index.subtrees(bearing_types=SUBTREE_BEARING_TYPES))
+        else:
+            # We have to cover each vertex from the apices up to the base one time, using the post-order plan kept
+            # by the axis index, which is only composed again when new elements have been added:
+            thickening_consumption, elongation_shares = self.actual_growth_of_elements(self.axis_index.post_order())
+
+        # REGISTERING THE COSTS FOR ELONGATION:
+        # The costs of elongation of all elements are distributed at once among the elements that have provided hexose
+        # and amino acids for sustaining their elongation:
+        supplying_elements, hexose_contributions, amino_acids_contributions = self.supply_zones.distribute(elongation_shares)
+        consumption = ScatterAdd(GROWTH_CONSUMPTION_PROPERTIES)
+        consumption.extend("hexose_consumption_by_growth_amount", supplying_elements, hexose_contributions)
+        consumption.extend("hexose_consumption_by_growth", supplying_elements, hexose_contributions / self.time_step_in_seconds)
+        consumption.extend("amino_acids_consumption_by_growth_amount", supplying_elements, amino_acids_contributions)
+        consumption.extend("amino_acids_consumption_by_growth", supplying_elements, amino_acids_contributions / self.time_step_in_seconds)
+        consumption.extend("resp_growth", supplying_elements, hexose_contributions * (1 - self.yield_growth) * 6.)
+
+        # The costs of thickening recorded while covering the elements are added, and all consumptions by growth are
+        # finally added to the properties of the elements with a single scatter-add:
+        consumption.merge(thickening_consumption)
+        consumption.apply(self.g.properties())
+
+    def actual_growth_in_workers(self, parts):
+        """
+        This function performs the actual growth of independent parts of the root system in forked worker processes.
+        The new values of the properties of the grown elements are written back in the MTG, part by part, and the
+        consumptions and elongation shares of all parts are merged, always in the order of the parts.
+        :param parts: the lists of indices of the elements of each part, in post-order
+        :return: the merged buffer of the increments of the consumption properties, and the merged elongation shares
+        (see actual_growth_of_elements)
+        """
+        global _forked_growth_model
+        parts = [part for part in parts if part]
+        _forked_growth_model = self
+        try:
+            with multiprocessing.get_context("fork").Pool(processes=min(self.growth_workers, len(parts))) as pool:
+                results = pool.map(_actual_growth_of_subtree, parts)
+        finally:
+            _forked_growth_model = None
+
+        props = self.g.properties()
+        consumption = ScatterAdd(GROWTH_CONSUMPTION_PROPERTIES)
+        elongation_shares = {}
+        for columns, part_consumption, part_elongation_shares, part_diagnostics in results:
+            for name, values in columns.items():
+                props.setdefault(name, {}).update(values)
+            consumption.merge(part_consumption)
+            elongation_shares.update(part_elongation_shares)
+            self.diagnostics.merge(part_diagnostics)
+        return consumption, elongation_shares
+
+    def possible_increases_in_volume(self, vids):
+        """
+        This function computes, for a set of elements and with a single call of the corresponding kernel for each type
+        of growth, the increases in volume by elongation and by thickening that could be achieved with the hexose and
+        amino acids available for each type of growth, according to the most limiting factor between C and N.
+        Resources are only considered for elongation if the length of the element can increase, and for thickening if
+        its radius can increase.
+        :param vids: the indices of the elements
+        :return: the arrays of possible increases in volume by elongation and by thickening (m3), aligned on vids
+        """
+        props = self.g.properties()
+        vids = list(vids)
+        elongation_possible = gather(props["potential_length"], vids) > gather(props["length"], vids)
+        thickening_possible = gather(props["potential_radius"], vids) > gather(props["radius"], vids)
+        root_tissue_density = gather(props["root_tissue_density"], vids)
+        increases = []
+        for possible, hexose, amino_acids in (
+                (elongation_possible, "hexose_possibly_required_for_elongation", "amino_acids_possibly_required_for_elongation"),
+                (thickening_possible, "hexose_available_for_thickening", "amino_acids_available_for_thickening")):
+            # Elements that will not grow may have a nil density, and their possible increase is not used:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                increases.append(self.kernels.possible_increase_in_volume(
+                    np.where(possible, gather(props[hexose], vids), 0.), np.where(possible, gather(props[amino_acids], vids), 0.),
+                    root_tissue_density, self.struct_mass_C_content, self.struct_mass_N_content, self.yield_growth,
+                    self.yield_growth_N, self.r_C_AA, self.r_Nm_AA))
+        return increases
+
+    def actual_growth_of_elements(self, vids):
+        """
+        This function performs the actual growth of a set of elements, as described in
+        actual_growth_and_corresponding_respiration. The consumptions of hexose and amino acids by growth and the growth
+        respiration are not written in the elements, but returned, so that they can be added to the elements at once.
+        :param vids: the indices of the elements, in post-order
+        :return: the buffer of the increments of the consumption properties (see ScatterAdd), and a dictionary giving,
+        for each elongated element, the fractions of the hexose and amino acids available in its supplying zone that
+        have been consumed by elongation
+        """
+        props = self.g.properties()
+        consumption = ScatterAdd(GROWTH_CONSUMPTION_PROPERTIES)
+        elongation_shares = {}
+        # The increases in volume that the hexose and amino acids available for elongation and for thickening would
+        # allow are computed for all elements at once:
+        possible_increase_by_elongation, possible_increase_by_thickening = self.possible_increases_in_volume(vids)
 
-        # We have to cover each vertex from the apices up to the base one time:
-        root_gen = self.g.component_roots_at_scale_iter(self.g.root, scale=1)
-        root = next(root_gen)
-        # We cover all the vertices in the MTG, from the tips to the base:
-        for vid in post_order(self.g, root):
+        for position, vid in enumerate(vids):
 
             # n represents the current root element:
             n = self.g.node(vid)
 
             # We calculate a coefficient that will modify the different "ages" experienced by roots according to soil
             # temperature assuming a linear relationship (this is equivalent as the calculation of "growth degree-days):
-            temperature_time_adjustment = self.temperature_modification(process_at_T_ref=self.process_at_T_ref,
-                                                                    soil_temperature=n.soil_temperature,
-                                                                    T_ref=self.T_ref, A=self.A, B=self.B, C=self.C)
+            temperature_time_adjustment = self.temperature_time_adjustment(n.soil_temperature)
     
             # AVOIDANCE OF UNWANTED CASES:
             # -----------------------------
@@ -671,13 +981,11 @@ class RootGrowthModelCoupled(RootGrowthModel):
                                      * n.root_tissue_density * self.struct_mass_C_content / self.yield_growth * 1 / 6.
             # We verify that this potential growth demand is positive:
             if n.hexose_growth_demand < 0.:
-                print("!!! ERROR: a negative growth demand of", n.hexose_growth_demand,
-                      "was calculated for the element", n.index(), "of class", n.label)
-                print("The initial volume is", initial_volume, "the potential volume is", potential_volume)
-                print("The initial length was", n.initial_length, "and the potential length was",
-                      n.potential_length)
-                print("The initial radius was", n.initial_radius, "and the potential radius was",
-                      n.potential_radius)
+                self.diagnostics.record("ERROR: negative growth demand", n.index(), label=n.label,
+                                        hexose_growth_demand=n.hexose_growth_demand,
+                                        initial_volume=initial_volume, potential_volume=potential_volume,
+                                        initial_length=n.initial_length, potential_length=n.potential_length,
+                                        initial_radius=n.initial_radius, potential_radius=n.potential_radius)
                 n.hexose_growth_demand = 0.
                 # In such case, we just pass to the next element in the iteration:
                 continue
@@ -690,13 +998,11 @@ class RootGrowthModelCoupled(RootGrowthModel):
                                                                 self.struct_mass_C_content / self.yield_growth / self.r_C_AA)
             # We verify that this potential growth demand is positive:
             if n.amino_acids_growth_demand < 0.:
-                print("!!! ERROR: a negative growth demand for amino acids of", n.amino_acids_growth_demand,
-                      "was calculated for the element", n.index(), "of class", n.label)
-                print("The initial volume is", initial_volume, "the potential volume is", potential_volume)
-                print("The initial length was", n.initial_length, "and the potential length was",
-                      n.potential_length)
-                print("The initial radius was", n.initial_radius, "and the potential radius was",
-                      n.potential_radius)
+                self.diagnostics.record("ERROR: negative growth demand for amino acids", n.index(), label=n.label,
+                                        amino_acids_growth_demand=n.amino_acids_growth_demand,
+                                        initial_volume=initial_volume, potential_volume=potential_volume,
+                                        initial_length=n.initial_length, potential_length=n.potential_length,
+                                        initial_radius=n.initial_radius, potential_radius=n.potential_radius)
                 n.amino_acids_growth_demand = 0.
                 # In such case, we just pass to the next element in the iteration:
                 continue
@@ -716,10 +1022,6 @@ class RootGrowthModelCoupled(RootGrowthModel):
             if n.potential_length > n.length:
                 hexose_possibly_required_for_elongation = n.hexose_possibly_required_for_elongation
                 amino_acids_possibly_required_for_elongation = n.amino_acids_possibly_required_for_elongation
-                list_of_elongation_supporting_elements = n.list_of_elongation_supporting_elements
-                list_of_elongation_supporting_elements_hexose = n.list_of_elongation_supporting_elements_hexose
-                list_of_elongation_supporting_elements_amino_acids = n.list_of_elongation_supporting_elements_amino_acids
-                list_of_elongation_supporting_elements_mass = n.list_of_elongation_supporting_elements_mass
             
             # If radial growth is possible:
             if n.potential_radius > n.radius:
@@ -743,15 +1045,9 @@ class RootGrowthModelCoupled(RootGrowthModel):
             # ---------------------------------------
 
             # We calculate the maximal possible length of the root element according to all the hexose available for elongation:
-            prossible_volume_increase_C_hexose = hexose_possibly_required_for_elongation * 6. \
-                         / (n.root_tissue_density * self.struct_mass_C_content) * self.yield_growth
-            prossible_volume_increase_C_AA = amino_acids_possibly_required_for_elongation * self.r_C_AA \
-                         / (n.root_tissue_density * self.struct_mass_C_content) * self.yield_growth
-            volume_max_C = initial_volume + prossible_volume_increase_C_hexose + prossible_volume_increase_C_AA
-            volume_max_N = initial_volume + amino_acids_possibly_required_for_elongation * self.r_Nm_AA \
-                         / (n.root_tissue_density * self.struct_mass_N_content) * self.yield_growth_N
             # We account for the minimal volume defining the most limiting factor between C and N
-            length_max = min(volume_max_C, volume_max_N) / (pi * n.initial_radius ** 2)
+            volume_max = initial_volume + float(possible_increase_by_elongation[position])
+            length_max = volume_max / (pi * n.initial_radius ** 2)
 
             # If the element can elongate:
             if n.potential_length > n.initial_length:
@@ -779,26 +1075,13 @@ class RootGrowthModelCoupled(RootGrowthModel):
                 if n.length > n.initial_length:
 
                     # REGISTERING THE COSTS FOR ELONGATION:
-                    # We cover each of the elements that have provided hexose for sustaining the elongation of element n:
-                    for i in range(0, len(list_of_elongation_supporting_elements)):
-                        index = list_of_elongation_supporting_elements[i]
-                        supplying_element = self.g.node(index)
-                        # We define the actual contribution of the current element based on total hexose consumption by growth
-                        # of element n and the relative contribution of the current element to the pool of the available hexose:
-                        hexose_actual_contribution_to_elongation = hexose_consumption_by_elongation \
-                                                                   * list_of_elongation_supporting_elements_hexose[
-                                                                       i] / hexose_possibly_required_for_elongation
-                        amino_acids_actual_contribution_to_elongation = amino_acids_consumption_by_elongation \
-                                                                   * list_of_elongation_supporting_elements_amino_acids[
-                                                                       i] / amino_acids_possibly_required_for_elongation
-                        # The amount of hexose used for growth in this element is increased:
-                        supplying_element.hexose_consumption_by_growth_amount += hexose_actual_contribution_to_elongation
-                        supplying_element.hexose_consumption_by_growth += hexose_actual_contribution_to_elongation / self.time_step_in_seconds
-                        # The amount of amino acids used for growth in this element is increased:
-                        supplying_element.amino_acids_consumption_by_growth_amount += amino_acids_actual_contribution_to_elongation
-                        supplying_element.amino_acids_consumption_by_growth += amino_acids_actual_contribution_to_elongation / self.time_step_in_seconds
-                        # And the amount of hexose that has been used for growth respiration is calculated and transformed into moles of CO2:
-                        supplying_element.resp_growth += hexose_actual_contribution_to_elongation * (1 - self.yield_growth) * 6.
+                    # We record the fractions of the hexose and amino acids available in the supplying zone that have
+                    # been consumed, each supplying element contributing in proportion to the amount it can provide:
+                    elongation_shares[vid] = (
+                        hexose_consumption_by_elongation / hexose_possibly_required_for_elongation
+                        if hexose_possibly_required_for_elongation != 0. else 0.,
+                        amino_acids_consumption_by_elongation / amino_acids_possibly_required_for_elongation
+                        if amino_acids_possibly_required_for_elongation != 0. else 0.)
 
             # ACTUAL RADIAL GROWTH IS THEN CONSIDERED:
             # -----------------------------------------
@@ -806,20 +1089,11 @@ class RootGrowthModelCoupled(RootGrowthModel):
             if n.potential_radius > n.initial_radius:
                 # CALCULATING ACTUAL THICKENING:
                 # We calculate the increase in volume that can be achieved with the amount of hexose available:
-                possible_radial_increase_in_volume_C_hexose = \
-                    remaining_hexose_for_thickening * 6. * self.yield_growth \
-                    / (n.root_tissue_density * self.struct_mass_C_content)
-                possible_radial_increase_in_volume_C_AA = \
-                    remaining_amino_acids_for_thickening * self.r_C_AA * self.yield_growth \
-                    / (n.root_tissue_density * self.struct_mass_C_content)
-                possible_radial_increase_in_volume_C = possible_radial_increase_in_volume_C_hexose + possible_radial_increase_in_volume_C_AA
-                possible_radial_increase_in_volume_N = \
-                    remaining_amino_acids_for_thickening * self.r_Nm_AA * self.yield_growth_N \
-                    / (n.root_tissue_density * self.struct_mass_N_content)
+                possible_radial_increase_in_volume = possible_increase_by_thickening[position]
                 # We calculate the maximal possible volume based on the volume of the new cylinder after elongation
                 # and the increase in volume that could be achieved by consuming the first limiting factor between hexose and amino acids:
 
-                volume_max = self.volume_from_radius_and_length(n, n.initial_radius, n.length) + min(possible_radial_increase_in_volume_C, possible_radial_increase_in_volume_N)
+                volume_max = self.volume_from_radius_and_length(n, n.initial_radius, n.length) + float(possible_radial_increase_in_volume)
                 # We then calculate the corresponding new possible radius corresponding to this maximum volume:
                 if n.type == "Root_nodule":
                     # If the element corresponds to a nodule, then it we calculate the radius of a theoretical sphere:
@@ -828,10 +1102,8 @@ class RootGrowthModelCoupled(RootGrowthModel):
                     # Otherwise, we calculate the radius of a cylinder:
                     possible_radius = sqrt(volume_max / (n.length * pi))
                 if possible_radius < 0.9999 * n.initial_radius:  # We authorize a difference of 0.01% due to calculation errors!
-                    print("!!! ERROR: the calculated new radius of element", n.index(),
-                          "is lower than the initial one!")
-                    print("The possible radius was", possible_radius, "and the initial radius was",
-                          n.initial_radius)
+                    self.diagnostics.record("ERROR: new radius lower than the initial one", n.index(),
+                                            possible_radius=possible_radius, initial_radius=n.initial_radius)
 
                 # If the maximal radius that can be obtained is lower than the potential radius suggested by the potential growth module:
                 if possible_radius <= n.potential_radius:
@@ -863,45 +1135,45 @@ class RootGrowthModelCoupled(RootGrowthModel):
                 fraction_of_available_hexose_in_the_element = \
                     (n.C_hexose_root * n.initial_struct_mass) / hexose_available_for_thickening
                 # The amount of hexose used for growth in this element is increased:
-                n.hexose_consumption_by_growth_amount += \
-                    (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element)
-                n.hexose_consumption_by_growth += \
-                    (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element) / self.time_step_in_seconds
+                consumption.add("hexose_consumption_by_growth_amount", vid,
+                    (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element))
+                consumption.add("hexose_consumption_by_growth", vid,
+                    (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element) / self.time_step_in_seconds)
                 # Same calculation for amino acids costs
                 fraction_of_available_amino_acids_in_the_element = \
                     (n.AA * n.initial_struct_mass) / amino_acids_available_for_thickening
                 # The amount of amino acids used for growth in this element is increased:
-                n.amino_acids_consumption_by_growth_amount += \
-                    (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element)
-                n.hexose_consumption_by_growth += \
-                    (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element) / self.time_step_in_seconds
+                consumption.add("amino_acids_consumption_by_growth_amount", vid,
+                    (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element))
+                consumption.add("hexose_consumption_by_growth", vid,
+                    (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element) / self.time_step_in_seconds)
                 # And the amount of hexose that has been used for growth respiration is calculated and transformed into moles of CO2:
-                n.resp_growth += \
-                    (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element) \
-                    * (1 - self.yield_growth) * 6.
+                consumption.add("resp_growth", vid,
+                    (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element)
+                    * (1 - self.yield_growth) * 6.)
                 if n.type == "Root_nodule":
                     index_parent = self.g.Father(n.index(), EdgeType='+')
-                    parent = self.g.node(index_parent)
+                    parent_initial_struct_mass = props["initial_struct_mass"][index_parent]
                     fraction_of_available_hexose_in_the_element = \
-                        (parent.C_hexose_root * parent.initial_struct_mass) / hexose_available_for_thickening
+                        (props["C_hexose_root"][index_parent] * parent_initial_struct_mass) / hexose_available_for_thickening
                     # The amount of hexose used for growth in this element is increased:
-                    parent.hexose_consumption_by_growth_amount += \
-                        (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element)
-                    parent.hexose_consumption_by_growth += \
-                        (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element) / self.time_step_in_seconds
+                    consumption.add("hexose_consumption_by_growth_amount", index_parent,
+                        (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element))
+                    consumption.add("hexose_consumption_by_growth", index_parent,
+                        (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element) / self.time_step_in_seconds)
                     # Same calculation for amino acids costs
                     fraction_of_available_amino_acids_in_the_element = \
-                        (parent.AA * parent.initial_struct_mass) / amino_acids_available_for_thickening
+                        (props["AA"][index_parent] * parent_initial_struct_mass) / amino_acids_available_for_thickening
                     # The amount of hexose used for growth in this element is increased:
-                    parent.amino_acids_consumption_by_growth_amount += \
-                        (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element)
-                    parent.amino_acids_consumption_by_growth += \
-                        (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element) / self.time_step_in_seconds
+                    consumption.add("amino_acids_consumption_by_growth_amount", index_parent,
+                        (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element))
+                    consumption.add("amino_acids_consumption_by_growth", index_parent,
+                        (amino_acids_actual_contribution_to_thickening * fraction_of_available_amino_acids_in_the_element) / self.time_step_in_seconds)
                     
                     # And the amount of hexose that has been used for growth respiration is calculated and transformed into moles of CO2:
-                    parent.resp_growth += \
-                        (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element) \
-                        * (1 - self.yield_growth) * 6.
+                    consumption.add("resp_growth", index_parent,
+                        (hexose_actual_contribution_to_thickening * fraction_of_available_hexose_in_the_element)
+                        * (1 - self.yield_growth) * 6.)
 
             # RECORDING THE ACTUAL STRUCTURAL MODIFICATIONS:
             # -----------------------------------------------
@@ -912,13 +1184,13 @@ class RootGrowthModelCoupled(RootGrowthModel):
             n.struct_mass_produced = (n.volume - initial_volume) * n.root_tissue_density
 
             if n.struct_mass < n.initial_struct_mass and n.struct_mass_produced > 0.:
-                print(f"!!! ERROR during initialisation for initial struct mass, no concentrations will be updated on {n.index()}")
+                self.diagnostics.record("ERROR during initialisation for initial struct mass, no concentrations will be updated", n.index())
                 n.initial_struct_mass = n.struct_mass
 
             # Verification: we check that no negative length or struct_mass have been generated!
             if n.volume < 0:
-                print("!!! ERROR: the element", n.index(), "of class", n.label, "has a length of", n.length,
-                      "and a mass of", n.struct_mass)
+                self.diagnostics.record("ERROR: negative volume", n.index(), label=n.label, length=n.length,
+                                        struct_mass=n.struct_mass)
                 # We then reset all the geometrical values to their initial values:
                 n.length = n.initial_length
                 n.radius = n.initial_radius
@@ -964,6 +1236,8 @@ class RootGrowthModelCoupled(RootGrowthModel):
                 # The distance to the last ramification is increased:
                 n.dist_to_ramif += n.actual_elongation
 
+        return consumption, elongation_shares
+
 
     @postsegmentation
     @state
@@ -980,172 +1254,166 @@ class RootGrowthModelCoupled(RootGrowthModel):
 
         #  TODO FOR TRISTAN: In a second step, consider playing on the density / max. length of root hairs depending on the availability of N in the soil (if relevant)?
 
-        # We cover all the vertices in the MTG:
-        for vid in self.g.vertices_iter(scale=1):
-            # n represents the vertex:
-            n = self.g.node(vid)
-
-            # First, we ensure that the element has a positive length:
-            if n.length <= 0:
-                continue
-
-            # We also exclude nodules and dead elements from this computation:
-            if n.type == "Just_dead" or n.type == "Dead" or n.type == "Nodule":
-                continue
-
-            # # TODO: Check the consequences of avoiding apex in root hairs dynamics!
-            # # WE ALSO AVOID ROOT APICES - EVEN IF IN THEORY ROOT HAIRS MAY ALSO APPEAR ON THEM:
-            # if n.label == "Apex":
-            #     continue
-            # # Even if root hairs should have already emerge on that root apex, they will appear in the next step (or in a few steps)
-            # # when the element becomes a segment.
-
-            # We calculate the equivalent of a thermal time for the current time step:
-            temperature_time_adjustment = self.temperature_modification(process_at_T_ref=self.process_at_T_ref,
-                                                                    soil_temperature=n.soil_temperature,
-                                                                    T_ref=self.T_ref, A=self.A, B=self.B, C=self.C)
-            elapsed_thermal_time = self.time_step_in_seconds * temperature_time_adjustment
-
-            # We keep in memory the initial total mass of root hairs (possibly including dead hairs):
-            initial_root_hairs_struct_mass = n.root_hairs_struct_mass
-
-            # We calculate the total number of (newly formed) root hairs (if any) and update their age:
-            # ------------------------------------------------------------------------------------------
-            # CASE 1 - If the current element is completely included within the actual growing zone of the root at the root
-            # tip, the root hairs cannot have formed yet:
-            if n.distance_from_tip <= self.growing_zone_factor * n.radius:
-                # We stop here with the calculations and move to the next element:
-                continue
-            # CASE 2 - If all root hairs have already been formed:
-            if n.all_root_hairs_formed:
-                # Then we simply increase the time since root hairs emergence started:
-                n.actual_time_since_root_hairs_emergence_started += self.time_step_in_seconds
-                n.thermal_time_since_root_hairs_emergence_started += elapsed_thermal_time
-                n.actual_time_since_root_hairs_emergence_stopped += self.time_step_in_seconds
-                n.thermal_time_since_root_hairs_emergence_stopped += elapsed_thermal_time
-            # CASE 3 - If the theoretical growing zone limit is located somewhere within the root element:
-            elif n.distance_from_tip - n.length < self.growing_zone_factor * n.radius:
-                # We first record the previous length of the root hair zone within the element:
-                initial_length_with_hairs = n.actual_length_with_hairs
-                # Then the new length of the root hair zone is calculated:
-                n.actual_length_with_hairs = n.distance_from_tip - self.growing_zone_factor * n.radius
-                net_increase_in_root_hairs_length = n.actual_length_with_hairs - initial_length_with_hairs
-                # The corresponding number of root hairs is calculated:
-                n.total_root_hairs_number = self.root_hairs_density * n.radius * n.actual_length_with_hairs
-                # The time since root hair formation started is then calculated, using the recent increase in the length
-                # of the current root hair zone and the elongation rate of the corresponding root tip. The latter is
-                # calculated using the difference between the new distance_from_tip of the element and the previous one:
-                elongation_rate_in_actual_time = (n.distance_from_tip - n.former_distance_from_tip) / self.time_step_in_seconds
-                elongation_rate_in_thermal_time = (n.distance_from_tip - n.former_distance_from_tip) / elapsed_thermal_time
-                # SUBCASE 3.1 - If root hairs had not emerged at the previous time step:
-                if elongation_rate_in_actual_time > 0. and initial_length_with_hairs <= 0.:
-                    # We increase the time since root hairs emerged by only the fraction of the time step corresponding to the growth of hairs:
-                    n.actual_time_since_root_hairs_emergence_started += \
-                        self.time_step_in_seconds - net_increase_in_root_hairs_length / elongation_rate_in_actual_time
-                    n.thermal_time_since_root_hairs_emergence_started += \
-                        elapsed_thermal_time - net_increase_in_root_hairs_length / elongation_rate_in_thermal_time
-                # SUBCASE 3.2 - the hairs had already started to grow:
-                else:
-                    # Consequently, the full time elapsed during this time step can be added to the age:
-                    n.actual_time_since_root_hairs_emergence_started += self.time_step_in_seconds
-                    n.thermal_time_since_root_hairs_emergence_started += elapsed_thermal_time
-            # CASE 4 - the element is now "full" with root hairs as the limit of root elongation is located further down:
-            else:
-                # The actual time since root hairs emergence started is first increased:
-                n.actual_time_since_root_hairs_emergence_started += self.time_step_in_seconds
-                n.thermal_time_since_root_hairs_emergence_started += elapsed_thermal_time
-                # We then record the previous length of the root hair zone within the root element:
-                initial_length_with_hairs = n.actual_length_with_hairs
-                # And the new length of the root hair zone is necessarily the full length of the root element:
-                n.actual_length_with_hairs = n.length
-                net_increase_in_root_hairs_length = n.actual_length_with_hairs - initial_length_with_hairs
-                # The total number of hairs is defined according to the radius and total length of the element:
-                n.total_root_hairs_number = self.root_hairs_density * n.radius * n.length
-                # The elongation of the corresponding root tip is calculated as the difference between the new
-                # distance_from_tip of the element and the previous one:
-                elongation_rate_in_actual_time = (
-                                                         n.distance_from_tip - n.former_distance_from_tip) / self.time_step_in_seconds
-                elongation_rate_in_thermal_time = (
-                                                          n.distance_from_tip - n.former_distance_from_tip) / elapsed_thermal_time
-                # The actual time since root hairs emergence has stopped is then calculated:
-                if elongation_rate_in_actual_time > 0.:
-                    n.actual_time_since_root_hairs_emergence_stopped += \
-                        self.time_step_in_seconds - net_increase_in_root_hairs_length / elongation_rate_in_actual_time
-                    n.thermal_time_since_root_hairs_emergence_stopped += \
-                        elapsed_thermal_time - net_increase_in_root_hairs_length / elongation_rate_in_thermal_time
-                else:
-                    n.actual_time_since_root_hairs_emergence_stopped += self.time_step_in_seconds
-                    n.thermal_time_since_root_hairs_emergence_stopped += elapsed_thermal_time
-                # At this stage, all root hairs that could be formed have been formed, so we record this:
-                n.all_root_hairs_formed = True
-
-            # We now calculate the number of living and dead root hairs:
-            # -----------------------------------------------------------
-            # Root hairs are dying when the time since they emerged is higher than their lifespan.
-            # If the time since root hairs emergence started is lower than the lifespan,
-            # no root hair should be dead:
-            if n.thermal_time_since_root_hairs_emergence_started <= n.root_hairs_lifespan:
-                n.dead_root_hairs_number = 0.
-            # Otherwise, if the time since root hairs emergence stopped is higher than the lifespan:
-            elif n.thermal_time_since_root_hairs_emergence_stopped > n.root_hairs_lifespan:
-                # Then all the root hairs of the root element must now be dead:
-                n.dead_root_hairs_number = n.total_root_hairs_number
-            # In the intermediate case, there are currently both dead and living root hairs on the root element:
-            else:
-                # We assume that there is a linear decrease of root hair age between the first hair that has emerged
-                # and the last one that has emerged:
-                time_since_first_death = n.thermal_time_since_root_hairs_emergence_started - n.root_hairs_lifespan
-                dead_fraction = time_since_first_death / (n.thermal_time_since_root_hairs_emergence_started
-                                                          - n.thermal_time_since_root_hairs_emergence_stopped)
-                n.dead_root_hairs_number = n.total_root_hairs_number * dead_fraction
-
-            # In all cases, the number of the living root hairs is then calculated by difference with the total hair number:
-            n.living_root_hairs_number = n.total_root_hairs_number - n.dead_root_hairs_number
-
-            # We calculate the new average root hairs length, if needed:
-            # ----------------------------------------------------------
-            # If the root hairs had not reached their maximal length:
-            if n.root_hair_length < self.root_hair_max_length:
-                # The new potential root hairs length is calculated according to the elongation rate,
-                # corrected by temperature and modulated by the concentration of hexose (in the same way as for root
-                # elongation) available in the root hair zone on the root element:
-                cn_limitation = ((n.C_hexose_root / (n.C_hexose_root + self.Km_elongation)) + (n.AA / (n.AA + self.Km_elongation_amino_acids))) / 2
-                new_length = n.root_hair_length + self.root_hairs_elongation_rate * self.root_hair_radius * (n.actual_length_with_hairs / n.length) * cn_limitation * elapsed_thermal_time
-                
-                # If the new calculated length is higher than the maximal length:
-                if new_length > self.root_hair_max_length:
-                    # We set the root hairs length to the maximal length:
-                    n.root_hair_length = self.root_hair_max_length
-                else:
-                    # Otherwise, we record the new calculated length:
-                    n.root_hair_length = new_length
-
-            # We finally calculate the total external surface (m2), volume (m3) and mass (g) of root hairs:
-            # ----------------------------------------------------------------------------------------------
-            # In the calculation of surface, we consider the root hair to be a cylinder, and include the lateral section,
-            # but exclude the section of the cylinder at the tip:
-            n.root_hairs_volume = (self.root_hair_radius ** 2 * pi) * n.root_hair_length * n.total_root_hairs_number
-            n.root_hairs_struct_mass = n.root_hairs_volume * n.root_tissue_density
-            if n.total_root_hairs_number > 0.:
-                n.living_root_hairs_struct_mass = n.root_hairs_struct_mass * n.living_root_hairs_number \
-                                                  / n.total_root_hairs_number
-            else:
-                n.living_root_hairs_struct_mass = 0.
-
-            # We calculate the mass of hairs that has been effectively produced, including from root hairs that may have died since then:
-            # ----------------------------------------------------------------------------------------------------------------------------
-            # We calculate the new production as the difference between initial and final mass:
-            n.root_hairs_struct_mass_produced = n.root_hairs_struct_mass - initial_root_hairs_struct_mass
-
-            # We add the cost of producing the new living root hairs (if any) to the hexose consumption by growth:
-            hexose_consumption = n.root_hairs_struct_mass_produced * self.struct_mass_C_content / self.yield_growth / 6.
-            amino_acids_comsumption = n.root_hairs_struct_mass_produced * self.struct_mass_N_content / self.yield_growth_N / self.r_Nm_AA
-
-            n.hexose_consumption_by_growth_amount += hexose_consumption
-            n.hexose_consumption_by_growth += hexose_consumption / self.time_step_in_seconds
-            n.amino_acids_consumption_by_growth_amount += amino_acids_comsumption
-            n.amino_acids_consumption_by_growth += amino_acids_comsumption / self.time_step_in_seconds
-            n.resp_growth += hexose_consumption * 6. * (1 - self.yield_growth)
+        # All the elements are covered at once: their properties are gathered in arrays, the different cases of root
+        # hairs formation are distinguished by boolean masks, and the results are written back in the MTG.
+        props = self.g.properties()
+        vertices = self.g.vertices(scale=1)
+
+        # First, we ensure that the element has a positive length, and we also exclude nodules and dead elements:
+        length = gather(props["length"], vertices)
+        radius = gather(props["radius"], vertices)
+        distance_from_tip = gather(props["distance_from_tip"], vertices)
+        alive = np.fromiter((element_type not in ("Just_dead", "Dead", "Nodule") for element_type in map(props["type"].get, vertices)),
+                            dtype=bool, count=len(vertices))
+        # CASE 1 - If the current element is completely included within the actual growing zone of the root at the root
+        # tip, the root hairs cannot have formed yet, and the element is not considered either:
+        considered = (length > 0) & alive & ~(distance_from_tip <= self.growing_zone_factor * radius)
+        vids = np.array(vertices)[considered].tolist()
+        if len(vids) == 0:
+            return
+        length = length[considered]
+        radius = radius[considered]
+        distance_from_tip = distance_from_tip[considered]
+
+        # # TODO: Check the consequences of avoiding apex in root hairs dynamics!
+        # # WE ALSO AVOID ROOT APICES - EVEN IF IN THEORY ROOT HAIRS MAY ALSO APPEAR ON THEM:
+        # if n.label == "Apex":
+        #     continue
+        # # Even if root hairs should have already emerge on that root apex, they will appear in the next step (or in a few steps)
+        # # when the element becomes a segment.
+
+        # We calculate the equivalent of a thermal time for the current time step:
+        temperature_time_adjustment = self.temperature_time_adjustments(gather(props["soil_temperature"], vids))
+        elapsed_thermal_time = self.time_step_in_seconds * temperature_time_adjustment
+
+        # We keep in memory the initial total mass of root hairs (possibly including dead hairs):
+        initial_root_hairs_struct_mass = gather(props["root_hairs_struct_mass"], vids)
+
+        former_distance_from_tip = gather(props["former_distance_from_tip"], vids)
+        all_root_hairs_formed = gather(props["all_root_hairs_formed"], vids) > 0.
+        actual_length_with_hairs = gather(props["actual_length_with_hairs"], vids)
+        total_root_hairs_number = gather(props["total_root_hairs_number"], vids)
+        actual_time_since_started = gather(props["actual_time_since_root_hairs_emergence_started"], vids)
+        thermal_time_since_started = gather(props["thermal_time_since_root_hairs_emergence_started"], vids)
+        actual_time_since_stopped = gather(props["actual_time_since_root_hairs_emergence_stopped"], vids)
+        thermal_time_since_stopped = gather(props["thermal_time_since_root_hairs_emergence_stopped"], vids)
+
+        # We calculate the total number of (newly formed) root hairs (if any) and update their age:
+        # ------------------------------------------------------------------------------------------
+        growing_zone_limit = self.growing_zone_factor * radius
+        # CASE 2 - If all root hairs have already been formed:
+        case_2 = all_root_hairs_formed
+        # CASE 3 - If the theoretical growing zone limit is located somewhere within the root element:
+        case_3 = ~case_2 & (distance_from_tip - length < growing_zone_limit)
+        # CASE 4 - the element is now "full" with root hairs as the limit of root elongation is located further down:
+        case_4 = ~case_2 & ~case_3
+
+        # We first record the previous length of the root hair zone within the element:
+        initial_length_with_hairs = actual_length_with_hairs
+        # Then the new length of the root hair zone is calculated, and is necessarily the full length of the root element in case 4:
+        actual_length_with_hairs = np.where(case_3, distance_from_tip - growing_zone_limit,
+                                            np.where(case_4, length, actual_length_with_hairs))
+        net_increase_in_root_hairs_length = actual_length_with_hairs - initial_length_with_hairs
+        # The corresponding number of root hairs is calculated:
+        total_root_hairs_number = np.where(case_3 | case_4, self.root_hairs_density * radius * actual_length_with_hairs,
+                                           total_root_hairs_number)
+        # The elongation rate of the corresponding root tip is calculated using the difference between the new
+        # distance_from_tip of the element and the previous one:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            elongation_rate_in_actual_time = (distance_from_tip - former_distance_from_tip) / self.time_step_in_seconds
+            elongation_rate_in_thermal_time = (distance_from_tip - former_distance_from_tip) / elapsed_thermal_time
+            actual_time_correction = net_increase_in_root_hairs_length / elongation_rate_in_actual_time
+            thermal_time_correction = net_increase_in_root_hairs_length / elongation_rate_in_thermal_time
+
+        # SUBCASE 3.1 - If root hairs had not emerged at the previous time step, we increase the time since root hairs
+        # emerged by only the fraction of the time step corresponding to the growth of hairs. Otherwise (case 2,
+        # subcase 3.2 and case 4), the full time elapsed during this time step is added to the age:
+        subcase_3_1 = case_3 & (elongation_rate_in_actual_time > 0.) & (initial_length_with_hairs <= 0.)
+        actual_time_since_started += self.time_step_in_seconds - np.where(subcase_3_1, actual_time_correction, 0.)
+        thermal_time_since_started += elapsed_thermal_time - np.where(subcase_3_1, thermal_time_correction, 0.)
+        # The time since root hairs emergence stopped is increased in case 2 and case 4, and in case 4 only by the
+        # fraction of the time step after the last root hairs have been formed, if the root tip has elongated:
+        stopping = case_4 & (elongation_rate_in_actual_time > 0.)
+        actual_time_since_stopped += np.where(case_3, 0., self.time_step_in_seconds - np.where(stopping, actual_time_correction, 0.))
+        thermal_time_since_stopped += np.where(case_3, 0., elapsed_thermal_time - np.where(stopping, thermal_time_correction, 0.))
+        # At this stage, all root hairs that could be formed have been formed in case 4, so we record this:
+        all_root_hairs_formed = case_2 | case_4
+
+        # We now calculate the number of living and dead root hairs:
+        # -----------------------------------------------------------
+        # Root hairs are dying when the time since they emerged is higher than their lifespan. If the time since root
+        # hairs emergence started is lower than the lifespan, no root hair should be dead. Otherwise, if the time since
+        # root hairs emergence stopped is higher than the lifespan, all the root hairs of the root element must now be
+        # dead. In the intermediate case, we assume that there is a linear decrease of root hair age between the first
+        # hair that has emerged and the last one that has emerged:
+        root_hairs_lifespan = gather(props["root_hairs_lifespan"], vids)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            dead_fraction = (thermal_time_since_started - root_hairs_lifespan) / (thermal_time_since_started
+                                                                                   - thermal_time_since_stopped)
+        dead_root_hairs_number = np.where(thermal_time_since_started <= root_hairs_lifespan, 0.,
+                                          np.where(thermal_time_since_stopped > root_hairs_lifespan,
+                                                   total_root_hairs_number, total_root_hairs_number * dead_fraction))
+        # In all cases, the number of the living root hairs is then calculated by difference with the total hair number:
+        living_root_hairs_number = total_root_hairs_number - dead_root_hairs_number
+
+        # We calculate the new average root hairs length, if needed:
+        # ----------------------------------------------------------
+        # If the root hairs had not reached their maximal length, the new potential root hairs length is calculated
+        # according to the elongation rate, corrected by temperature and modulated by the concentration of hexose
+        # (in the same way as for root elongation) available in the root hair zone on the root element, and is
+        # bounded by the maximal length:
+        root_hair_length = gather(props["root_hair_length"], vids)
+        C_hexose_root = gather(props["C_hexose_root"], vids)
+        AA = gather(props["AA"], vids)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cn_limitation = self.kernels.elongation_limitation(C_hexose_root, AA, self.Km_elongation, self.Km_elongation_amino_acids)
+        root_hair_length = self.kernels.root_hairs_length(root_hair_length, self.root_hair_max_length,
+                                                          self.root_hairs_elongation_rate, self.root_hair_radius,
+                                                          actual_length_with_hairs / length, cn_limitation,
+                                                          elapsed_thermal_time)
+
+        # We finally calculate the total external surface (m2), volume (m3) and mass (g) of root hairs:
+        # ----------------------------------------------------------------------------------------------
+        # In the calculation of surface, we consider the root hair to be a cylinder, and include the lateral section,
+        # but exclude the section of the cylinder at the tip:
+        root_hairs_volume = (self.root_hair_radius ** 2 * pi) * root_hair_length * total_root_hairs_number
+        root_hairs_struct_mass = root_hairs_volume * gather(props["root_tissue_density"], vids)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            living_root_hairs_struct_mass = np.where(total_root_hairs_number > 0.,
+                                                     root_hairs_struct_mass * living_root_hairs_number / total_root_hairs_number, 0.)
+
+        # We calculate the mass of hairs that has been effectively produced, including from root hairs that may have died since then:
+        # ----------------------------------------------------------------------------------------------------------------------------
+        # We calculate the new production as the difference between initial and final mass:
+        root_hairs_struct_mass_produced = root_hairs_struct_mass - initial_root_hairs_struct_mass
+
+        # We add the cost of producing the new living root hairs (if any) to the hexose consumption by growth:
+        hexose_consumption = root_hairs_struct_mass_produced * self.struct_mass_C_content / self.yield_growth / 6.
+        amino_acids_comsumption = root_hairs_struct_mass_produced * self.struct_mass_N_content / self.yield_growth_N / self.r_Nm_AA
+
+        # We write all the results back in the MTG:
+        for name, values in (("actual_time_since_root_hairs_emergence_started", actual_time_since_started),
+                             ("thermal_time_since_root_hairs_emergence_started", thermal_time_since_started),
+                             ("actual_time_since_root_hairs_emergence_stopped", actual_time_since_stopped),
+                             ("thermal_time_since_root_hairs_emergence_stopped", thermal_time_since_stopped),
+                             ("actual_length_with_hairs", actual_length_with_hairs),
+                             ("total_root_hairs_number", total_root_hairs_number),
+                             ("all_root_hairs_formed", all_root_hairs_formed),
+                             ("dead_root_hairs_number", dead_root_hairs_number),
+                             ("living_root_hairs_number", living_root_hairs_number),
+                             ("root_hair_length", root_hair_length),
+                             ("root_hairs_volume", root_hairs_volume),
+                             ("root_hairs_struct_mass", root_hairs_struct_mass),
+                             ("living_root_hairs_struct_mass", living_root_hairs_struct_mass),
+                             ("root_hairs_struct_mass_produced", root_hairs_struct_mass_produced)):
+            scatter(props.setdefault(name, {}), vids, values)
+        for name, increment in (("hexose_consumption_by_growth_amount", hexose_consumption),
+                                ("hexose_consumption_by_growth", hexose_consumption / self.time_step_in_seconds),
+                                ("amino_acids_consumption_by_growth_amount", amino_acids_comsumption),
+                                ("amino_acids_consumption_by_growth", amino_acids_comsumption / self.time_step_in_seconds),
+                                ("resp_growth", hexose_consumption * 6. * (1 - self.yield_growth))):
+            values = props.setdefault(name, {})
+            scatter(values, vids, gather(values, vids) + increment)
 
     # Adding a new root element with pre-defined properties:
     def ADDING_A_CHILD(self, mother_element, edge_type='+', label='Apex', type='Normal_root_before_emergence',
@@ -1172,180 +1440,57 @@ class RootGrowthModelCoupled(RootGrowthModel):
         #  "ADDING_A_CHILD" your new variables that will either be set to 0 (nil properties) or be equal to that of the mother
         #  element.
 
-        # If nil_properties = True, then we set most of the properties of the new element to 0:
+        # If nil_properties = True, then we set most of the properties of the new element to 0, starting from the
+        # prototype of nil properties to which we add the properties specific to this new element, both being unpacked
+        # in the same call so that the properties are only copied once:
         if nil_properties:
             new_child = mother_element.add_child(edge_type=edge_type,
+                                                 **NIL_CHILD_PROPERTIES,
                                                  # Characteristics:
-                                                 # -----------------
                                                  label=label,
                                                  type=type,
                                                  root_order=root_order,
-                                                 # Authorizations and C requirements:
-                                                 # -----------------------------------
-                                                 lateral_root_emergence_possibility='Impossible',
-                                                 emergence_cost=0.,
                                                  # Geometry and topology:
-                                                 # -----------------------
                                                  angle_down=angle_down,
                                                  angle_roll=angle_roll,
                                                  # The length of the primordium is set to 0:
                                                  length=length,
                                                  radius=radius,
                                                  original_radius=radius,
-                                                 potential_length=0.,
                                                  theoretical_radius=radius,
                                                  potential_radius=radius,
-                                                 initial_length=0.,
                                                  initial_radius=radius,
-                                                 volume=0.,
                                                  root_tissue_density=self.new_root_tissue_density,
-                                                 dist_to_ramif=0.,
-                                                 distance_from_tip=0.,
-                                                 former_distance_from_tip=0.,
-                                                 actual_elongation=0.,
-                                                 actual_elongation_rate=0.,
-                                                 # Quantities and concentrations:
-                                                 # -------------------------------
-                                                 struct_mass=0.,
-                                                 initial_struct_mass=0.,
-                                                 C_hexose_root=0.,
                                                  # Root hairs:
-                                                 # ------------
                                                  root_hair_radius=self.root_hair_radius,
-                                                 root_hair_length=0.,
-                                                 actual_length_with_hairs=0.,
-                                                 living_root_hairs_number=0.,
-                                                 dead_root_hairs_number=0.,
-                                                 total_root_hairs_number=0.,
-                                                 actual_time_since_root_hairs_emergence_started=0.,
-                                                 thermal_time_since_root_hairs_emergence_started=0.,
-                                                 actual_time_since_root_hairs_emergence_stopped=0.,
-                                                 thermal_time_since_root_hairs_emergence_stopped=0.,
-                                                 all_root_hairs_formed=False,
                                                  root_hairs_lifespan=self.root_hairs_lifespan,
-                                                 root_hairs_struct_mass=0.,
-                                                 root_hairs_struct_mass_produced=0.,
-                                                 initial_living_root_hairs_struct_mass=0.,
-                                                 living_root_hairs_struct_mass=0.,
-                                                 # Fluxes:
-                                                 # --------
-                                                 resp_growth=0.,
-                                                 struct_mass_produced=0.,
-                                                 hexose_growth_demand=0.,
-                                                 hexose_consumption_by_growth_amount=0.,
-                                                 hexose_consumption_by_growth=0.,
-                                                 hexose_possibly_required_for_elongation=0.,
                                                  # Time indications:
-                                                 # ------------------
-                                                 soil_temperature=7.8,  # TODO change
                                                  growth_duration=self.GDs * (2 * radius) ** 2,
-                                                 life_duration=self.LDs * 2. * radius * self.new_root_tissue_density,
-                                                 actual_time_since_primordium_formation=0.,
-                                                 actual_time_since_emergence=0.,
-                                                 actual_time_since_cells_formation=0.,
-                                                 actual_potential_time_since_emergence=0.,
-                                                 actual_time_since_growth_stopped=0.,
-                                                 actual_time_since_death=0.,
-                                                 thermal_time_since_primordium_formation=0.,
-                                                 thermal_time_since_emergence=0.,
-                                                 thermal_time_since_cells_formation=0.,
-                                                 thermal_potential_time_since_emergence=0.,
-                                                 thermal_time_since_growth_stopped=0.,
-                                                 thermal_time_since_death=0.,
-                                                 AA=0.,
-                                                 amino_acids_consumption_by_growth_amount=0.,
-                                                 amino_acids_consumption_by_growth=0.,
-                                                 amino_acids_possibly_required_for_elongation=0.,
-                                                 amino_acids_growth_demand=0.
-                                                 )
-            
+                                                 life_duration=self.LDs * 2. * radius * self.new_root_tissue_density)
+            self.register_new_element(new_child)
             return new_child
 
-        # Otherwise, if identical_properties=True, then we copy most of the properties of the mother element in the new element:
+        # Otherwise, if identical_properties=True, then we copy most of the properties of the mother element in the new
+        # element, reading them directly in the property dictionaries of the MTG:
         elif identical_properties:
-            new_child = mother_element.add_child(edge_type=edge_type,
-                                                 # Characteristics:
-                                                 # -----------------
-                                                 label=label,
-                                                 type=type,
-                                                 root_order=root_order,
-                                                 # Authorizations and C requirements:
-                                                 # -----------------------------------
-                                                 lateral_root_emergence_possibility='Impossible',
-                                                 emergence_cost=0.,
-                                                 # Geometry and topology:
-                                                 # -----------------------
-                                                 angle_down=angle_down,
-                                                 angle_roll=angle_roll,
-                                                 # The length of the primordium is set to 0:
-                                                 length=length,
-                                                 radius=mother_element.radius,
-                                                 original_radius=mother_element.radius,
-                                                 potential_length=length,
-                                                 theoretical_radius=mother_element.theoretical_radius,
-                                                 potential_radius=mother_element.potential_radius,
-                                                 initial_length=length,
-                                                 initial_radius=mother_element.radius,
-                                                 volume=0.,
-                                                 root_tissue_density=mother_element.root_tissue_density,
-                                                 dist_to_ramif=mother_element.dist_to_ramif,
-                                                 distance_from_tip=mother_element.distance_from_tip,
-                                                 former_distance_from_tip=mother_element.former_distance_from_tip,
-                                                 actual_elongation=mother_element.actual_elongation,
-                                                 actual_elongation_rate=mother_element.actual_elongation_rate,
-                                                 # Quantities and concentrations:
-                                                 # -------------------------------
-                                                 struct_mass=mother_element.struct_mass,
-                                                 initial_struct_mass=mother_element.initial_struct_mass,
-                                                 C_hexose_root=mother_element.C_hexose_root,
-                                                 # Root hairs:
-                                                 # ------------
-                                                 root_hair_radius=mother_element.root_hair_radius,
-                                                 root_hair_length=mother_element.root_hair_length,
-                                                 actual_length_with_hairs=mother_element.actual_length_with_hairs,
-                                                 living_root_hairs_number=mother_element.living_root_hairs_number,
-                                                 dead_root_hairs_number=mother_element.dead_root_hairs_number,
-                                                 total_root_hairs_number=mother_element.total_root_hairs_number,
-                                                 actual_time_since_root_hairs_emergence_started=mother_element.actual_time_since_root_hairs_emergence_started,
-                                                 thermal_time_since_root_hairs_emergence_started=mother_element.thermal_time_since_root_hairs_emergence_started,
-                                                 actual_time_since_root_hairs_emergence_stopped=mother_element.actual_time_since_root_hairs_emergence_stopped,
-                                                 thermal_time_since_root_hairs_emergence_stopped=mother_element.thermal_time_since_root_hairs_emergence_stopped,
-                                                 all_root_hairs_formed=mother_element.all_root_hairs_formed,
-                                                 root_hairs_lifespan=mother_element.root_hairs_lifespan,
-                                                 root_hairs_struct_mass=mother_element.root_hairs_struct_mass,
-                                                 root_hairs_struct_mass_produced=mother_element.root_hairs_struct_mass_produced,
-                                                 living_root_hairs_struct_mass=mother_element.living_root_hairs_struct_mass,
-                                                 initial_living_root_hairs_struct_mass=mother_element.initial_living_root_hairs_struct_mass,
-                                                 # Fluxes:
-                                                 # -------
-                                                 resp_growth=mother_element.resp_growth,
-                                                 struct_mass_produced=mother_element.struct_mass_produced,
-                                                 hexose_growth_demand=mother_element.hexose_growth_demand,
-                                                 hexose_possibly_required_for_elongation=mother_element.hexose_possibly_required_for_elongation,
-                                                 hexose_consumption_by_growth_amount=mother_element.hexose_consumption_by_growth_amount,
-                                                 hexose_consumption_by_growth=mother_element.hexose_consumption_by_growth,
-                                                 # Time indications:
-                                                 # ------------------
-                                                 soil_temperature=mother_element.soil_temperature,
-                                                 growth_duration=mother_element.growth_duration,
-                                                 life_duration=mother_element.life_duration,
-                                                 actual_time_since_primordium_formation=mother_element.actual_time_since_primordium_formation,
-                                                 actual_time_since_emergence=mother_element.actual_time_since_emergence,
-                                                 actual_time_since_cells_formation=mother_element.actual_time_since_cells_formation,
-                                                 actual_time_since_growth_stopped=mother_element.actual_time_since_growth_stopped,
-                                                 actual_time_since_death=mother_element.actual_time_since_death,
-
-                                                 thermal_time_since_primordium_formation=mother_element.thermal_time_since_primordium_formation,
-                                                 thermal_time_since_emergence=mother_element.thermal_time_since_emergence,
-                                                 thermal_time_since_cells_formation=mother_element.thermal_time_since_cells_formation,
-                                                 thermal_potential_time_since_emergence=mother_element.thermal_potential_time_since_emergence,
-                                                 thermal_time_since_growth_stopped=mother_element.thermal_time_since_growth_stopped,
-                                                 thermal_time_since_death=mother_element.thermal_time_since_death,
-                                                 AA=mother_element.AA,
-                                                 amino_acids_consumption_by_growth_amount=0.,
-                                                 amino_acids_consumption_by_growth=0.,
-                                                 amino_acids_possibly_required_for_elongation=0.,
-                                                 amino_acids_growth_demand=0.
-                                                 )
-            
+            props = self.g.properties()
+            mother_index = mother_element.index()
+            properties = {name: props[name].get(mother_index) if name in props else None
+                          for name in IDENTICAL_CHILD_COPIED_PROPERTIES}
+            mother_radius = properties["radius"]
+            properties.update(IDENTICAL_CHILD_PROPERTIES,
+                              # Characteristics:
+                              label=label,
+                              type=type,
+                              root_order=root_order,
+                              # Geometry and topology:
+                              angle_down=angle_down,
+                              angle_roll=angle_roll,
+                              length=length,
+                              original_radius=mother_radius,
+                              potential_length=length,
+                              initial_length=length,
+                              initial_radius=mother_radius)
+            new_child = mother_element.add_child(edge_type=edge_type, **properties)
+            self.register_new_element(new_child)
             return new_child
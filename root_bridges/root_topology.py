@@ -0,0 +1,428 @@
+import numpy as np
+from openalea.mtg.traversal import pre_order
+
+from root_bridges.columns import gather
+
+
+class AxisIndex:
+    """
+    Partition of the root MTG into axes, i.e. sequences of elements successively connected by '<' edges and ordered
+    from the base of the axis to its apex. Each axis is borne by a mother element to which its first element is
+    connected by a '+' edge (None for the axis starting at the base of the root system).
+
+    All axes are stored end to end in a single layout, on which cumulated sums of volume, hexose and amino acids
+    amounts are computed once per time step. The zone of an axis that supplies the elongation of an apex can then be
+    found by binary search, instead of moving from father to father.
+
+    The index also provides a post-order plan of all elements (from the tips to the base), which is kept in memory
+    and only composed again when new elements have been added.
+
+    New elements that start a new axis (e.g. lateral primordia), or that extend the last axis of the layout, are
+    appended at the end of the layout without computing it again. The layout is otherwise only rebuilt once, when the
+    index is invalidated at the beginning of the next time step.
+    """
+
+    def __init__(self, g):
+        """
+        :param g: the root MTG
+        """
+        self.g = g
+        self.build()
+
+    def build(self):
+        """
+        Builds the axes of the whole MTG from scratch, covering the elements from the base to the tips.
+        """
+        self.axes = []
+        self.axis_of = {}
+        self.rank = {}
+        self.mother_of_axis = []
+        self.laterals_of_axis = []
+        self.lateral_axes_of = {}
+        self.plan = None
+        self.layout_up_to_date = False
+        self.values_up_to_date = False
+        self.buffers = {}
+        self.number_of_vertices = 0
+        root_gen = self.g.component_roots_at_scale_iter(self.g.root, scale=1)
+        root = next(root_gen)
+        for vid in pre_order(self.g, root):
+            self.add_element(vid)
+        # The number of vertices of the MTG is then followed as elements are registered, to detect cheaply the
+        # elements created without being registered:
+        self.number_of_vertices = self.g.nb_vertices()
+
+    def add_element(self, vid):
+        """
+        Registers a new element, which must be added after its parent.
+        An element connected by a '<' edge extends the axis of its parent, otherwise it starts a new axis.
+
+        :param vid: the index of the new element
+        """
+        parent = self.g.parent(vid)
+        self.number_of_vertices += 1
+        if parent is None or parent not in self.axis_of or self.g.edge_type(vid) != '<':
+            new_axis = len(self.axes)
+            self.axis_of[vid] = new_axis
+            self.rank[vid] = 0
+            self.axes.append([vid])
+            self.mother_of_axis.append(parent)
+            self.laterals_of_axis.append([])
+            # The new axis is recorded as a lateral of the axis bearing it, with the rank of its mother element:
+            if parent in self.axis_of:
+                self.laterals_of_axis[self.axis_of[parent]].append((self.rank[parent], new_axis))
+                self.lateral_axes_of.setdefault(parent, []).append(new_axis)
+        else:
+            axis = self.axis_of[parent]
+            self.axis_of[vid] = axis
+            self.rank[vid] = len(self.axes[axis])
+            self.axes[axis].append(vid)
+        self.plan = None
+        # A new axis is the last one of the layout, and an element extending the last axis ends the layout, so that
+        # they can be appended to it:
+        if self.layout_up_to_date and self.axis_of[vid] == len(self.axes) - 1:
+            self.append_to_layout(vid)
+        else:
+            self.layout_up_to_date = False
+            self.values_up_to_date = False
+
+    def append_to_layout(self, vid):
+        """
+        Appends an element at the end of the layout, and its values at the end of the cumulated sums if they are up to
+        date, without computing them again for the other elements.
+
+        :param vid: the index of the element, which must be the last element of the last axis
+        """
+        if self.rank[vid] == 0:
+            self.extend("axis_start", len(self.order))
+        self.position[vid] = len(self.order)
+        self.extend("order", vid)
+        if self.values_up_to_date:
+            props = self.g.properties()
+            contributing = props["length"].get(vid, 0.) > 0.
+            struct_mass = props["struct_mass"].get(vid, 0.)
+            volume = props["volume"].get(vid, 0.) if contributing else 0.
+            self.extend("contributing", contributing)
+            self.extend("volume", volume)
+            self.extend("struct_mass", struct_mass)
+            # The concentrations of new elements may not have been defined yet:
+            self.extend("hexose", props["C_hexose_root"].get(vid, 0.) * struct_mass)
+            self.extend("amino_acids", props["AA"].get(vid, 0.) * struct_mass)
+            self.extend("cumulated_volume", self.cumulated_volume[-1] + volume)
+
+    def extend(self, name, value):
+        """
+        Appends a value to one of the arrays of the layout, which is a view on a larger buffer enlarged only when full,
+        so that appending does not copy the whole array.
+
+        :param name: the name of the array
+        :param value: the value to be appended
+        """
+        values = getattr(self, name)
+        buffer = self.buffers.get(name)
+        if buffer is None or values.base is not buffer or len(values) == len(buffer):
+            buffer = np.empty(max(16, 2 * len(values)), dtype=values.dtype)
+            buffer[:len(values)] = values
+            self.buffers[name] = buffer
+        buffer[len(values)] = value
+        setattr(self, name, buffer[:len(values) + 1])
+
+    def post_order(self):
+        """
+        Provides the list of all elements in post-order, i.e. from the tips to the base, in the same order as
+        openalea.mtg.traversal.post_order: the lateral roots borne by an element are covered first, then the
+        element that follows it on the same axis, and finally the element itself.
+        The list is kept in memory and is only composed again when the topology has changed.
+
+        :return: the list of the indices of the elements
+        """
+        self.synchronize()
+        if self.plan is None:
+            plan = []
+            for axis, mother in enumerate(self.mother_of_axis):
+                if mother not in self.axis_of:
+                    self.cover(axis, plan)
+            self.plan = plan
+        return self.plan
+
+    def cover(self, axis, plan):
+        """
+        Adds to a plan all the elements of the subtree starting with an axis, in post-order.
+
+        :param axis: the number of the axis
+        :param plan: the list to which the indices of the elements are added
+        """
+        # Along an axis, all the lateral axes are covered first, from the base to the apex,
+        # and then the elements of the axis, from the apex to the base:
+        for _, lateral in sorted(self.laterals_of_axis[axis]):
+            self.cover(lateral, plan)
+        plan.extend(reversed(self.axes[axis]))
+
+    def subtrees(self, bearing_types):
+        """
+        Partitions all elements into the subtrees of the axes borne by elements of given types (e.g. the seminal and
+        adventitious roots borne by their supporting elements), and the remaining elements.
+        Each part is given in post-order, and the parts are always given in the same order for the same MTG.
+
+        :param bearing_types: the types of the elements bearing the axes to be separated
+        :return: the list of the parts, i.e. lists of indices of elements, starting with the remaining elements
+        """
+        element_type = self.g.property("type")
+        separated = []
+        in_subtrees = set()
+        # Mother axes are always numbered before the axes they bear, so that a subtree is never separated again
+        # from within a subtree already separated:
+        for axis, mother in enumerate(self.mother_of_axis):
+            if mother in self.axis_of and mother not in in_subtrees and element_type.get(mother) in bearing_types:
+                plan = []
+                self.cover(axis, plan)
+                separated.append(plan)
+                in_subtrees.update(plan)
+        remaining = [vid for vid in self.post_order() if vid not in in_subtrees]
+        return [remaining] + separated
+
+    def apex_of(self, vid):
+        """
+        Provides the element at the tip of the axis to which an element belongs, i.e. the last of its descendants
+        when covering them in pre-order. Like with g.Descendants(vid)[-1], if this apex already bears lateral
+        primordia, the tip of the last one is returned.
+
+        :param vid: the index of the element
+        :return: the index of the last descendant
+        """
+        tip = self.axes[self.axis_number(vid)][-1]
+        # As long as the tip bears lateral axes, we move to the tip of the last lateral axis formed on it:
+        while tip in self.lateral_axes_of:
+            tip = self.axes[self.lateral_axes_of[tip][-1]][-1]
+        return tip
+
+    def successor_of(self, vid):
+        """
+        Provides the child of an element connected by a '<' edge, i.e. the next element on the same axis.
+
+        :param vid: the index of the element
+        :return: the index of the successor, or None if the element is the tip of its axis
+        """
+        axis = self.axes[self.axis_number(vid)]
+        next_rank = self.rank[vid] + 1
+        return axis[next_rank] if next_rank < len(axis) else None
+
+    def laterals_of(self, vid):
+        """
+        Provides the children of an element connected by a '+' edge, i.e. the first elements of the lateral axes it
+        bears, in the order of their formation.
+
+        :param vid: the index of the element
+        :return: the list of the indices of the lateral children
+        """
+        self.axis_number(vid)
+        return [self.axes[axis][0] for axis in self.lateral_axes_of.get(vid, ())]
+
+    def apex_type(self, vid):
+        """
+        Provides the type of the element at the tip of the axis to which an element belongs (e.g. "Just_stopped" or
+        "Stopped" when the axis has stopped growing).
+
+        :param vid: the index of the element
+        :return: the type of the apex of the axis
+        """
+        return self.g.property("type").get(self.apex_of(vid))
+
+    def axis_number(self, vid):
+        """
+        Provides the number of the axis to which an element belongs, rebuilding the index from the MTG if this
+        element has been created without being registered.
+
+        :param vid: the index of the element
+        :return: the number of its axis
+        """
+        if vid not in self.axis_of:
+            self.build()
+        return self.axis_of[vid]
+
+    def synchronize(self):
+        """
+        Rebuilds the index from the MTG if some elements have been created without being registered.
+        """
+        if self.number_of_vertices != self.g.nb_vertices():
+            self.build()
+
+    def invalidate(self):
+        """
+        Declares that the properties of the elements have changed, e.g. at the beginning of a new time step, and
+        rebuilds the layout if elements have been inserted within it since the previous time step.
+        """
+        self.synchronize()
+        if not self.layout_up_to_date:
+            self.update_layout()
+        self.values_up_to_date = False
+
+    def update_layout(self):
+        """
+        Stores all the axes end to end, and records the position of each element in this layout.
+        """
+        self.synchronize()
+        order = []
+        self.axis_start = np.empty(len(self.axes), dtype=int)
+        for axis, elements in enumerate(self.axes):
+            self.axis_start[axis] = len(order)
+            order.extend(elements)
+        self.order = np.array(order, dtype=int)
+        self.position = dict(zip(order, range(len(order))))
+        self.buffers = {}
+        self.layout_up_to_date = True
+
+    def update_values(self):
+        """
+        Computes the cumulated sums of volume, hexose, amino acids and structural mass along the layout.
+        Only elements with a positive length contribute (e.g. NOT the elements of length 0 that support seminal or
+        adventitious roots).
+        """
+        if not self.layout_up_to_date:
+            self.update_layout()
+        props = self.g.properties()
+        order = self.order.tolist()
+        self.contributing = gather(props["length"], order) > 0.
+        self.volume = np.where(self.contributing, gather(props["volume"], order), 0.)
+        self.struct_mass = gather(props["struct_mass"], order)
+        self.hexose = gather(props["C_hexose_root"], order) * self.struct_mass
+        self.amino_acids = gather(props["AA"], order) * self.struct_mass
+        self.cumulated_volume = np.concatenate(([0.], np.cumsum(self.volume)))
+        self.values_up_to_date = True
+
+    def supplying_zone(self, vid, supplying_volume: float):
+        """
+        Finds the elements that supply a given volume, starting from the element vid and moving towards the base of
+        the root system, first along its axis and then along the mother axes.
+
+        :param vid: the index of the element from which the supplying zone starts (usually an apex)
+        :param supplying_volume: the volume to be covered (m3)
+        :return: the positions in the layout of the supplying elements, from vid to the base, and the fraction of each
+        element that is included in the zone (1 for all elements but possibly the last one)
+        """
+        if not self.values_up_to_date:
+            self.update_values()
+
+        positions = []
+        fractions = []
+        remaining_volume = supplying_volume
+        current = vid
+        # As long the remaining volume is not zero and there is an axis to move on:
+        while remaining_volume > 0. and current is not None:
+            axis = self.axis_of[current]
+            start = self.axis_start[axis]
+            end = self.position[current] + 1
+            available_volume = self.cumulated_volume[end] - self.cumulated_volume[start]
+            # If the whole axis below the current element cannot cover the remaining volume:
+            if available_volume < remaining_volume:
+                # Then all its contributing elements are fully included, and we move to the mother axis:
+                zone = np.arange(end - 1, start - 1, -1)
+                zone = zone[self.contributing[zone]]
+                positions.append(zone)
+                fractions.append(np.ones(len(zone)))
+                remaining_volume -= available_volume
+                current = self.mother_of_axis[axis]
+            else:
+                # Otherwise, we look for the last element to consider, which is only partly included:
+                last = start - 1 + np.searchsorted(self.cumulated_volume[start:end],
+                                                   self.cumulated_volume[end] - remaining_volume, side='right')
+                zone = np.arange(end - 1, last, -1)
+                zone = zone[self.contributing[zone]]
+                positions.append(zone)
+                fractions.append(np.ones(len(zone)))
+                partial_volume = remaining_volume - (self.cumulated_volume[end] - self.cumulated_volume[last + 1])
+                positions.append(np.array([last]))
+                fractions.append(np.array([partial_volume / self.volume[last]]))
+                remaining_volume = 0.
+
+        if not positions:
+            return np.array([], dtype=int), np.array([])
+        return np.concatenate(positions), np.concatenate(fractions)
+
+
+class SupplyZones:
+    """
+    Scratch storage of the elements supplying the elongation of each apex during a time step, in compressed sparse row
+    format: the indices of the supplying elements of all apices and their contributions in hexose, amino acids and
+    structural mass are stored end to end in flat arrays, the zone of each apex being delimited by offsets.
+    The arrays are kept and reused from one time step to the next, and are only enlarged when needed.
+    """
+
+    def __init__(self, capacity=1024):
+        """
+        :param capacity: the initial number of supplying elements that can be stored
+        """
+        self.indices = np.empty(capacity, dtype=int)
+        self.hexose = np.empty(capacity)
+        self.amino_acids = np.empty(capacity)
+        self.mass = np.empty(capacity)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all the zones recorded, e.g. at the beginning of a new time step, while keeping the arrays.
+        """
+        self.row_of = {}
+        self.offsets = [0]
+        self.size = 0
+
+    def reserve(self, size):
+        """
+        Enlarges the arrays so that they can store at least a given number of supplying elements.
+
+        :param size: the number of supplying elements to be stored
+        """
+        capacity = max(size, 2 * len(self.indices))
+        for name in ("indices", "hexose", "amino_acids", "mass"):
+            values = getattr(self, name)
+            enlarged = np.empty(capacity, dtype=values.dtype)
+            enlarged[:self.size] = values[:self.size]
+            setattr(self, name, enlarged)
+
+    def add(self, vid, indices, hexose, amino_acids, mass):
+        """
+        Records the supplying zone of an apex, which replaces any zone previously recorded for it.
+
+        :param vid: the index of the apex
+        :param indices: the indices of the supplying elements
+        :param hexose: the amounts of hexose that each supplying element can provide (mol of hexose)
+        :param amino_acids: the amounts of amino acids that each supplying element can provide (mol of amino acids)
+        :param mass: the structural mass from which each supplying element contributes (g)
+        """
+        end = self.size + len(indices)
+        if end > len(self.indices):
+            self.reserve(end)
+        self.indices[self.size:end] = indices
+        self.hexose[self.size:end] = hexose
+        self.amino_acids[self.size:end] = amino_acids
+        self.mass[self.size:end] = mass
+        self.row_of[vid] = len(self.offsets) - 1
+        self.offsets.append(end)
+        self.size = end
+
+    def distribute(self, shares):
+        """
+        Distributes the consumptions of a set of apices among their supplying elements, in proportion of the amounts
+        of hexose and amino acids provided by each supplying element, and sums the consumptions of each supplying
+        element with a single scatter-add.
+
+        :param shares: dictionary giving for each apex the fractions of the hexose and of the amino acids available
+        in its supplying zone that have been consumed
+        :return: the indices of the supplying elements, and their total consumptions of hexose and amino acids
+        """
+        vids = [vid for vid in shares if vid in self.row_of]
+        if not vids:
+            return np.array([], dtype=int), np.array([]), np.array([])
+        offsets = np.asarray(self.offsets)
+        rows = np.array([self.row_of[vid] for vid in vids], dtype=int)
+        starts = offsets[rows]
+        lengths = offsets[rows + 1] - starts
+        # We list the positions in the arrays of all the supplying elements of these apices, row after row:
+        first_positions = np.cumsum(lengths) - lengths
+        entries = np.repeat(starts - first_positions, lengths) + np.arange(lengths.sum())
+        hexose_shares, amino_acids_shares = np.array([shares[vid] for vid in vids], dtype=float).reshape(-1, 2).T
+        indices = self.indices[entries]
+        hexose = np.bincount(indices, weights=self.hexose[entries] * np.repeat(hexose_shares, lengths))
+        amino_acids = np.bincount(indices, weights=self.amino_acids[entries] * np.repeat(amino_acids_shares, lengths))
+        supplying_elements = np.unique(indices)
+        return supplying_elements, hexose[supplying_elements], amino_acids[supplying_elements]
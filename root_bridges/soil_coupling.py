@@ -0,0 +1,129 @@
+import numpy as np
+
+
+class VoxelIndex:
+    """
+    Persistent spatial index between the root elements and the voxels of the soil grid.
+
+    Each element is given a slot, in the order in which it has been registered, and the flat index of the voxel
+    containing it is stored in an array aligned on these slots. The index is only updated for the elements that have
+    been created or have grown, so that the mapping doesn't have to be computed again from the geometry of all elements
+    at each time step. Quantities of the elements can then be summed in voxels with a single bincount, and voxel values
+    taken back by elements with a single take.
+
+    The reverse mapping, giving the elements contained in each voxel, is stored in compressed sparse row format and is
+    only composed again when the index has changed.
+    """
+
+    def __init__(self, x1, y1, z1, capacity=1024):
+        """
+        :param x1, y1, z1: the arrays of the lower coordinates of the voxels, with the shape of the soil grid (m)
+        :param capacity: the initial number of elements that can be stored
+        """
+        self.shape = np.shape(x1)
+        self.size = int(np.prod(self.shape))
+        # We find the position of each voxel along each axis of the grid, whatever the order of the axes in the arrays:
+        self.lower_bounds = []
+        positions = []
+        for lower in (x1, y1, z1):
+            lower = np.ravel(lower)
+            bounds = np.unique(lower)
+            self.lower_bounds.append(bounds)
+            positions.append(np.searchsorted(bounds, lower))
+        self.voxel_at = np.empty([len(bounds) for bounds in self.lower_bounds], dtype=int)
+        self.voxel_at[tuple(positions)] = np.arange(self.size)
+
+        self.vids = []
+        self.slot_of = {}
+        self.voxel_of = np.empty(capacity, dtype=int)
+        self.offsets = None
+        self.elements = None
+        self.occupied = None
+
+    def locate(self, x, y, z):
+        """
+        Finds the flat indices of the voxels containing a set of points, the points outside the grid being attributed
+        to the closest voxel.
+
+        :param x, y, z: the arrays of coordinates of the points (m)
+        :return: the array of flat indices of the voxels
+        """
+        positions = []
+        for coordinates, bounds in zip((x, y, z), self.lower_bounds):
+            position = np.searchsorted(bounds, np.asarray(coordinates, dtype=float), side="right") - 1
+            positions.append(np.clip(position, 0, len(bounds) - 1))
+        return self.voxel_at[tuple(positions)]
+
+    def update(self, vids, x, y, z):
+        """
+        Registers new elements, or updates the voxels of elements already registered.
+
+        :param vids: the indices of the elements
+        :param x, y, z: the arrays of coordinates of the elements, e.g. of their middle points (m)
+        """
+        vids = list(vids)
+        if not vids:
+            return
+        new_vids = [vid for vid in vids if vid not in self.slot_of]
+        if new_vids:
+            end = len(self.vids) + len(new_vids)
+            if end > len(self.voxel_of):
+                enlarged = np.empty(max(end, 2 * len(self.voxel_of)), dtype=int)
+                enlarged[:len(self.vids)] = self.voxel_of[:len(self.vids)]
+                self.voxel_of = enlarged
+            self.slot_of.update(zip(new_vids, range(len(self.vids), end)))
+            self.vids.extend(new_vids)
+        slots = np.fromiter(map(self.slot_of.get, vids), dtype=int, count=len(vids))
+        voxels = self.locate(x, y, z)
+        if new_vids or not np.array_equal(self.voxel_of[slots], voxels):
+            self.offsets = None
+            self.occupied = None
+        self.voxel_of[slots] = voxels
+
+    def voxels(self):
+        """
+        :return: the array of flat voxel indices of the registered elements, aligned on the list of elements vids
+        """
+        return self.voxel_of[:len(self.vids)]
+
+    def occupied_voxels(self):
+        """
+        Provides the voxels containing at least one element, i.e. the only voxels exchanging with roots. The array is
+        kept in memory and is only computed again when the index has changed.
+
+        :return: the sorted array of flat indices of the occupied voxels
+        """
+        if self.occupied is None:
+            self.occupied = np.unique(self.voxels())
+        return self.occupied
+
+    def sum_in_voxels(self, values):
+        """
+        Sums quantities of the elements in the voxels containing them (e.g. fluxes exchanged with the soil).
+
+        :param values: the array of quantities, aligned on the list of elements vids
+        :return: the array of sums, with the shape of the soil grid
+        """
+        return np.bincount(self.voxels(), weights=values, minlength=self.size).reshape(self.shape)
+
+    def take_from_voxels(self, voxel_values):
+        """
+        Provides to each element the value of the voxel containing it (e.g. a soil concentration).
+
+        :param voxel_values: the array of voxel values, with the shape of the soil grid
+        :return: the array of values, aligned on the list of elements vids
+        """
+        return np.take(np.ravel(voxel_values), self.voxels())
+
+    def elements_in(self, voxel):
+        """
+        Provides the elements contained in a voxel, from the compressed sparse row storage of the reverse mapping.
+
+        :param voxel: the flat index of the voxel
+        :return: the list of the indices of the elements
+        """
+        if self.offsets is None:
+            voxels = self.voxels()
+            self.elements = np.asarray(self.vids, dtype=int)[np.argsort(voxels, kind="stable")]
+            self.offsets = np.concatenate(([0], np.cumsum(np.bincount(voxels, minlength=self.size))))
+        return self.elements[self.offsets[voxel]:self.offsets[voxel + 1]].tolist()
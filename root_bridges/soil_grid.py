@@ -0,0 +1,93 @@
+import numpy as np
+
+
+class MultiResolutionGrid:
+    """
+    Two-level partition of the soil grid into blocks of voxels, used to keep a fine resolution only around roots.
+
+    The voxels of the soil grid are grouped into blocks of a given number of voxels along each axis. Blocks containing
+    roots are refined, i.e. each of their voxels is a node of its own, while the other blocks are coarse, i.e. all their
+    voxels form a single node sharing the same concentrations. Blocks are refined as roots grow into them and coarsened
+    when they haven't contained roots for a number of adaptations, so that a block is not repeatedly refined and
+    coarsened. The partition is only numbered again when some blocks are refined or coarsened.
+    Coarsening a block replaces the concentrations of its voxels by their mean weighted by the volumes of the voxels,
+    and refining a block gives to its voxels the concentration of the coarse node, so that the amounts of solutes are
+    conserved by both operations.
+    """
+
+    def __init__(self, shape, block_size=4, coarsening_delay=0):
+        """
+        :param shape: the shape of the soil grid
+        :param block_size: the number of voxels of a block along each axis
+        :param coarsening_delay: the number of adaptations during which a refined block without roots is kept refined
+        """
+        self.shape = tuple(shape)
+        self.size = int(np.prod(self.shape))
+        positions = np.unravel_index(np.arange(self.size), self.shape)
+        blocks_shape = tuple(-(-length // block_size) for length in self.shape)
+        # Flat index of the block containing each voxel:
+        self.block_of = np.ravel_multi_index(tuple(position // block_size for position in positions), blocks_shape)
+        self.number_of_blocks = int(np.prod(blocks_shape))
+        # All the blocks are refined until the first adaptation, the initial concentrations being defined by voxel:
+        self.refined = np.ones(self.number_of_blocks, dtype=bool)
+        self.coarsening_delay = coarsening_delay
+        # Number of successive adaptations without roots in each block, the blocks without roots at the first
+        # adaptation being coarsened at once:
+        self.adaptations_without_roots = np.full(self.number_of_blocks, coarsening_delay)
+        self.update_nodes()
+
+    def update_nodes(self):
+        """
+        Numbers the nodes of the partition: one node for each voxel of a refined block, followed by one node for
+        each coarse block.
+        """
+        fine_voxels = self.refined[self.block_of]
+        self.node_of = np.empty(self.size, dtype=int)
+        self.node_of[fine_voxels] = np.arange(np.count_nonzero(fine_voxels))
+        coarse_blocks = np.flatnonzero(~self.refined)
+        coarse_node_of_block = np.empty(self.number_of_blocks, dtype=int)
+        coarse_node_of_block[coarse_blocks] = np.count_nonzero(fine_voxels) + np.arange(len(coarse_blocks))
+        self.node_of[~fine_voxels] = coarse_node_of_block[self.block_of[~fine_voxels]]
+        self.number_of_nodes = np.count_nonzero(fine_voxels) + len(coarse_blocks)
+
+    def coarsen(self, concentrations, volume, blocks):
+        """
+        Replaces, in place, the concentrations of the voxels of a set of blocks by their mean weighted by the volumes
+        of the voxels, which conserves the amounts of solutes in each block.
+
+        :param concentrations: the arrays of concentrations to coarsen, with the shape of the soil grid (mol m-3)
+        :param volume: the array of volumes of the voxels (m3)
+        :param blocks: the boolean array of the blocks to coarsen
+        """
+        voxels = np.flatnonzero(blocks[self.block_of])
+        if len(voxels) == 0:
+            return
+        volume = np.broadcast_to(volume, self.shape).ravel()[voxels]
+        block_of = self.block_of[voxels]
+        block_volume = np.bincount(block_of, weights=volume, minlength=self.number_of_blocks)
+        for concentration in concentrations:
+            amounts = np.bincount(block_of, weights=concentration.flat[voxels] * volume, minlength=self.number_of_blocks)
+            concentration.flat[voxels] = amounts[block_of] / block_volume[block_of]
+
+    def adapt(self, rooted_voxels, concentrations, volume):
+        """
+        Refines the blocks containing roots, and coarsens the refined blocks that haven't contained roots for more
+        than the coarsening delay.
+
+        :param rooted_voxels: the flat indices of the voxels containing roots
+        :param concentrations: the arrays of concentrations of the solutes, coarsened in place (mol m-3)
+        :param volume: the array of volumes of the voxels (m3)
+        :return: True if the partition has changed
+        """
+        rooted = np.zeros(self.number_of_blocks, dtype=bool)
+        rooted[self.block_of[np.asarray(rooted_voxels, dtype=int)]] = True
+        self.adaptations_without_roots = np.where(rooted, 0, self.adaptations_without_roots + 1)
+        to_refine = rooted & ~self.refined
+        to_coarsen = self.refined & (self.adaptations_without_roots > self.coarsening_delay)
+        if not (np.any(to_refine) or np.any(to_coarsen)):
+            return False
+        # The voxels of a coarse block already share the same concentration, which is kept when it is refined:
+        self.coarsen(concentrations, volume, to_coarsen)
+        self.refined = (self.refined | to_refine) & ~to_coarsen
+        self.update_nodes()
+        return True
@@ -1,9 +1,15 @@
 from rhizodep.soil_model import RhizoInputsSoilModel
 
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
+import numpy as np
 from metafspm.component_factory import *
 from metafspm.component import declare
 
+from root_bridges.columns import gather, scatter
+from root_bridges.soil_coupling import VoxelIndex
+from root_bridges.soil_transport import ImplicitDiffusion
+from root_bridges.soil_grid import MultiResolutionGrid
+
 
 family = "soil"
 
@@ -39,28 +45,272 @@ class SoilModel(RhizoInputsSoilModel):
     # STATE VARIABLES
 
     # PARAMETERS
+    in_place_soil_updates: bool = declare(default=False, unit="adim", unit_comment="", description="If True, the soil concentrations are updated in preallocated buffers instead of new temporary arrays at each time step",
+                                                    min_value="", max_value="", value_comment="Two buffers are used alternately for each concentration, so that the array returned at a time step remains valid until the end of the next one", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+
+    active_voxels_only: bool = declare(default=False, unit="adim", unit_comment="", description="If True, the soil concentrations are only updated, in place, in the voxels containing root elements according to the voxel index, the other voxels keeping their current state",
+                                                    min_value="", max_value="", value_comment="Requires voxel_index_coupling. Gives the same results as updating all voxels, as a voxel without root fluxes is left unchanged by the balances", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+
+    voxel_index_coupling: bool = declare(default=False, unit="adim", unit_comment="", description="If True, the exchanges between root elements and voxels rely on a persistent index of the voxel containing each element, which is only updated for the elements created or grown during the time step",
+                                                    min_value="", max_value="", value_comment="Each element is attributed to the voxel containing its middle point", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+
+    inter_voxel_diffusion: bool = declare(default=False, unit="adim", unit_comment="", description="If True, mineral N and amino acids diffuse between neighbouring voxels after the balance of each voxel, with an implicit scheme",
+                                                    min_value="", max_value="", value_comment="The implicit scheme remains stable and conservative at the time step of the model", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+    mineralN_soil_diffusion_coefficient: float = declare(default=1e-10, unit="m2.s-1", unit_comment="", description="Effective diffusion coefficient of mineral N in soil, accounting for soil water content and tortuosity",
+                                                    min_value="", max_value="", value_comment="Order of magnitude for nitrate in a moist soil, i.e. about 1.9e-9 m2.s-1 in free water reduced by an impedance factor", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+    amino_acids_soil_diffusion_coefficient: float = declare(default=5e-11, unit="m2.s-1", unit_comment="", description="Effective diffusion coefficient of amino acids in soil, accounting for soil water content and tortuosity",
+                                                    min_value="", max_value="", value_comment="Order of magnitude, amino acids diffusing about twice slower than nitrate in free water", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+
+    multi_resolution_grid: bool = declare(default=False, unit="adim", unit_comment="", description="If True, the soil grid is partitioned into blocks of voxels which are only kept at full resolution when they contain roots, the other blocks being coarsened into a single node for the diffusion between voxels",
+                                                    min_value="", max_value="", value_comment="Requires inter_voxel_diffusion and voxel_index_coupling. Mineral N and amino acids amounts are conserved when blocks are refined or coarsened", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+    soil_coarsening_delay: int = declare(default=24, unit="adim", unit_comment="time steps", description="Number of time steps during which a refined block of the multi-resolution soil grid without roots is kept refined before being coarsened",
+                                                    min_value="0", max_value="", value_comment="Avoids refining and coarsening the same blocks repeatedly, each change of the partition requiring a new factorization of the diffusion scheme", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
+    soil_block_size: int = declare(default=4, unit="adim", unit_comment="number of voxels", description="Number of voxels along each axis of the blocks of the multi-resolution soil grid",
+                                                    min_value="1", max_value="", value_comment="", references="", DOI="",
+                                                    variable_type="parameter", by="model_soil", state_variable_type="", edit_by="user")
 
     def __init__(self, g, time_step, **scenario):
         """Pass to inherited init, necessary with data classes"""
+        # Index of the voxel containing each root element, built on first use:
+        self.voxel_index = None
+        # Preallocated buffers used for in place updates, per soil property:
+        self.soil_buffers = {}
+        # Implicit diffusion scheme between voxels, built on first use:
+        self.implicit_diffusion = None
+        # Partition of the soil grid into refined and coarse blocks, built on first use:
+        self.soil_grid = None
+        # Flat indices of the voxels updated at the last time step, per soil property:
+        self.active_voxels = {}
         super().__init__(g, time_step, **scenario)
+        # The voxels exchanging with roots are only known from the voxel index:
+        if self.active_voxels_only and not self.voxel_index_coupling:
+            raise ValueError("active_voxels_only requires voxel_index_coupling")
+        # Coarse blocks only save computations in the diffusion between voxels, and are located with the voxel index:
+        if self.multi_resolution_grid and not (self.inter_voxel_diffusion and self.voxel_index_coupling):
+            raise ValueError("multi_resolution_grid requires inter_voxel_diffusion and voxel_index_coupling")
 
+    def update_voxel_index(self, vids=None):
+        """
+        Updates the voxels containing a set of root elements from their coordinates, building the index of the whole
+        root system on first call.
+        :param vids: the indices of the elements to update (None for all the elements of the MTG)
+        """
+        props = self.g.properties()
+        if self.voxel_index is None:
+            self.voxel_index = VoxelIndex(self.voxels["x1"], self.voxels["y1"], self.voxels["z1"])
+            vids = self.g.vertices(scale=self.g.max_scale())
+        elif vids is None:
+            vids = self.g.vertices(scale=self.g.max_scale())
+        vids = list(vids)
+        # We use the middle point of each element:
+        middle_points = [(gather(props[f"{axis}1"], vids) + gather(props[f"{axis}2"], vids)) / 2 for axis in "xyz"]
+        self.voxel_index.update(vids, *middle_points)
 
-    #TP@state
-    def _C_mineralN_soil(self, C_mineralN_soil, volume_soil,mineralN_diffusion_from_roots, mineralN_diffusion_from_xylem, mineralN_uptake):
-        balance = C_mineralN_soil + (self.time_step_in_seconds / volume_soil) * (
-            mineralN_diffusion_from_roots
-            + mineralN_diffusion_from_xylem
-            - mineralN_uptake
-        )
-        balance[balance < 0.] = 0.
+    def post_growth_updating(self, new_elements=None):
+        """
+        Extends property dictionaries after growth.
+        EDIT : When the exchanges with roots rely on the voxel index, it is updated for the elements created or
+        elongated during this time step only.
+        :param new_elements: mapping of the elements created during the time step to their parent
+        """
+        super().post_growth_updating()
+        if self.voxel_index_coupling and self.voxel_index is not None:
+            props = self.g.properties()
+            vids = self.voxel_index.vids
+            grown = np.flatnonzero(gather(props["length"], vids) != gather(props["initial_length"], vids))
+            self.update_voxel_index(set(np.take(vids, grown).tolist()).union(new_elements or ()))
+        if self.multi_resolution_grid:
+            self.adapt_soil_grid(new_elements=new_elements)
+
+    def adapt_soil_grid(self, new_elements=None):
+        """
+        Refines the blocks of the soil grid containing roots, and coarsens the blocks that haven't contained roots for
+        a number of time steps, conserving the amounts of mineral N and amino acids.
+        The partition, and thus the factorization of the diffusion scheme, only changes when roots reach new blocks or
+        when blocks are coarsened.
+        :param new_elements: mapping of the elements created during the time step to their parent, which are already
+        located in the voxel index
+        """
+        concentrations = [self.voxels["C_mineralN_soil"], self.voxels["C_amino_acids_soil"]]
+        if self.soil_grid is None:
+            self.soil_grid = MultiResolutionGrid(np.shape(concentrations[0]), block_size=self.soil_block_size,
+                                                 coarsening_delay=self.soil_coarsening_delay)
+        if self.voxel_index is None:
+            self.update_voxel_index()
+        # We consider all the voxels containing root elements, whether or not their fluxes are momentarily zero:
+        rooted_voxels = self.voxel_index.occupied_voxels()
+        if self.soil_grid.adapt(rooted_voxels, concentrations, self.voxels["volume_soil"]) and self.implicit_diffusion is not None:
+            self.implicit_diffusion.set_nodes(self.soil_grid.node_of, self.soil_grid.number_of_nodes)
+
+    def apply_to_voxel(self):
+        """
+        Sums the inputs of the root elements (e.g. uptake and diffusion fluxes) in the voxels containing them.
+        EDIT : With the voxel index, each input is summed with a single bincount.
+        """
+        if not self.voxel_index_coupling:
+            return super().apply_to_voxel()
+        if self.voxel_index is None:
+            self.update_voxel_index()
+        props = self.g.properties()
+        for variable in fields(self):
+            name = variable.name
+            if variable.metadata.get("variable_type") == "input" and name in props and name in self.voxels:
+                self.voxels[name][...] = self.voxel_index.sum_in_voxels(gather(props[name], self.voxel_index.vids))
+
+    def get_from_voxel(self):
+        """
+        Provides to the root elements the state of the voxels containing them (e.g. soil concentrations).
+        EDIT : With the voxel index, each state variable is taken from the voxels with a single take.
+        """
+        if not self.voxel_index_coupling:
+            return super().get_from_voxel()
+        if self.voxel_index is None:
+            self.update_voxel_index()
+        props = self.g.properties()
+        for variable in fields(self):
+            name = variable.name
+            if variable.metadata.get("variable_type") == "state_variable" and name in props and name in self.voxels:
+                scatter(props[name], self.voxel_index.vids, self.voxel_index.take_from_voxels(self.voxels[name]))
+
+    def diffuse_between_voxels(self, concentration, volume_soil, diffusion_coefficient):
+        """
+        Applies the diffusion of a solute between neighbouring voxels during the time step, if required.
+        The concentrations are updated in place when the soil updates use preallocated buffers.
+        :param concentration: the array of concentrations after the balance of each voxel (mol m-3)
+        :param volume_soil: the array of volumes of the voxels (m3)
+        :param diffusion_coefficient: the effective diffusion coefficient of the solute in soil (m2 s-1)
+        :return: the array of concentrations after diffusion
+        """
+        if not self.inter_voxel_diffusion:
+            return concentration
+        if self.implicit_diffusion is None:
+            self.implicit_diffusion = ImplicitDiffusion(*(self.voxels[name] for name in ("x1", "x2", "y1", "y2", "z1", "z2")))
+            if self.soil_grid is not None:
+                self.implicit_diffusion.set_nodes(self.soil_grid.node_of, self.soil_grid.number_of_nodes)
+        diffused = self.implicit_diffusion.solve(concentration, volume_soil, diffusion_coefficient, self.time_step_in_seconds)
+        if self.in_place_soil_updates and diffused is not concentration:
+            np.copyto(concentration, diffused)
+            return concentration
+        return diffused
+
+    def soil_buffer(self, name, like):
+        """
+        Provides a preallocated buffer with the shape of a soil array, which doesn't share memory with this array.
+        Two buffers are kept for each name and used alternately, so that the buffer returned as the new state of a
+        property is not overwritten while computing the next state from it.
+        :param name: the name of the buffer
+        :param like: the soil array whose shape is considered, e.g. the current state of the property
+        :return: the buffer
+        """
+        buffers = self.soil_buffers.get(name)
+        if buffers is None or buffers[0].shape != np.shape(like):
+            buffers = self.soil_buffers[name] = [np.empty(np.shape(like)), np.empty(np.shape(like))]
+        if np.shares_memory(buffers[0], like):
+            return buffers[1]
+        return buffers[0]
+
+    def active_voxels_balance(self, name, concentration, volume_soil, gains, losses):
+        """
+        Computes the balance of a soil concentration only in the voxels containing root elements according to the
+        voxel index, with the same operations as the balances below. As the other voxels receive no flux from roots,
+        they keep their current concentration, and the array of concentrations is updated in place.
+        :param name: the name of the soil property
+        :param concentration: the array of concentrations at the beginning of the time step, updated in place (mol m-3)
+        :param volume_soil: the array of volumes of the voxels (m3)
+        :param gains: the arrays of fluxes entering the voxels (mol s-1)
+        :param losses: the arrays of fluxes leaving the voxels (mol s-1)
+        :return: the array of new concentrations
+        """
+        if self.voxel_index is None:
+            self.update_voxel_index()
+        active = self.voxel_index.occupied_voxels()
+        self.active_voxels[name] = active
+
+        def take(values):
+            return np.ravel(values)[active] if np.ndim(values) else values
+
+        net_flux = take(gains[0])
+        for flux in gains[1:]:
+            net_flux = net_flux + take(flux)
+        for flux in losses:
+            net_flux = net_flux - take(flux)
+        concentration.flat[active] = np.maximum(take(concentration) + (self.time_step_in_seconds / take(volume_soil)) * net_flux, 0.)
+        return concentration
+
+    def in_place_balance(self, name, concentration, volume_soil, gains, losses):
+        """
+        Computes the balance of a soil concentration in preallocated buffers, with the same operations as the
+        balances below, and sets negative concentrations to 0.
+        :param name: the name of the soil property
+        :param concentration: the array of concentrations at the beginning of the time step (mol m-3)
+        :param volume_soil: the array of volumes of the voxels (m3)
+        :param gains: the arrays of fluxes entering the voxels (mol s-1)
+        :param losses: the arrays of fluxes leaving the voxels (mol s-1)
+        :return: the buffer containing the new concentrations
+        """
+        balance = self.soil_buffer(name, concentration)
+        factor = self.soil_buffer("time_step_per_volume", volume_soil)
+        np.add(gains[0], gains[1], out=balance)
+        for flux in gains[2:]:
+            np.add(balance, flux, out=balance)
+        for flux in losses:
+            np.subtract(balance, flux, out=balance)
+        np.divide(self.time_step_in_seconds, volume_soil, out=factor)
+        np.multiply(factor, balance, out=balance)
+        np.add(concentration, balance, out=balance)
+        np.maximum(balance, 0., out=balance)
         return balance
 
-    #TP@state
+
+    @state
+    def _C_mineralN_soil(self, C_mineralN_soil, volume_soil,mineralN_diffusion_from_roots, mineralN_diffusion_from_xylem, mineralN_uptake):
+        """
+        EDIT : This balance is now scheduled, so that the soil concentrations account for the exchanges with roots and
+        xylem, and can be updated in place, in active voxels only, or followed by a diffusion between voxels.
+        """
+        if self.active_voxels_only:
+            balance = self.active_voxels_balance("C_mineralN_soil", C_mineralN_soil, volume_soil,
+                                             gains=(mineralN_diffusion_from_roots, mineralN_diffusion_from_xylem),
+                                             losses=(mineralN_uptake,))
+        elif self.in_place_soil_updates:
+            balance = self.in_place_balance("C_mineralN_soil", C_mineralN_soil, volume_soil,
+                                        gains=(mineralN_diffusion_from_roots, mineralN_diffusion_from_xylem),
+                                        losses=(mineralN_uptake,))
+        else:
+            balance = C_mineralN_soil + (self.time_step_in_seconds / volume_soil) * (
+                mineralN_diffusion_from_roots
+                + mineralN_diffusion_from_xylem
+                - mineralN_uptake
+            )
+            balance[balance < 0.] = 0.
+        return self.diffuse_between_voxels(balance, volume_soil, self.mineralN_soil_diffusion_coefficient)
+
+    @state
     def _C_amino_acids_soil(self, C_amino_acids_soil, volume_soil, amino_acids_diffusion_from_roots, amino_acids_diffusion_from_xylem, amino_acids_uptake):
-        balance = C_amino_acids_soil + (self.time_step_in_seconds / volume_soil) * (
-            amino_acids_diffusion_from_roots
-            + amino_acids_diffusion_from_xylem
-            - amino_acids_uptake
-        )
-        balance[balance < 0.] = 0.
-        return balance
\ No newline at end of file
+        """
+        EDIT : This balance is now scheduled, like the one of mineral N.
+        """
+        if self.active_voxels_only:
+            balance = self.active_voxels_balance("C_amino_acids_soil", C_amino_acids_soil, volume_soil,
+                                             gains=(amino_acids_diffusion_from_roots, amino_acids_diffusion_from_xylem),
+                                             losses=(amino_acids_uptake,))
+        elif self.in_place_soil_updates:
+            balance = self.in_place_balance("C_amino_acids_soil", C_amino_acids_soil, volume_soil,
+                                        gains=(amino_acids_diffusion_from_roots, amino_acids_diffusion_from_xylem),
+                                        losses=(amino_acids_uptake,))
+        else:
+            balance = C_amino_acids_soil + (self.time_step_in_seconds / volume_soil) * (
+                amino_acids_diffusion_from_roots
+                + amino_acids_diffusion_from_xylem
+                - amino_acids_uptake
+            )
+            balance[balance < 0.] = 0.
+        return self.diffuse_between_voxels(balance, volume_soil, self.amino_acids_soil_diffusion_coefficient)
\ No newline at end of file
@@ -0,0 +1,148 @@
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+
+class ImplicitDiffusion:
+    """
+    Diffusion of solutes between neighbouring voxels of the soil grid, integrated with an implicit Euler scheme.
+
+    The flux between two neighbouring voxels is D * A / d * (C1 - C2), where A is the area of their common face and d
+    the distance between their centers. The geometry of these exchanges is computed once for a grid, and the sparse
+    matrix V + dt * D * L of the implicit scheme (V being the volumes of the voxels and L the Laplacian of the grid
+    weighted by A / d) is factorized once for each diffusion coefficient and time step, the factorization being reused
+    as long as the volumes of the voxels don't change. Each time step then only requires a forward and a backward
+    substitution.
+    The scheme is stable whatever the time step, keeps concentrations positive, and conserves the amounts of solutes
+    as no flux crosses the boundaries of the grid.
+
+    The diffusion can also be computed on a coarser partition of the grid, each node of the partition grouping a set
+    of voxels (e.g. the blocks of a multi-resolution grid), the voxels of a node sharing the same concentration.
+    """
+
+    def __init__(self, x1, x2, y1, y2, z1, z2):
+        """
+        :param x1, y1, z1: the arrays of the lower coordinates of the voxels, with the shape of the soil grid (m)
+        :param x2, y2, z2: the arrays of the upper coordinates of the voxels (m)
+        """
+        self.shape = np.shape(x1)
+        self.size = int(np.prod(self.shape))
+        centers = np.stack([(np.asarray(lower, dtype=float) + upper) / 2 for lower, upper in ((x1, x2), (y1, y2), (z1, z2))])
+        extents = np.stack([np.asarray(upper, dtype=float) - lower for lower, upper in ((x1, x2), (y1, y2), (z1, z2))])
+        indices = np.arange(self.size).reshape(self.shape)
+        first, second, areas, directions = [], [], [], []
+        # Neighbouring voxels are consecutive along one of the axes of the arrays, whatever the orientation of this axis:
+        for axis in range(len(self.shape)):
+            lower_side = [slice(None)] * len(self.shape)
+            upper_side = [slice(None)] * len(self.shape)
+            lower_side[axis], upper_side[axis] = slice(None, -1), slice(1, None)
+            lower_side, upper_side = (slice(None),) + tuple(lower_side), (slice(None),) + tuple(upper_side)
+            displacement = np.abs(centers[upper_side] - centers[lower_side]).reshape(3, -1)
+            mean_extents = ((extents[lower_side] + extents[upper_side]) / 2).reshape(3, -1)
+            # The spatial direction of the exchange is the one along which the centers are the most distant:
+            direction = np.argmax(displacement, axis=0)
+            columns = np.arange(displacement.shape[1])
+            first.append(indices[lower_side[1:]].ravel())
+            second.append(indices[upper_side[1:]].ravel())
+            areas.append(mean_extents.prod(axis=0) / mean_extents[direction, columns])
+            directions.append(direction)
+        self.centers = centers.reshape(3, -1)
+        self.voxel_first = np.concatenate(first)
+        self.voxel_second = np.concatenate(second)
+        # Area of the common face of neighbouring voxels (m2), and spatial direction of their exchange:
+        self.areas = np.concatenate(areas)
+        self.directions = np.concatenate(directions)
+        self.volume = None
+        self.set_nodes(None)
+
+    def set_nodes(self, node_of, number_of_nodes=None):
+        """
+        Sets the partition of the grid on which the diffusion is computed, and the geometry of the exchanges between
+        its nodes. The exchange between two nodes gathers the faces of all the pairs of neighbouring voxels that they
+        share, over the distance between the centers of the nodes.
+
+        :param node_of: the array giving the node of each voxel, in flat order (None to compute the diffusion on the
+        voxels themselves)
+        :param number_of_nodes: the number of nodes of the partition
+        """
+        self.node_of = node_of
+        self.factorizations = {}
+        if node_of is None:
+            self.number_of_nodes = self.size
+            self.first, self.second = self.voxel_first, self.voxel_second
+            distances = np.abs(self.centers[self.directions, self.voxel_second] - self.centers[self.directions, self.voxel_first])
+            # Ratio between the area of the common face and the distance between centers (m):
+            self.geometry = self.areas / distances
+            self.node_centers = None
+        else:
+            self.number_of_nodes = number_of_nodes
+            first, second = node_of[self.voxel_first], node_of[self.voxel_second]
+            between_nodes = first != second
+            lower = np.minimum(first, second)[between_nodes]
+            upper = np.maximum(first, second)[between_nodes]
+            directions = self.directions[between_nodes]
+            # We sum the areas of the faces shared by the same pair of nodes in the same direction:
+            pairs, inverse = np.unique((lower * number_of_nodes + upper) * 3 + directions, return_inverse=True)
+            areas = np.bincount(inverse.reshape(-1), weights=self.areas[between_nodes], minlength=len(pairs))
+            directions = pairs % 3
+            self.first, self.second = (pairs // 3) // number_of_nodes, (pairs // 3) % number_of_nodes
+            # The center of a node is the center of its voxels:
+            counts = np.bincount(node_of, minlength=number_of_nodes)
+            self.node_centers = np.stack([np.bincount(node_of, weights=coordinates, minlength=number_of_nodes) / counts
+                                          for coordinates in self.centers])
+            distances = np.abs(self.node_centers[directions, self.second] - self.node_centers[directions, self.first])
+            self.geometry = areas / distances
+        self.laplacian = self.weighted_laplacian()
+
+    def weighted_laplacian(self):
+        """
+        Assembles the sparse Laplacian of the partition of the grid weighted by the geometry of the exchanges between
+        its nodes.
+
+        :return: the Laplacian in compressed sparse column format
+        """
+        rows = np.concatenate((self.first, self.second, self.first, self.second))
+        columns = np.concatenate((self.first, self.second, self.second, self.first))
+        values = np.concatenate((self.geometry, self.geometry, -self.geometry, -self.geometry))
+        return sparse.csc_matrix((values, (rows, columns)), shape=(self.number_of_nodes, self.number_of_nodes))
+
+    def factorization(self, volume, diffusion_coefficient, time_step):
+        """
+        Provides the factorization of the matrix of the implicit scheme, computed only once for each diffusion
+        coefficient and time step as long as the volumes of the voxels and the partition of the grid don't change.
+
+        :param volume: the array of volumes of the voxels (m3)
+        :param diffusion_coefficient: the effective diffusion coefficient of the solute in soil (m2 s-1)
+        :param time_step: the time step (s)
+        :return: the factorization
+        """
+        volume = np.broadcast_to(volume, self.shape).ravel()
+        if self.volume is None or not np.array_equal(self.volume, volume):
+            self.volume = np.array(volume, dtype=float)
+            self.factorizations = {}
+        key = (float(diffusion_coefficient), float(time_step))
+        if key not in self.factorizations:
+            node_volume = self.volume if self.node_of is None else np.bincount(self.node_of, weights=self.volume,
+                                                                                 minlength=self.number_of_nodes)
+            matrix = sparse.diags(node_volume, format="csc") + (time_step * diffusion_coefficient) * self.laplacian
+            self.factorizations[key] = splu(matrix.tocsc())
+        return self.factorizations[key]
+
+    def solve(self, concentration, volume, diffusion_coefficient, time_step):
+        """
+        Computes the concentrations after diffusion between voxels during a time step.
+
+        :param concentration: the array of concentrations before diffusion (mol m-3)
+        :param volume: the array of volumes of the voxels (m3)
+        :param diffusion_coefficient: the effective diffusion coefficient of the solute in soil (m2 s-1)
+        :param time_step: the time step (s)
+        :return: the array of concentrations after diffusion, with the shape of the soil grid
+        """
+        if diffusion_coefficient <= 0. or len(self.geometry) == 0:
+            return concentration
+        factorization = self.factorization(volume, diffusion_coefficient, time_step)
+        amounts = self.volume * np.ravel(concentration)
+        if self.node_of is None:
+            return np.maximum(factorization.solve(amounts), 0.).reshape(self.shape)
+        amounts = np.bincount(self.node_of, weights=amounts, minlength=self.number_of_nodes)
+        return np.maximum(factorization.solve(amounts), 0.)[self.node_of].reshape(self.shape)
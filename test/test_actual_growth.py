@@ -0,0 +1,92 @@
+import random
+from math import pi
+
+import numpy as np
+from openalea.mtg import MTG
+
+from root_bridges.diagnostics import Diagnostics
+from root_bridges.growth_kernels import growth_kernels
+from root_bridges.root_growth import RootGrowthModelCoupled
+from root_bridges.root_topology import AxisIndex, SupplyZones
+
+
+def growing_root_system(seed, number_of_elements=120):
+    """
+    Builds an MTG of root elements ready for actual growth, with seminal and adventitious roots borne by supporting
+    elements.
+    """
+    rng = random.Random(seed)
+
+    def random_properties(element_type):
+        length, radius = rng.random() * 0.01, rng.random() * 1e-3
+        return dict(type=element_type, length=length, initial_length=length, radius=radius, initial_radius=radius,
+                    potential_length=length * rng.choice([1., 1.5]), potential_radius=radius * rng.choice([1., 1.2]),
+                    root_tissue_density=1e5, struct_mass=pi * radius ** 2 * length * 1e5,
+                    initial_struct_mass=pi * radius ** 2 * length * 1e5, C_hexose_root=rng.random() * 1e-3,
+                    AA=rng.random() * 1e-4, hexose_possibly_required_for_elongation=rng.random() * 1e-6,
+                    amino_acids_possibly_required_for_elongation=rng.random() * 1e-7,
+                    hexose_available_for_thickening=rng.random() * 1e-6,
+                    amino_acids_available_for_thickening=rng.random() * 1e-7, soil_temperature=rng.choice([10., 15.]),
+                    thermal_potential_time_since_emergence=rng.random() * 1e4, dist_to_ramif=0.,
+                    hexose_consumption_by_growth_amount=0., hexose_consumption_by_growth=0.,
+                    amino_acids_consumption_by_growth_amount=0., amino_acids_consumption_by_growth=0., resp_growth=0.)
+
+    element_types = ("Normal_root_after_emergence",) * 6 + ("Normal_root_before_emergence", "Support_for_seminal_root",
+                                                            "Support_for_adventitious_root")
+    g = MTG()
+    vids = [g.add_component(g.root, label="Segment", **random_properties("Normal_root_after_emergence"))]
+    successors = set()
+    for _ in range(number_of_elements - 1):
+        parent = rng.choice(vids)
+        edge_type = "+" if parent in successors or rng.random() < 0.3 else "<"
+        if edge_type == "<":
+            successors.add(parent)
+        vids.append(g.add_child(parent, edge_type=edge_type, label="Segment", **random_properties(rng.choice(element_types))))
+    return g
+
+
+def growth_model(g, growth_workers):
+    """
+    Provides a growth model with only the attributes used by actual growth.
+    """
+    model = RootGrowthModelCoupled.__new__(RootGrowthModelCoupled)
+    model.g = g
+    model.growth_workers = growth_workers
+    model.time_step_in_seconds = 3600.
+    model.struct_mass_C_content = 0.44 / 12.01
+    model.struct_mass_N_content = 0.03 / 14
+    model.yield_growth = 0.8
+    model.yield_growth_N = 1.
+    model.r_Nm_AA = 1.4
+    model.r_C_AA = 5
+    model.process_at_T_ref, model.T_ref, model.A, model.B, model.C = 1., 0., -0.0442, 1.55, 1.
+    model.temperature_modification = lambda process_at_T_ref, soil_temperature, T_ref, A, B, C: \
+        process_at_T_ref * max(0., A * (soil_temperature - T_ref) ** 2 + B * (soil_temperature - T_ref) + C) / C
+    model.volume_from_radius_and_length = lambda element, radius, length: pi * radius ** 2 * length
+    model.temperature_adjustments_memory = {}
+    model.kernels = growth_kernels(compiled=False)
+    model.diagnostics = Diagnostics()
+    model.axis_index = AxisIndex(g)
+    model.supply_zones = SupplyZones()
+    return model
+
+
+def test_actual_growth_in_workers_matches_single_pass():
+    for seed in range(5):
+        single_pass = growth_model(growing_root_system(seed), growth_workers=1)
+        in_workers = growth_model(growing_root_system(seed), growth_workers=3)
+        assert len(in_workers.axis_index.subtrees(("Support_for_seminal_root", "Support_for_adventitious_root"))) > 2
+        single_pass.actual_growth_and_corresponding_respiration()
+        in_workers.actual_growth_and_corresponding_respiration()
+        expected_properties = single_pass.g.properties()
+        properties = in_workers.g.properties()
+        assert any(expected_properties["length"][vid] > expected_properties["initial_length"][vid]
+                   for vid in expected_properties["length"])
+        for name, expected_values in expected_properties.items():
+            assert properties[name].keys() == expected_values.keys(), name
+            for vid, expected in expected_values.items():
+                if isinstance(expected, float):
+                    np.testing.assert_allclose(properties[name][vid], expected, rtol=1e-12, err_msg=f"{name} of {vid}")
+                else:
+                    assert properties[name][vid] == expected, f"{name} of {vid}"
+        assert in_workers.diagnostics.counts == single_pass.diagnostics.counts
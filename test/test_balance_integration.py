@@ -0,0 +1,36 @@
+import numpy as np
+
+from root_bridges.balance_integration import gains_and_losses, semi_implicit_balance
+
+
+def test_gains_and_losses():
+    gains, losses = gains_and_losses((np.array([1., -2., 0.]), np.array([-0.5, 3., 0.])))
+    np.testing.assert_array_equal(gains, [1., 3., 0.])
+    np.testing.assert_array_equal(losses, [0.5, 2., 0.])
+
+
+def test_semi_implicit_balance_stays_positive_where_explicit_update_overshoots():
+    rng = np.random.default_rng(0)
+    concentration = rng.uniform(1e-6, 1e-3, 1000)
+    mass = rng.uniform(1e-6, 1e-4, 1000)
+    time_step = 3600.
+    # Losses large enough to empty most elements several times during the time step:
+    losses = concentration * mass / time_step * rng.uniform(0.1, 10., 1000)
+    gains = concentration * mass / time_step * rng.uniform(0., 0.5, 1000)
+    fluxes = (gains, -losses)
+    explicit = concentration + (time_step / mass) * (gains - losses)
+    assert np.any(explicit < 0.)
+
+    balance = semi_implicit_balance(concentration, mass, time_step, fluxes)
+    assert np.all(balance >= 0.)
+    overshooting = explicit < 0.
+    assert np.all(balance[overshooting] > 0.)
+
+
+def test_semi_implicit_balance_keeps_small_explicit_updates():
+    concentration = np.array([1e-3, 2e-3])
+    mass = np.array([1e-4, 1e-4])
+    time_step = 60.
+    fluxes = (np.array([1e-12, 0.]), np.array([-1e-12, -2e-12]))
+    explicit = concentration + (time_step / mass) * sum(fluxes)
+    np.testing.assert_array_equal(semi_implicit_balance(concentration, mass, time_step, fluxes), explicit)
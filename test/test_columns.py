@@ -0,0 +1,38 @@
+import random
+
+import numpy as np
+
+from root_bridges.columns import ScatterAdd
+
+
+def test_merged_scatter_adds_match_element_loop():
+    names = ("hexose_consumption_by_growth_amount", "resp_growth")
+    for seed in range(20):
+        rng = random.Random(seed)
+        initial = {name: {vid: rng.random() for vid in range(1, 40) if rng.random() < 0.8} for name in names}
+        increments = [(rng.choice(names), rng.randrange(1, 50), rng.random()) for _ in range(300)]
+
+        # Reference loop, adding each increment to the property dictionaries in turn:
+        expected = {name: dict(values) for name, values in initial.items()}
+        for name, vid, increment in increments:
+            expected[name][vid] = expected[name].get(vid, 0.) + increment
+
+        # The increments are recorded in several buffers, e.g. one per worker, which are then merged:
+        parts = [ScatterAdd(names) for _ in range(3)]
+        for position, (name, vid, increment) in enumerate(increments):
+            part = parts[position % len(parts)]
+            if rng.random() < 0.5:
+                part.add(name, vid, increment)
+            else:
+                part.extend(name, np.array([vid]), np.array([increment]))
+        merged = ScatterAdd(names)
+        for part in parts:
+            merged.merge(part)
+        properties = {name: dict(values) for name, values in initial.items()}
+        merged.apply(properties)
+
+        for name in names:
+            assert sorted(properties[name]) == sorted(expected[name])
+            vids = sorted(expected[name])
+            np.testing.assert_allclose([properties[name][vid] for vid in vids], [expected[name][vid] for vid in vids],
+                                       rtol=1e-12)
@@ -0,0 +1,28 @@
+import logging
+
+from root_bridges.diagnostics import Diagnostics
+
+
+def test_summary_is_written_once_to_the_logger(caplog):
+    diagnostics = Diagnostics()
+    for vid in range(3):
+        diagnostics.record("ERROR: negative volume", vid, length=-1.)
+    with caplog.at_level(logging.WARNING, logger="root_bridges.diagnostics"):
+        diagnostics.flush(header="[growth, time step 1] ")
+        diagnostics.flush(header="[growth, time step 2] ")
+    assert len(caplog.records) == 1
+    assert caplog.records[0].getMessage().startswith("[growth, time step 1] 3 anomalies of 1 kinds:")
+
+
+def test_merged_anomalies_are_counted_once():
+    diagnostics, other = Diagnostics(write=None, recorded_elements_per_kind=2), Diagnostics(write=None)
+    diagnostics.record("ERROR: negative radius", 1)
+    for vid in (2, 3):
+        other.record("ERROR: negative radius", vid)
+    other.record("ERROR: negative volume", 4, length=-1.)
+    diagnostics.merge(other)
+    assert diagnostics.counts == {"ERROR: negative radius": 3, "ERROR: negative volume": 1}
+    assert diagnostics.elements == {"ERROR: negative radius": [1, 2], "ERROR: negative volume": [4]}
+    assert diagnostics.first_details["ERROR: negative volume"] == dict(length=-1.)
+    diagnostics.flush()
+    assert not diagnostics.counts
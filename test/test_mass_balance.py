@@ -0,0 +1,50 @@
+import numpy as np
+
+from root_bridges.mass_balance import MassBalanceAuditor
+
+
+def test_audited_time_steps():
+    periodic = MassBalanceAuditor(period=3, write=None)
+    never = MassBalanceAuditor(write=None)
+    always = MassBalanceAuditor(probability=1., write=None)
+    audited = {"periodic": [], "never": [], "always": []}
+    for step in range(1, 10):
+        for name, auditor in (("periodic", periodic), ("never", never), ("always", always)):
+            auditor.start_step()
+            if auditor.active:
+                audited[name].append(step)
+    assert audited == dict(periodic=[3, 6, 9], never=[], always=list(range(1, 10)))
+    sampled = MassBalanceAuditor(probability=0.5, seed=1, write=None)
+    draws = []
+    for _ in range(100):
+        sampled.start_step()
+        draws.append(sampled.active)
+    assert 20 < sum(draws) < 80
+
+
+def test_audit_matches_element_loop():
+    rng = np.random.default_rng(0)
+    auditor = MassBalanceAuditor(period=1, write=None)
+    auditor.start_step()
+    # The balance is recorded in two parts, e.g. by two balances on different elements:
+    vids = list(range(1, 41))
+    before = rng.uniform(0., 1., len(vids))
+    fluxes = rng.uniform(-0.5, 0.5, len(vids))
+    auditor.record("N", vids[:25], before[:25], fluxes[:25])
+    auditor.record("N", vids[25:], before[25:], fluxes[25:])
+    # Negative amounts are set to 0, which creates matter:
+    after = dict(zip(vids, np.maximum(before + fluxes, 0.).tolist()))
+    report = auditor.check("N", lambda elements: np.array([after[vid] for vid in elements]))
+
+    # Reference loop over the elements:
+    errors = {}
+    for vid, amount_before, flux in zip(vids, before.tolist(), fluxes.tolist()):
+        errors[vid] = after[vid] - (amount_before + flux)
+    assert report["conservation_error"] > 0.
+    np.testing.assert_allclose(report["conservation_error"], sum(errors.values()), rtol=1e-12)
+    np.testing.assert_allclose(report["absolute_error"], sum(abs(error) for error in errors.values()), rtol=1e-12)
+    np.testing.assert_allclose(report["relative_error"], report["absolute_error"] / sum(before.tolist()), rtol=1e-12)
+    assert report["worst_element"] == max(errors, key=lambda vid: abs(errors[vid]))
+    assert auditor.reports == [report]
+    # The records are only checked once:
+    assert auditor.check("N", lambda elements: None) is None
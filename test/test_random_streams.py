@@ -0,0 +1,42 @@
+import numpy as np
+
+from root_bridges.random_streams import philox4x32, standard_normal_draws
+
+
+def test_philox_known_answers():
+    # Known-answer vectors of Philox4x32-10 from the Random123 distribution:
+    vectors = [((0x00000000, 0x00000000, 0x00000000, 0x00000000), (0x00000000, 0x00000000),
+                (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8)),
+               ((0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff), (0xffffffff, 0xffffffff),
+                (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd)),
+               ((0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344), (0xa4093822, 0x299f31d0),
+                (0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1))]
+    for counter, key, expected in vectors:
+        assert philox4x32(np.array([counter]), key)[0].tolist() == list(expected)
+
+
+def test_philox_blocks_are_independent_of_the_batch():
+    rng = np.random.default_rng(0)
+    counters = rng.integers(0, 2 ** 32, size=(50, 4), dtype=np.uint64)
+    key = (12345, 67890)
+    batch = philox4x32(counters, key)
+    for counter, block in zip(counters, batch):
+        assert philox4x32(counter[np.newaxis], key)[0].tolist() == block.tolist()
+
+
+def test_draws_do_not_depend_on_order():
+    identifiers = np.arange(1, 201)
+    permutation = np.random.default_rng(1).permutation(len(identifiers))
+    draws = standard_normal_draws(seed=42, identifiers=identifiers, step=7)
+    shuffled_draws = standard_normal_draws(seed=42, identifiers=identifiers[permutation], step=7)
+    np.testing.assert_array_equal(shuffled_draws, draws[permutation])
+    # A subset of the identifiers gets the same values as in the complete set:
+    np.testing.assert_array_equal(standard_normal_draws(seed=42, identifiers=identifiers[::3], step=7), draws[::3])
+
+
+def test_draws_change_with_step_and_seed():
+    identifiers = np.arange(1, 101)
+    draws = standard_normal_draws(seed=42, identifiers=identifiers, step=7)
+    assert draws.shape == (100, 4)
+    assert not np.any(draws == standard_normal_draws(seed=42, identifiers=identifiers, step=8))
+    assert not np.any(draws == standard_normal_draws(seed=43, identifiers=identifiers, step=7))
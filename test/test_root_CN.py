@@ -0,0 +1,344 @@
+import random
+from dataclasses import fields
+
+import numpy as np
+from openalea.mtg import MTG
+
+from root_bridges.mass_balance import MassBalanceAuditor
+from root_bridges.reductions import PlantScaleReductions
+from root_bridges.root_CN import RootCNUnified, HEXOSE_REDUCIBLE_LOSSES, AA_REDUCIBLE_LOSSES
+
+
+STATE_VARIABLES = [variable for variable in fields(RootCNUnified) if variable.metadata.get("variable_type") == "state_variable"]
+
+
+def state_variable_type(variable):
+    return variable.metadata.get("state_variable_type", "").lower()
+
+
+def grown_root_system(seed, number_of_elements=60, number_of_new_elements=15):
+    """
+    Builds an MTG of root elements after a growth step: some elements have a structural mass different from their
+    initial structural mass, and new elements, whose state variables are not defined yet, have been added.
+
+    :return: the MTG, and the mapping of the new elements to their parent
+    """
+    rng = random.Random(seed)
+
+    def state_properties():
+        return {variable.name: rng.random() * 1e-3 for variable in STATE_VARIABLES}
+
+    g = MTG()
+    vids = [g.add_component(g.root, label="Segment", **state_properties())]
+    for _ in range(number_of_elements - 1):
+        vids.append(g.add_child(rng.choice(vids), edge_type=rng.choice("<+"), label="Segment", **state_properties()))
+    for vid in vids:
+        initial_struct_mass = rng.choice([0., rng.random() * 1e-3])
+        g.properties().setdefault("initial_struct_mass", {})[vid] = initial_struct_mass
+        # Elements may have thickened or elongated, or not grown at all:
+        g.properties().setdefault("struct_mass", {})[vid] = rng.choice([initial_struct_mass, initial_struct_mass + rng.random() * 1e-4])
+    new_elements = {}
+    for _ in range(number_of_new_elements):
+        # New elements may be borne by an element created during the same step:
+        parent = rng.choice(vids + list(new_elements))
+        vid = g.add_child(parent, edge_type=rng.choice("<+"), label="Apex",
+                          struct_mass=rng.random() * 1e-5, initial_struct_mass=0.)
+        new_elements[vid] = parent
+    return g, new_elements
+
+
+def cn_model(g):
+    """
+    Provides a CN model with only the state variables linked to the MTG property dictionaries.
+    """
+    model = RootCNUnified.__new__(RootCNUnified)
+    model.g = g
+    model.props = g.properties()
+    for variable in STATE_VARIABLES:
+        setattr(model, variable.name, model.props.setdefault(variable.name, {}))
+    return model
+
+
+def full_post_growth_updating(model):
+    """
+    Reference update covering all the vertices of the MTG one by one: elements without concentration are partitioned
+    with their parent, and the concentrations of the elements whose structural mass has changed are diluted.
+    """
+    struct_mass = model.props["struct_mass"]
+    initial_struct_mass = model.props["initial_struct_mass"]
+    for vid in model.g.vertices(scale=1):
+        if vid not in model.C_hexose_root:
+            parent = model.g.parent(vid)
+            mass_fraction = struct_mass[vid] / (struct_mass[vid] + struct_mass[parent])
+            for variable in STATE_VARIABLES:
+                values = getattr(model, variable.name)
+                if state_variable_type(variable).endswith("intensive"):
+                    values[vid] = values[parent]
+                elif state_variable_type(variable).endswith("extensive"):
+                    values[vid] = values[parent] * mass_fraction
+                    values[parent] = values[parent] * (1 - mass_fraction)
+        elif struct_mass[vid] != initial_struct_mass[vid] and struct_mass[vid] > 0.:
+            for variable in STATE_VARIABLES:
+                if state_variable_type(variable).endswith("intensive"):
+                    values = getattr(model, variable.name)
+                    values[vid] = values[vid] * (initial_struct_mass[vid] / struct_mass[vid])
+
+
+def test_post_growth_updating_of_new_elements_matches_full_update():
+    for seed in range(20):
+        reference = cn_model(grown_root_system(seed)[0])
+        g, new_elements = grown_root_system(seed)
+        model = cn_model(g)
+        full_post_growth_updating(reference)
+        model.post_growth_updating(new_elements=new_elements)
+        for variable in STATE_VARIABLES:
+            expected = reference.props[variable.name]
+            values = model.props[variable.name]
+            assert sorted(values) == sorted(expected)
+            vids = sorted(expected)
+            np.testing.assert_allclose([values[vid] for vid in vids], [expected[vid] for vid in vids], rtol=1e-14)
+
+
+def test_post_growth_updating_dilutes_grown_elements():
+    g, new_elements = grown_root_system(0)
+    model = cn_model(g)
+    initial_concentrations = dict(model.C_hexose_root)
+    model.post_growth_updating(new_elements=new_elements)
+    struct_mass = model.props["struct_mass"]
+    initial_struct_mass = model.props["initial_struct_mass"]
+    grown = [vid for vid in initial_concentrations if struct_mass[vid] > initial_struct_mass[vid]]
+    assert grown
+    for vid in grown:
+        # The amount of hexose is conserved in the new structural mass:
+        np.testing.assert_allclose(model.C_hexose_root[vid] * struct_mass[vid],
+                                   initial_concentrations[vid] * initial_struct_mass[vid], rtol=1e-14)
+
+
+HEXOSE_GAINS = ("hexose_uptake_from_soil", "hexose_diffusion_from_phloem", "hexose_active_production_from_phloem",
+                "hexose_mobilization_from_reserve")
+HEXOSE_KEPT_LOSSES = ("hexose_consumption_by_growth", "deficit_hexose_root", "hexose_immobilization_as_reserve")
+AA_GAINS = ("diffusion_AA_phloem", "import_AA")
+AA_KEPT_LOSSES = ("export_AA", "AA_catabolism", "amino_acids_consumption_by_growth", "deficit_AA_root")
+# Fluxes between the root elements and the soil, positive towards the soil:
+SOIL_FLUXES = dict(C=dict(hexose_exudation=6., mucilage_secretion=6., cells_release=6., hexose_uptake_from_soil=-6.),
+                   N=dict(diffusion_AA_soil=1.4))
+
+
+def balance_root_system(seed, number_of_elements=200):
+    """
+    Builds root elements with the fluxes of the hexose and amino acids balances, most of them losing much more than
+    they contain during a time step.
+    """
+    rng = np.random.default_rng(seed)
+    props = {}
+    C_hexose_root, AA = rng.uniform(1e-5, 1e-3, number_of_elements), rng.uniform(1e-6, 1e-4, number_of_elements)
+    struct_mass = rng.uniform(1e-6, 1e-4, number_of_elements)
+    props.update(C_hexose_root=C_hexose_root, AA=AA, struct_mass=struct_mass,
+                 living_root_hairs_struct_mass=rng.uniform(0., 1e-6, number_of_elements))
+    hexose_scale, AA_scale = C_hexose_root * struct_mass / 3600., AA * struct_mass / 3600.
+    for name in HEXOSE_GAINS + HEXOSE_KEPT_LOSSES + ("AA_synthesis",):
+        props[name] = hexose_scale * rng.uniform(0., 0.1, number_of_elements)
+    for name in [name for name in HEXOSE_REDUCIBLE_LOSSES if name is not None]:
+        props[name] = hexose_scale * rng.uniform(0., 5., number_of_elements)
+    props["sucrose_loading_in_phloem"] = hexose_scale * rng.uniform(0., 0.1, number_of_elements)
+    for name in AA_GAINS + AA_KEPT_LOSSES:
+        props[name] = AA_scale * rng.uniform(0., 0.1, number_of_elements)
+    # Storage fluxes are expressed in amounts of storage proteins:
+    for name in ("storage_synthesis", "storage_catabolism"):
+        props[name] = AA_scale * rng.uniform(0., 0.1, number_of_elements) / 65.
+    for name in [name for name in AA_REDUCIBLE_LOSSES if name is not None]:
+        props[name] = AA_scale * rng.uniform(0., 5., number_of_elements)
+    g = MTG()
+    vid = g.add_component(g.root, label="Segment")
+    vids = [vid]
+    for _ in range(number_of_elements - 1):
+        vids.append(g.add_child(vids[-1], edge_type="<", label="Segment"))
+    for name, values in props.items():
+        g.properties()[name] = dict(zip(vids, values.tolist()))
+    g.properties()["focus_elements"] = dict.fromkeys(vids, True)
+    return g
+
+
+def balance_model(g, balance_integration):
+    """
+    Provides a CN model with only the attributes used by the hexose and amino acids balances.
+    """
+    model = RootCNUnified.__new__(RootCNUnified)
+    model.g = g
+    model.props = g.properties()
+    model.C_hexose_root, model.AA = model.props["C_hexose_root"], model.props["AA"]
+    model.time_step = 3600.
+    model.r_hexose_AA, model.r_AA_stor, model.r_Nm_AA = 4.5 / 6, 65., 1.4
+    model.balance_integration = balance_integration
+    model.balance_integration_tolerance = 0.05
+    model.mass_balance = MassBalanceAuditor(period=1, write=None)
+    return model
+
+
+def total_amounts(model):
+    """
+    Amounts of C and N in the root elements and in the soil, the soil receiving the fluxes of the time step.
+    """
+    props = model.props
+    vids = list(props["focus_elements"])
+    hexose_mass = [props["struct_mass"][vid] + props["living_root_hairs_struct_mass"][vid] for vid in vids]
+    amounts = dict(C=6. * sum(props["C_hexose_root"][vid] * mass for vid, mass in zip(vids, hexose_mass)),
+                   N=1.4 * sum(props["AA"][vid] * props["struct_mass"][vid] for vid in vids))
+    soil = {element: model.time_step * sum(coefficient * props[name][vid] for name, coefficient in fluxes.items()
+                                           for vid in vids)
+            for element, fluxes in SOIL_FLUXES.items()}
+    return amounts, soil
+
+
+def test_semi_implicit_balances_conserve_mass_between_root_and_soil():
+    g = balance_root_system(0)
+    model = balance_model(g, "semi_implicit")
+    props = model.props
+    requested_exudation = dict(props["hexose_exudation"])
+    root_before, _ = total_amounts(model)
+    vids = list(props["focus_elements"])
+    # Amounts brought to or taken from the root-soil system by the other compartments during the time step:
+    other_fluxes = dict(
+        C=6. * model.time_step * sum(
+            sum(props[name][vid] for name in HEXOSE_GAINS if name != "hexose_uptake_from_soil")
+            - sum(props[name][vid] for name in HEXOSE_KEPT_LOSSES)
+            - 2. * props["sucrose_loading_in_phloem"][vid] - props["AA_synthesis"][vid] * model.r_hexose_AA
+            + props["AA_catabolism"][vid] / model.r_hexose_AA for vid in vids),
+        N=1.4 * model.time_step * sum(
+            sum(props[name][vid] for name in AA_GAINS) - sum(props[name][vid] for name in AA_KEPT_LOSSES)
+            + props["AA_synthesis"][vid] - props["storage_synthesis"][vid] * model.r_AA_stor
+            + props["storage_catabolism"][vid] / model.r_AA_stor for vid in vids))
+
+    model._C_hexose_root()
+    model._AA()
+
+    # The losses to the soil have been reduced where the semi-implicit update is used, and the elements stay positive:
+    assert any(props["hexose_exudation"][vid] < requested_exudation[vid] for vid in vids)
+    assert all(props["C_hexose_root"][vid] >= 0. and props["AA"][vid] >= 0. for vid in vids)
+    root_after, soil = total_amounts(model)
+    respired = 6. * model.time_step * sum((props["maintenance_respiration"][vid] + props["N_metabolic_respiration"][vid]) / 6.
+                                          for vid in vids)
+    np.testing.assert_allclose(root_after["C"] + soil["C"] + respired, root_before["C"] + other_fluxes["C"], rtol=1e-10)
+    np.testing.assert_allclose(root_after["N"] + soil["N"], root_before["N"] + other_fluxes["N"], rtol=1e-10)
+    # The mass balance auditor finds the same conservation:
+    for element in ("C", "N"):
+        report = model.mass_balance.check(element, lambda vids: (
+            6. * np.array([props["C_hexose_root"][vid] * (props["struct_mass"][vid] + props["living_root_hairs_struct_mass"][vid])
+                           for vid in vids]) if element == "C" else
+            1.4 * np.array([props["AA"][vid] * props["struct_mass"][vid] for vid in vids])))
+        assert abs(report["conservation_error"]) <= 1e-10 * root_before[element]
+
+
+def test_plant_scale_properties_are_written_in_the_linked_property():
+    g = MTG()
+    vid = g.add_component(g.root, label="Segment", hexose_diffusion_from_phloem=1e-12, struct_mass=1e-4)
+    g.add_child(vid, edge_type="<", label="Segment", hexose_diffusion_from_phloem=3e-12, struct_mass=1e-4)
+    model = RootCNUnified.__new__(RootCNUnified)
+    model.props = g.properties()
+    # As after link_self_to_mtg, the plant-scale attribute is the property dictionary of the MTG:
+    model.total_hexose_diffusion_from_phloem = model.props.setdefault("total_hexose_diffusion_from_phloem", {1: 0.})
+    linked = model.total_hexose_diffusion_from_phloem
+    model.reductions = PlantScaleReductions(model.props)
+    model.reductions.register("total_hexose_diffusion_from_phloem", model._total_hexose_diffusion_from_phloem)
+    model._plant_scale_properties()
+    assert model.total_hexose_diffusion_from_phloem is linked
+    np.testing.assert_allclose(model.props["total_hexose_diffusion_from_phloem"][1], 6 * 3600 * 1e6 * (4e-12 / 2e-4))
+
+
+def test_threshold_clamps_the_balance_array_in_place():
+    g = balance_root_system(1)
+    model = balance_model(g, "explicit")
+    model._C_hexose_root()
+    model._AA()
+    vids, AA = model.AA_view
+    balance = dict(model.AA)
+    assert any(value < 0. for value in balance.values())
+    model._threshold_C_sucrose_root()
+    assert model.AA_view is None
+    assert model.AA == {vid: max(value, 0.) for vid, value in balance.items()}
+    np.testing.assert_array_equal(AA, [model.AA[vid] for vid in vids])
+
+
+def hexose_balance_of_element(model, p):
+    """
+    Balance of hexose of one element, as computed element by element before the balances were computed on arrays.
+    """
+    return p["C_hexose_root"] + (model.time_step / (p["struct_mass"] + p["living_root_hairs_struct_mass"])) * (
+        - p["hexose_exudation"] + p["hexose_uptake_from_soil"] - p["mucilage_secretion"] - p["cells_release"]
+        - p["maintenance_respiration"] / 6. - p["hexose_consumption_by_growth"] + p["hexose_diffusion_from_phloem"]
+        + p["hexose_active_production_from_phloem"] - 2. * p["sucrose_loading_in_phloem"]
+        + p["hexose_mobilization_from_reserve"] - p["hexose_immobilization_as_reserve"] - p["deficit_hexose_root"]
+        - p["AA_synthesis"] * model.r_hexose_AA + p["AA_catabolism"] / model.r_hexose_AA
+        - p["N_metabolic_respiration"] / 6.)
+
+
+def amino_acids_balance_of_element(model, p):
+    """
+    Balance of amino acids of one element, as computed element by element before the balances were computed on arrays.
+    """
+    if p["struct_mass"] > 0:
+        return p["AA"] + (model.time_step / p["struct_mass"]) * (
+            p["diffusion_AA_phloem"] + p["import_AA"] - p["diffusion_AA_soil"] - p["export_AA"] + p["AA_synthesis"]
+            - p["storage_synthesis"] * model.r_AA_stor + p["storage_catabolism"] / model.r_AA_stor - p["AA_catabolism"]
+            - p["amino_acids_consumption_by_growth"] - p["deficit_AA_root"])
+    else:
+        return 0
+
+
+def amino_acids_deficit_of_element(model, p):
+    """
+    Deficit of amino acids of one element, as computed element by element before it was computed on arrays.
+    """
+    if p["AA"] < 0:
+        return - p["AA"] * (p["struct_mass"] + p["living_root_hairs_struct_mass"]) / model.time_step
+    else:
+        return 0.
+
+
+def test_explicit_balances_match_element_functions():
+    for seed in range(10):
+        g = balance_root_system(seed, number_of_elements=80)
+        props = g.properties()
+        rng = random.Random(seed)
+        vids = list(props["focus_elements"])
+        # Some elements have no structural mass, and only some elements are considered during the time step:
+        for vid in rng.sample(vids, 10):
+            props["struct_mass"][vid] = 0.
+        props["focus_elements"] = dict.fromkeys(rng.sample(vids, 60), True)
+        props["deficit_AA_root"] = {vid: 0. for vid in vids}
+        model = balance_model(g, "explicit")
+        model.deficit_AA_root = props["deficit_AA_root"]
+
+        before = {vid: {name: values[vid] for name, values in props.items() if vid in values} for vid in vids}
+        expected_C_hexose_root = {vid: hexose_balance_of_element(model, before[vid]) if vid in props["focus_elements"]
+                                  else before[vid]["C_hexose_root"] for vid in vids}
+        expected_AA = {vid: amino_acids_balance_of_element(model, before[vid]) if vid in props["focus_elements"]
+                       else before[vid]["AA"] for vid in vids}
+        expected_deficit = {vid: amino_acids_deficit_of_element(model, dict(before[vid], AA=expected_AA[vid]))
+                            if vid in props["focus_elements"] else 0. for vid in vids}
+
+        model._C_hexose_root()
+        model._AA()
+        model._deficit_AA_root()
+
+        for values, expected in ((model.C_hexose_root, expected_C_hexose_root), (model.AA, expected_AA),
+                                 (model.deficit_AA_root, expected_deficit)):
+            np.testing.assert_allclose([values[vid] for vid in vids], [expected[vid] for vid in vids], rtol=1e-12)
+        assert any(value < 0. for value in model.AA.values()) and any(value > 0. for value in model.deficit_AA_root.values())
+
+
+def test_audit_reports_the_amino_acids_created_by_the_threshold():
+    g = balance_root_system(2)
+    model = balance_model(g, "explicit")
+    model._C_hexose_root()
+    model._AA()
+    # Reference loop over the elements whose negative concentration will be set to 0:
+    created = sum(- model.r_Nm_AA * model.AA[vid] * model.props["struct_mass"][vid]
+                  for vid in model.props["focus_elements"] if model.AA[vid] < 0.)
+    model._threshold_C_sucrose_root()
+    carbon, nitrogen = model.mass_balance.reports
+    assert created > 0.
+    np.testing.assert_allclose(nitrogen["conservation_error"], created, rtol=1e-9)
+    # Negative hexose concentrations are kept, and thus don't create carbon:
+    assert abs(carbon["conservation_error"]) <= 1e-12 * sum(
+        abs(6. * model.C_hexose_root[vid] * model.props["struct_mass"][vid]) for vid in model.props["focus_elements"])
@@ -0,0 +1,179 @@
+import random
+from math import pi
+
+import numpy as np
+from openalea.mtg import MTG
+
+from root_bridges.growth_kernels import growth_kernels
+from root_bridges.root_growth import RootGrowthModelCoupled
+
+
+def random_root_elements(number_of_elements, seed):
+    """
+    Builds an MTG of root elements with random root hairs properties, covering all the cases of root hairs formation.
+    """
+    rng = random.Random(seed)
+
+    def random_properties():
+        length = rng.choice([0., rng.random() * 0.01])
+        distance_from_tip = rng.random() * 0.05
+        return dict(type=rng.choice(["Normal_root_after_emergence", "Stopped", "Just_dead", "Dead", "Nodule"]),
+                    length=length, radius=rng.random() * 1e-3, distance_from_tip=distance_from_tip,
+                    former_distance_from_tip=distance_from_tip - rng.choice([0., rng.random() * 0.01]),
+                    all_root_hairs_formed=rng.random() < 0.3,
+                    actual_length_with_hairs=rng.choice([0., rng.random() * 0.005]),
+                    total_root_hairs_number=rng.random() * 100,
+                    actual_time_since_root_hairs_emergence_started=rng.random() * 1e5,
+                    thermal_time_since_root_hairs_emergence_started=rng.random() * 1e5,
+                    actual_time_since_root_hairs_emergence_stopped=rng.random() * 1e5,
+                    thermal_time_since_root_hairs_emergence_stopped=rng.random() * 1e5,
+                    root_hairs_lifespan=rng.random() * 1e5, root_hair_length=rng.random() * 1e-3,
+                    C_hexose_root=rng.random() * 1e-3, AA=rng.random() * 1e-3,
+                    root_hairs_struct_mass=rng.random() * 1e-5, root_tissue_density=1e5,
+                    soil_temperature=rng.choice([5., 10., rng.random() * 20]),
+                    living_root_hairs_struct_mass=0., dead_root_hairs_number=0., living_root_hairs_number=0.,
+                    root_hairs_volume=0., root_hairs_struct_mass_produced=0.,
+                    hexose_consumption_by_growth_amount=rng.random() * 1e-9, hexose_consumption_by_growth=rng.random() * 1e-12,
+                    amino_acids_consumption_by_growth_amount=rng.random() * 1e-9,
+                    amino_acids_consumption_by_growth=rng.random() * 1e-12, resp_growth=rng.random() * 1e-9)
+
+    g = MTG()
+    parent = g.add_component(g.root, label="Segment", **random_properties())
+    for _ in range(number_of_elements - 1):
+        parent = g.add_child(parent, edge_type="<", label="Segment", **random_properties())
+    return g
+
+
+def growth_model(g):
+    """
+    Provides a growth model with only the attributes used by root_hairs_dynamics.
+    """
+    model = RootGrowthModelCoupled.__new__(RootGrowthModelCoupled)
+    model.g = g
+    model.time_step_in_seconds = 3600.
+    model.growing_zone_factor = 8.
+    model.root_hairs_density = 1e8
+    model.root_hair_max_length = 1e-3
+    model.root_hairs_elongation_rate = 0.01
+    model.root_hair_radius = 6e-6
+    model.Km_elongation = 1e-4
+    model.Km_elongation_amino_acids = 5e-5
+    model.struct_mass_C_content = 0.04
+    model.yield_growth = 0.8
+    model.struct_mass_N_content = 0.002
+    model.yield_growth_N = 1.
+    model.r_Nm_AA = 1.4
+    model.process_at_T_ref, model.T_ref, model.A, model.B, model.C = 1., 0., -0.0442, 1.55, 1.
+    model.temperature_modification = lambda process_at_T_ref, soil_temperature, T_ref, A, B, C: \
+        process_at_T_ref * max(0., A * (soil_temperature - T_ref) ** 2 + B * (soil_temperature - T_ref) + C) / C
+    model.temperature_adjustments_memory = {}
+    model.kernels = growth_kernels(compiled=False)
+    return model
+
+
+def scalar_root_hairs_dynamics(model):
+    """
+    Reference computation of the root hairs dynamics element by element, as before its vectorization.
+    """
+    for vid in model.g.vertices(scale=1):
+        n = model.g.node(vid)
+        if n.length <= 0:
+            continue
+        if n.type == "Just_dead" or n.type == "Dead" or n.type == "Nodule":
+            continue
+        temperature_time_adjustment = model.temperature_modification(process_at_T_ref=model.process_at_T_ref,
+                                                                     soil_temperature=n.soil_temperature,
+                                                                     T_ref=model.T_ref, A=model.A, B=model.B, C=model.C)
+        elapsed_thermal_time = model.time_step_in_seconds * temperature_time_adjustment
+        initial_root_hairs_struct_mass = n.root_hairs_struct_mass
+        if n.distance_from_tip <= model.growing_zone_factor * n.radius:
+            continue
+        if n.all_root_hairs_formed:
+            n.actual_time_since_root_hairs_emergence_started += model.time_step_in_seconds
+            n.thermal_time_since_root_hairs_emergence_started += elapsed_thermal_time
+            n.actual_time_since_root_hairs_emergence_stopped += model.time_step_in_seconds
+            n.thermal_time_since_root_hairs_emergence_stopped += elapsed_thermal_time
+        elif n.distance_from_tip - n.length < model.growing_zone_factor * n.radius:
+            initial_length_with_hairs = n.actual_length_with_hairs
+            n.actual_length_with_hairs = n.distance_from_tip - model.growing_zone_factor * n.radius
+            net_increase_in_root_hairs_length = n.actual_length_with_hairs - initial_length_with_hairs
+            n.total_root_hairs_number = model.root_hairs_density * n.radius * n.actual_length_with_hairs
+            elongation_rate_in_actual_time = (n.distance_from_tip - n.former_distance_from_tip) / model.time_step_in_seconds
+            elongation_rate_in_thermal_time = (n.distance_from_tip - n.former_distance_from_tip) / elapsed_thermal_time
+            if elongation_rate_in_actual_time > 0. and initial_length_with_hairs <= 0.:
+                n.actual_time_since_root_hairs_emergence_started += \
+                    model.time_step_in_seconds - net_increase_in_root_hairs_length / elongation_rate_in_actual_time
+                n.thermal_time_since_root_hairs_emergence_started += \
+                    elapsed_thermal_time - net_increase_in_root_hairs_length / elongation_rate_in_thermal_time
+            else:
+                n.actual_time_since_root_hairs_emergence_started += model.time_step_in_seconds
+                n.thermal_time_since_root_hairs_emergence_started += elapsed_thermal_time
+        else:
+            n.actual_time_since_root_hairs_emergence_started += model.time_step_in_seconds
+            n.thermal_time_since_root_hairs_emergence_started += elapsed_thermal_time
+            initial_length_with_hairs = n.actual_length_with_hairs
+            n.actual_length_with_hairs = n.length
+            net_increase_in_root_hairs_length = n.actual_length_with_hairs - initial_length_with_hairs
+            n.total_root_hairs_number = model.root_hairs_density * n.radius * n.length
+            elongation_rate_in_actual_time = (n.distance_from_tip - n.former_distance_from_tip) / model.time_step_in_seconds
+            elongation_rate_in_thermal_time = (n.distance_from_tip - n.former_distance_from_tip) / elapsed_thermal_time
+            if elongation_rate_in_actual_time > 0.:
+                n.actual_time_since_root_hairs_emergence_stopped += \
+                    model.time_step_in_seconds - net_increase_in_root_hairs_length / elongation_rate_in_actual_time
+                n.thermal_time_since_root_hairs_emergence_stopped += \
+                    elapsed_thermal_time - net_increase_in_root_hairs_length / elongation_rate_in_thermal_time
+            else:
+                n.actual_time_since_root_hairs_emergence_stopped += model.time_step_in_seconds
+                n.thermal_time_since_root_hairs_emergence_stopped += elapsed_thermal_time
+            n.all_root_hairs_formed = True
+
+        if n.thermal_time_since_root_hairs_emergence_started <= n.root_hairs_lifespan:
+            n.dead_root_hairs_number = 0.
+        elif n.thermal_time_since_root_hairs_emergence_stopped > n.root_hairs_lifespan:
+            n.dead_root_hairs_number = n.total_root_hairs_number
+        else:
+            time_since_first_death = n.thermal_time_since_root_hairs_emergence_started - n.root_hairs_lifespan
+            dead_fraction = time_since_first_death / (n.thermal_time_since_root_hairs_emergence_started
+                                                      - n.thermal_time_since_root_hairs_emergence_stopped)
+            n.dead_root_hairs_number = n.total_root_hairs_number * dead_fraction
+        n.living_root_hairs_number = n.total_root_hairs_number - n.dead_root_hairs_number
+
+        if n.root_hair_length < model.root_hair_max_length:
+            cn_limitation = ((n.C_hexose_root / (n.C_hexose_root + model.Km_elongation))
+                             + (n.AA / (n.AA + model.Km_elongation_amino_acids))) / 2
+            new_length = n.root_hair_length + model.root_hairs_elongation_rate * model.root_hair_radius \
+                * (n.actual_length_with_hairs / n.length) * cn_limitation * elapsed_thermal_time
+            n.root_hair_length = min(new_length, model.root_hair_max_length)
+
+        n.root_hairs_volume = (model.root_hair_radius ** 2 * pi) * n.root_hair_length * n.total_root_hairs_number
+        n.root_hairs_struct_mass = n.root_hairs_volume * n.root_tissue_density
+        if n.total_root_hairs_number > 0.:
+            n.living_root_hairs_struct_mass = n.root_hairs_struct_mass * n.living_root_hairs_number / n.total_root_hairs_number
+        else:
+            n.living_root_hairs_struct_mass = 0.
+        n.root_hairs_struct_mass_produced = n.root_hairs_struct_mass - initial_root_hairs_struct_mass
+
+        hexose_consumption = n.root_hairs_struct_mass_produced * model.struct_mass_C_content / model.yield_growth / 6.
+        amino_acids_comsumption = n.root_hairs_struct_mass_produced * model.struct_mass_N_content / model.yield_growth_N / model.r_Nm_AA
+        n.hexose_consumption_by_growth_amount += hexose_consumption
+        n.hexose_consumption_by_growth += hexose_consumption / model.time_step_in_seconds
+        n.amino_acids_consumption_by_growth_amount += amino_acids_comsumption
+        n.amino_acids_consumption_by_growth += amino_acids_comsumption / model.time_step_in_seconds
+        n.resp_growth += hexose_consumption * 6. * (1 - model.yield_growth)
+
+
+def test_vectorized_root_hairs_dynamics_matches_scalar_path():
+    for seed in range(10):
+        reference = growth_model(random_root_elements(200, seed))
+        vectorized = growth_model(random_root_elements(200, seed))
+        scalar_root_hairs_dynamics(reference)
+        vectorized.root_hairs_dynamics()
+        expected_properties = reference.g.properties()
+        properties = vectorized.g.properties()
+        for name, expected_values in expected_properties.items():
+            for vid, expected in expected_values.items():
+                value = properties[name][vid]
+                if isinstance(expected, float):
+                    np.testing.assert_allclose(value, expected, rtol=1e-12, atol=0., err_msg=f"{name} of {vid}")
+                else:
+                    assert value == expected, f"{name} of {vid}"
@@ -0,0 +1,194 @@
+import random
+
+import numpy as np
+from openalea.mtg import MTG
+from openalea.mtg.traversal import post_order
+
+from root_bridges.root_topology import AxisIndex, SupplyZones
+
+
+def random_root_system(number_of_elements, seed):
+    """
+    Builds a random MTG of root elements, each element bearing at most one successor and any number of laterals.
+    """
+    rng = random.Random(seed)
+
+    def random_properties():
+        # We also consider elements of length 0, like the ones supporting seminal or adventitious roots:
+        length = 0. if rng.random() < 0.1 else rng.random()
+        return dict(length=length, volume=length * rng.random(), struct_mass=rng.random(),
+                    C_hexose_root=rng.random(), AA=rng.random())
+
+    g = MTG()
+    vids = [g.add_component(g.root, label="Segment", **random_properties())]
+    successors = set()
+    for _ in range(number_of_elements - 1):
+        parent = rng.choice(vids)
+        edge_type = "+" if parent in successors or rng.random() < 0.2 else "<"
+        if edge_type == "<":
+            successors.add(parent)
+        vids.append(g.add_child(parent, edge_type=edge_type, label="Segment", **random_properties()))
+    return g
+
+
+def supplying_zone_from_pointers(g, vid, supplying_volume):
+    """
+    Reference walk along the MTG pointers, towards the base of the root system, used before the axis index.
+    """
+    zone = []
+    index = vid
+    remaining_volume = supplying_volume
+    while remaining_volume > 0.:
+        node = g.node(index)
+        if remaining_volume > node.volume:
+            if node.length > 0.:
+                zone.append((index, 1.))
+                remaining_volume -= node.volume
+            parent = g.Father(index, EdgeType="<")
+            if parent is None:
+                parent = g.Father(index, EdgeType="+")
+                if parent is None:
+                    break
+            index = parent
+        else:
+            zone.append((index, remaining_volume / node.volume))
+            break
+    return zone
+
+
+def test_supplying_zone_matches_pointer_walk():
+    for seed in range(50):
+        g = random_root_system(60, seed)
+        axis_index = AxisIndex(g)
+        rng = random.Random(seed)
+        for vid in g.vertices(scale=1):
+            supplying_volume = rng.random() * rng.choice([0.1, 1., 5., 50.])
+            positions, fractions = axis_index.supplying_zone(vid, supplying_volume)
+            expected = supplying_zone_from_pointers(g, vid, supplying_volume)
+            assert axis_index.order[positions].tolist() == [index for index, _ in expected]
+            np.testing.assert_allclose(fractions, [fraction for _, fraction in expected])
+
+
+def test_apex_of_matches_descendants():
+    for seed in range(20):
+        g = random_root_system(80, seed)
+        axis_index = AxisIndex(g)
+        for vid in g.vertices(scale=1):
+            assert axis_index.apex_of(vid) == g.Descendants(vid)[-1]
+
+
+def test_apex_of_after_adding_elements():
+    for seed in range(20):
+        full = random_root_system(80, seed)
+        g = MTG()
+        vertices = full.vertices(scale=1)
+        g.add_component(g.root, label="Segment")
+        # The index is built on the first elements, and then extended as the next elements are added:
+        for vid in vertices[1:10]:
+            g.add_child(full.parent(vid), edge_type=full.edge_type(vid), label="Segment")
+        axis_index = AxisIndex(g)
+        for vid in vertices[10:]:
+            axis_index.add_element(g.add_child(full.parent(vid), edge_type=full.edge_type(vid), label="Segment"))
+        for vid in g.vertices(scale=1):
+            assert axis_index.apex_of(vid) == g.Descendants(vid)[-1]
+
+
+def test_post_order_matches_traversal():
+    for seed in range(20):
+        g = random_root_system(80, seed)
+        axis_index = AxisIndex(g)
+        root = next(g.component_roots_at_scale_iter(g.root, scale=1))
+        assert list(axis_index.post_order()) == list(post_order(g, root))
+
+
+def test_subtrees_partition_post_order():
+    bearing_types = ("Support_for_seminal_root", "Support_for_adventitious_root")
+    for seed in range(20):
+        g = random_root_system(80, seed)
+        rng = random.Random(seed)
+        for vid in g.vertices(scale=1):
+            g.properties().setdefault("type", {})[vid] = rng.choice(bearing_types + ("Normal_root_after_emergence",) * 4)
+        axis_index = AxisIndex(g)
+        remaining, *separated = axis_index.subtrees(bearing_types)
+        assert sorted(remaining + sum(separated, [])) == sorted(axis_index.post_order())
+        for part in separated:
+            # Each separated part is the subtree of a lateral axis borne by an element of the given types:
+            base = part[-1]
+            assert g.edge_type(base) == "+" and g.property("type")[g.parent(base)] in bearing_types
+            assert part == list(post_order(g, base))
+        in_subtrees = set(sum(separated, []))
+        assert remaining == [vid for vid in axis_index.post_order() if vid not in in_subtrees]
+
+
+def test_supplying_zone_after_adding_elements_within_a_time_step():
+    for seed in range(20):
+        g = random_root_system(60, seed)
+        axis_index = AxisIndex(g)
+        axis_index.invalidate()
+        rng = random.Random(seed)
+        for _ in range(20):
+            vertices = g.vertices(scale=1)
+            # Lateral primordia of length 0 and elements extending the last axis are appended to the layout:
+            for edge_type in "+<":
+                parent = rng.choice(vertices) if edge_type == "+" else axis_index.axes[-1][-1]
+                axis_index.supplying_zone(parent, 1.)
+                layout = axis_index.order
+                vid = g.add_child(parent, edge_type=edge_type, label="Segment", length=0., volume=0.,
+                                  struct_mass=rng.random(), C_hexose_root=rng.random(), AA=rng.random())
+                axis_index.add_element(vid)
+                assert axis_index.layout_up_to_date and axis_index.values_up_to_date
+                assert axis_index.order[:-1].tolist() == layout.tolist() and axis_index.order[-1] == vid
+            # Other elements are inserted within the layout, which is then rebuilt:
+            parent = rng.choice(vertices)
+            if axis_index.successor_of(parent) is None and parent != axis_index.axes[-1][-1]:
+                axis_index.add_element(g.add_child(parent, edge_type="<", label="Segment", length=rng.random(),
+                                                   volume=rng.random(), struct_mass=rng.random(),
+                                                   C_hexose_root=rng.random(), AA=rng.random()))
+                assert not axis_index.layout_up_to_date
+        for vid in g.vertices(scale=1):
+            supplying_volume = rng.random() * rng.choice([0.1, 1., 5., 50.])
+            positions, fractions = axis_index.supplying_zone(vid, supplying_volume)
+            expected = supplying_zone_from_pointers(g, vid, supplying_volume)
+            assert axis_index.order[positions].tolist() == [index for index, _ in expected]
+            np.testing.assert_allclose(fractions, [fraction for _, fraction in expected])
+            np.testing.assert_allclose(axis_index.hexose[positions],
+                                       [g.property("C_hexose_root")[index] * g.property("struct_mass")[index]
+                                        for index, _ in expected])
+
+
+def test_supply_zones_distribution_matches_element_loop():
+    for seed in range(20):
+        g = random_root_system(60, seed)
+        axis_index = AxisIndex(g)
+        rng = random.Random(seed)
+        # A small capacity makes the arrays be enlarged while recording the zones:
+        supply_zones = SupplyZones(capacity=4)
+        zones = {}
+        apices = rng.sample(g.vertices(scale=1), 20)
+        for vid in apices + apices[:5]:
+            # The zone of an apex may be recorded again, and then replaces the previous one:
+            positions, fractions = axis_index.supplying_zone(vid, rng.random() * rng.choice([0.1, 1., 5.]))
+            hexose = axis_index.hexose[positions] * fractions
+            amino_acids = axis_index.amino_acids[positions] * fractions
+            mass = axis_index.struct_mass[positions] * fractions
+            supply_zones.add(vid, axis_index.order[positions], hexose, amino_acids, mass)
+            # Lists formerly stored on each apex in the MTG:
+            zones[vid] = (axis_index.order[positions].tolist(), hexose.tolist(), amino_acids.tolist())
+        shares = {vid: (rng.random(), rng.random()) for vid in rng.sample(apices, 15) + [max(g.vertices(scale=1)) + 1]}
+
+        # Reference loop, covering each supplying element of each apex:
+        expected_hexose, expected_amino_acids = {}, {}
+        for vid, (hexose_share, amino_acids_share) in shares.items():
+            if vid not in zones:
+                continue
+            for index, hexose, amino_acids in zip(*zones[vid]):
+                expected_hexose[index] = expected_hexose.get(index, 0.) + hexose_share * hexose
+                expected_amino_acids[index] = expected_amino_acids.get(index, 0.) + amino_acids_share * amino_acids
+
+        supplying_elements, hexose, amino_acids = supply_zones.distribute(shares)
+        assert supplying_elements.tolist() == sorted(expected_hexose)
+        np.testing.assert_allclose(hexose, [expected_hexose[index] for index in supplying_elements.tolist()], rtol=1e-12)
+        np.testing.assert_allclose(amino_acids, [expected_amino_acids[index] for index in supplying_elements.tolist()],
+                                   rtol=1e-12)
+        supply_zones.reset()
+        assert [len(values) for values in supply_zones.distribute(shares)] == [0, 0, 0]
@@ -0,0 +1,51 @@
+import numpy as np
+
+from root_bridges.soil_grid import MultiResolutionGrid
+
+
+def test_grid_adaptation_conserves_mass():
+    rng = np.random.default_rng(3)
+    shape = (8, 6, 6)
+    volume = rng.uniform(0.5, 1.5, shape) * 1e-6
+    grid = MultiResolutionGrid(shape, block_size=2)
+    concentrations = [rng.uniform(0., 1., shape), rng.uniform(0., 1e-3, shape)]
+    totals = [np.sum(concentration * volume) for concentration in concentrations]
+    for _ in range(5):
+        rooted_voxels = rng.choice(np.prod(shape), size=10, replace=False)
+        grid.adapt(rooted_voxels, concentrations, volume)
+        assert np.all(grid.refined[grid.block_of[rooted_voxels]])
+        assert grid.number_of_nodes == len(np.unique(grid.node_of))
+        for concentration, total in zip(concentrations, totals):
+            np.testing.assert_allclose(np.sum(concentration * volume), total, rtol=1e-12)
+            # The voxels of a coarse block share the same concentration:
+            coarse = ~grid.refined[grid.block_of]
+            node_values = np.bincount(grid.node_of[coarse], weights=concentration.flat[np.flatnonzero(coarse)],
+                                      minlength=grid.number_of_nodes)
+            counts = np.bincount(grid.node_of[coarse], minlength=grid.number_of_nodes)
+            np.testing.assert_allclose(concentration.flat[np.flatnonzero(coarse)],
+                                       (node_values / np.maximum(counts, 1))[grid.node_of[coarse]], rtol=1e-12)
+    # The partition doesn't change when the same voxels contain roots:
+    assert not grid.adapt(rooted_voxels, concentrations, volume)
+
+
+def test_grid_adaptation_with_coarsening_delay():
+    shape = (4, 4, 4)
+    volume = np.full(shape, 1e-6)
+    concentrations = [np.random.default_rng(4).uniform(0., 1., shape)]
+    grid = MultiResolutionGrid(shape, block_size=2, coarsening_delay=3)
+    first_block_voxel, last_block_voxel = 0, int(np.prod(shape)) - 1
+    # The blocks without roots at the first adaptation are coarsened at once:
+    assert grid.adapt([first_block_voxel], concentrations, volume)
+    assert grid.refined.tolist() == [True] + [False] * 7
+    # Once the roots have left a block, it is kept refined during the coarsening delay:
+    assert grid.adapt([last_block_voxel], concentrations, volume)
+    for _ in range(2):
+        assert not grid.adapt([last_block_voxel], concentrations, volume)
+        assert grid.refined[0] and grid.refined[-1]
+    assert grid.adapt([last_block_voxel], concentrations, volume)
+    assert grid.refined.tolist() == [False] * 7 + [True]
+    # A block that contains roots again before the end of the delay is not coarsened:
+    grid.adapt([first_block_voxel], concentrations, volume)
+    for _ in range(3):
+        grid.adapt([first_block_voxel, last_block_voxel], concentrations, volume)
+    assert grid.refined[0] and grid.refined[-1]
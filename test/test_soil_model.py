@@ -0,0 +1,55 @@
+import numpy as np
+
+from root_bridges.soil_model import SoilModel
+
+
+def soil_model(in_place_soil_updates, inter_voxel_diffusion=False):
+    """
+    Provides a soil model with only the attributes used by the balances of soil concentrations, on a regular grid.
+    """
+    model = SoilModel.__new__(SoilModel)
+    model.time_step_in_seconds = 3600.
+    model.in_place_soil_updates = in_place_soil_updates
+    model.active_voxels_only = False
+    model.inter_voxel_diffusion = inter_voxel_diffusion
+    model.mineralN_soil_diffusion_coefficient = 1e-10
+    model.amino_acids_soil_diffusion_coefficient = 5e-11
+    model.soil_buffers = {}
+    model.implicit_diffusion = None
+    model.soil_grid = None
+    voxel_size = 0.01
+    z, x, y = np.meshgrid(*(np.arange(length) * voxel_size for length in (5, 4, 3)), indexing="ij")
+    model.voxels = dict(x1=x, x2=x + voxel_size, y1=y, y2=y + voxel_size, z1=z, z2=z + voxel_size)
+    return model
+
+
+def run_soil_balances(model, steps=5):
+    rng = np.random.default_rng(0)
+    shape = np.shape(model.voxels["x1"])
+    volume_soil = np.full(shape, 1e-6)
+    C_mineralN_soil = rng.uniform(0., 1., shape)
+    C_amino_acids_soil = rng.uniform(0., 1e-2, shape)
+    history = []
+    for _ in range(steps):
+        # Some uptakes are large enough to empty the voxels, so that negative concentrations are set to 0:
+        C_mineralN_soil = model._C_mineralN_soil(C_mineralN_soil, volume_soil,
+                                                 mineralN_diffusion_from_roots=rng.uniform(0., 1e-10, shape),
+                                                 mineralN_diffusion_from_xylem=rng.uniform(0., 1e-11, shape),
+                                                 mineralN_uptake=rng.uniform(0., 5e-10, shape))
+        C_amino_acids_soil = model._C_amino_acids_soil(C_amino_acids_soil, volume_soil,
+                                                       amino_acids_diffusion_from_roots=rng.uniform(0., 1e-12, shape),
+                                                       amino_acids_diffusion_from_xylem=rng.uniform(0., 1e-13, shape),
+                                                       amino_acids_uptake=rng.uniform(0., 5e-12, shape))
+        history.append((C_mineralN_soil.copy(), C_amino_acids_soil.copy()))
+    return history
+
+
+def test_in_place_soil_updates_are_identical_to_copying_updates():
+    for inter_voxel_diffusion in (False, True):
+        copied = run_soil_balances(soil_model(False, inter_voxel_diffusion))
+        in_place = run_soil_balances(soil_model(True, inter_voxel_diffusion))
+        for (mineralN, amino_acids), (mineralN_in_place, amino_acids_in_place) in zip(copied, in_place):
+            if not inter_voxel_diffusion:
+                assert np.any(mineralN == 0.)
+            assert np.array_equal(mineralN, mineralN_in_place)
+            assert np.array_equal(amino_acids, amino_acids_in_place)
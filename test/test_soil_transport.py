@@ -0,0 +1,51 @@
+import numpy as np
+
+from root_bridges.soil_grid import MultiResolutionGrid
+from root_bridges.soil_transport import ImplicitDiffusion
+
+
+def soil_grid(shape=(6, 5, 4), voxel_size=0.01):
+    """
+    Builds the coordinates and volumes of the voxels of a regular soil grid.
+    """
+    z, x, y = np.meshgrid(*(np.arange(length) * voxel_size for length in shape), indexing="ij")
+    coordinates = dict(x1=x, x2=x + voxel_size, y1=y, y2=y + voxel_size, z1=z, z2=z + voxel_size)
+    volume = np.full(shape, voxel_size ** 3)
+    return coordinates, volume
+
+
+def test_implicit_diffusion_conserves_mass():
+    coordinates, volume = soil_grid()
+    diffusion = ImplicitDiffusion(*(coordinates[name] for name in ("x1", "x2", "y1", "y2", "z1", "z2")))
+    concentration = np.random.default_rng(0).uniform(0., 1., volume.shape)
+    diffused = concentration
+    for _ in range(10):
+        diffused = diffusion.solve(diffused, volume, 1e-9, 3600.)
+    assert diffused.shape == concentration.shape
+    assert np.all(diffused >= 0.)
+    np.testing.assert_allclose(np.sum(diffused * volume), np.sum(concentration * volume), rtol=1e-12)
+    # Diffusion smooths the gradients:
+    assert np.ptp(diffused) < np.ptp(concentration)
+
+
+def test_implicit_diffusion_on_a_partition_conserves_mass():
+    coordinates, volume = soil_grid()
+    diffusion = ImplicitDiffusion(*(coordinates[name] for name in ("x1", "x2", "y1", "y2", "z1", "z2")))
+    grid = MultiResolutionGrid(volume.shape, block_size=2)
+    grid.refined[1:] = False
+    grid.update_nodes()
+    diffusion.set_nodes(grid.node_of, grid.number_of_nodes)
+    concentration = np.random.default_rng(1).uniform(0., 1., volume.shape)
+    grid.coarsen([concentration], volume, ~grid.refined)
+    total = np.sum(concentration * volume)
+    diffused = diffusion.solve(concentration, volume, 1e-9, 3600.)
+    np.testing.assert_allclose(np.sum(diffused * volume), total, rtol=1e-12)
+
+
+def test_identity_partition_gives_voxel_diffusion():
+    coordinates, volume = soil_grid()
+    diffusion = ImplicitDiffusion(*(coordinates[name] for name in ("x1", "x2", "y1", "y2", "z1", "z2")))
+    concentration = np.random.default_rng(2).uniform(0., 1., volume.shape)
+    expected = diffusion.solve(concentration, volume, 1e-9, 3600.)
+    diffusion.set_nodes(np.arange(concentration.size), concentration.size)
+    np.testing.assert_allclose(diffusion.solve(concentration, volume, 1e-9, 3600.), expected, rtol=1e-10)